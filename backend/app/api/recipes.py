@@ -1,18 +1,120 @@
-from fastapi import APIRouter, Depends, HTTPException
+import os
+import zlib
+import logging
+import asyncio
+import json
+import orjson
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Path, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse, ORJSONResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List, Dict
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Optional
 from pydantic import BaseModel
-from ..crud.recipe import get_recipe, get_recipes, create_recipe, update_recipe, delete_recipe
-from ..schemas.recipe import Recipe, RecipeCreate, Recipe as RecipeSchema
-from ..database import get_db
-from ..services.openai_service import OpenAIService
+from ..crud.recipe import get_recipe, get_recipes, get_recipe_version, get_recipes_versions, create_recipe, create_recipes, update_recipe, delete_recipe, set_recipe_image
+from ..crud.search import search_recipes
+from ..crud.job import create_job, get_job, IdempotencyKeyConflict
+from ..crud.transfer import iter_export_chunks, gzip_chunks, LineBuffer, RecipeImporter, IMPORT_BATCH_SIZE
+from ..schemas.recipe import Recipe, RecipeCreate, RecipeSearchResult, RecipeNutrition, Recipe as RecipeSchema
+from ..database import SessionLocal, get_db, get_async_db
+from ..models.recipe import Recipe as RecipeModel
+from ..models.job import QUEUED, RUNNING, FAILED
+from ..services.openai_service import get_async_openai_service
+from ..services.stream_parser import IncrementalRecipeParser
+from ..services.variation_cache import variation_cache
+from ..services.generation_cache import get_generation_cache, make_generation_key
+from ..services.pantry_index import pantry_index
+from ..services.minhash_index import near_duplicate_index
+from ..services.nutrition import compute_nutrition, scale_recipe
+from ..services.rate_limiter import rate_limit_scheduler, BATCH
+from ..services.job_queue import job_workers
+from ..services.metrics import stage, LLM_CALLS_AVOIDED
+from ..services.image_store import (
+    image_store, add_image, read_thumbnail, image_url, thumbnail_urls,
+    THUMBNAIL_SIZES, THUMBNAIL_FORMATS, IMAGE_MAX_UPLOAD_BYTES, IMAGE_CACHE_CONTROL
+)
+from ..services.http_cache import (
+    rendered_cache, make_etag, cache_headers, is_not_modified, not_modified_response, compress_body
+)
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
-openai_service = OpenAIService()
+
+# 一括生成で同時に実行する生成数の上限と、1回のリクエストで受け付ける件数の上限
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
 
 class RecipeGenerationRequest(BaseModel):
     ingredients: List[str]
     servings: int
+    # Falseの場合はバリエーションを生成せず、GET /recipes/{id}/variations で後から取得する
+    include_variations: bool = True
+    # Trueの場合は生成キャッシュを参照せずに必ずOpenAIを呼び出す
+    bypass_cache: bool = False
+    # Trueの場合、手持ちの食材がほぼ同じ（NEAR_DUPLICATE_THRESHOLD以上）保存済みレシピがあれば生成せずにそれを返す
+    reuse_similar: bool = False
+    # Trueの場合はジョブとして登録して202を返す（結果は GET /jobs/{id} で取得する）
+    background: bool = False
+
+class BatchGenerationRequest(BaseModel):
+    requests: List[RecipeGenerationRequest]
+    # 同時に実行する生成数（BATCH_CONCURRENCYを上限とする）
+    concurrency: Optional[int] = None
+
+def _to_recipe_create(recipe: Dict) -> RecipeCreate:
+    """生成されたレシピ辞書を保存用のスキーマに変換"""
+    return RecipeCreate(
+        title=recipe["title"],
+        description=recipe["description"],
+        instructions=recipe["instructions"],
+        difficulty=recipe["difficulty"],
+        cooking_time=recipe["cooking_time"],
+        servings=recipe["servings"],
+        ingredients=[
+            {
+                "name": ing["name"],
+                "unit": ing["unit"],
+                "amount": ing["amount"],
+                "calories": ing["calories"],  # カロリー情報は後で更新可能
+                "protein": ing["protein"],
+                "fat": ing["fat"],
+                "carbs": ing["carbs"],
+                "season": ing["season"],
+                "category": ing["category"],
+                "is_vegetarian": ing["is_vegetarian"],  # デフォルト値
+                "is_vegan": True  # デフォルト値
+            }
+            for ing in recipe["ingredients"]
+        ]
+    )
+
+def _find_similar_recipe(db: Session, ingredients: List[str], servings: int) -> Optional[Dict]:
+    """手持ちの食材がほぼ同じ保存済みレシピを探し、人数を合わせて返す（reused に元のIDと類似度を入れる）"""
+    match = near_duplicate_index.find(ingredients)
+    if match is None:
+        return None
+    recipe_id, similarity = match
+    db_recipe = get_recipe(db, recipe_id=recipe_id)
+    if db_recipe is None:
+        return None
+    if db_recipe["servings"] != servings:
+        db_recipe = scale_recipe(db_recipe, servings)
+    LLM_CALLS_AVOIDED.inc("near_duplicate")
+    return {"recipe": db_recipe, "reused": {"recipe_id": recipe_id, "similarity": similarity}}
+
+def _format_sse(event: str, data) -> str:
+    """Server-Sent Events形式の1イベントを作成"""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+class PantryQuery(BaseModel):
+    ingredients: List[str]
+    # coverage: レシピの食材のうち手持ちでまかなえる割合 / jaccard: Jaccard係数
+    metric: str = "coverage"
+    # 不足してもよい食材の数（Noneの場合は制限なし）
+    max_missing: Optional[int] = None
+    limit: int = 20
 
 @router.post("/recipes/", response_model=Recipe)
 def create_recipe_endpoint(recipe: RecipeCreate, db: Session = Depends(get_db)):
@@ -49,22 +151,172 @@ def create_recipe_endpoint(recipe: RecipeCreate, db: Session = Depends(get_db)):
     return create_recipe(db=db, recipe=recipe)
 
 @router.get("/recipes/", response_model=List[Recipe])
-def read_recipes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    recipes = get_recipes(db, skip=skip, limit=limit)
-    return recipes
+def read_recipes(request: Request, skip: int = 0, limit: int = 100, after_id: Optional[int] = None,
+                 db: Session = Depends(get_db)):
+    """レシピ一覧を取得
+
+    次のページは X-Next-Cursor ヘッダーの値を after_id に指定して取得する。
+    ETagはページ内のレシピのIDと最終更新日時から作り、If-None-Matchが一致すれば304を返す。
+    """
+    versions = get_recipes_versions(db, skip=skip, limit=limit, after_id=after_id)
+    # ページ内の削除は最終更新日時に表れないため、一覧にはLast-Modifiedを付けずETagだけで判定する
+    etag = make_etag("list", *(f"{version.id}:{version.last_modified}" for version in versions))
+    headers = cache_headers(etag, None)
+    if versions and len(versions) == limit:
+        headers["X-Next-Cursor"] = str(versions[-1].id)
+    if is_not_modified(request, etag, None):
+        return not_modified_response(headers)
+
+    recipes = get_recipes(db, skip=skip, limit=limit, after_id=after_id)
+    # 辞書はcrud側で組み立て済みなので、response_modelによる再検証を通さずに直接シリアライズする
+    with stage("serialize"):
+        body, encoding = compress_body(request, orjson.dumps(recipes))
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+@router.get("/recipes/export")
+def export_recipes_endpoint(gzip: bool = False, db: Session = Depends(get_db)):
+    """全レシピをNDJSON（1行1レシピ）でストリーミング出力
+
+    件数に関わらずメモリ使用量は一定。gzip=true の場合はgzip圧縮したファイルとして返す。
+    """
+    chunks = iter_export_chunks(db)
+    if gzip:
+        return StreamingResponse(
+            gzip_chunks(chunks),
+            media_type="application/gzip",
+            headers={"Content-Disposition": 'attachment; filename="recipes.ndjson.gz"'}
+        )
+    return StreamingResponse(
+        chunks,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="recipes.ndjson"'}
+    )
+
+@router.post("/recipes/import", response_model=Dict)
+async def import_recipes_endpoint(request: Request, db: Session = Depends(get_db)):
+    """NDJSON（GET /recipes/export の出力形式）のレシピを一括登録
+
+    本文は受信しながら行に分割し、IMPORT_BATCH_SIZE行ごとにまとめて登録（コミット）する。
+    gzip圧縮した本文は Content-Encoding: gzip または Content-Type: application/gzip を指定して送る。
+    タイトル・説明・手順が同じレシピは重複として登録しない。
+    途中で失敗した場合もエラーの detail に件数と登録済みの行（committed_line）を返す。
+    登録済みの分は重複として飛ばすため、同じ本文をそのまま送り直せる。
+    """
+    compressed = (
+        request.headers.get("content-encoding") == "gzip"
+        or request.headers.get("content-type") == "application/gzip"
+    )
+    buffer = LineBuffer(compressed=compressed)
+    importer = RecipeImporter(db)
+    lines = []
+    try:
+        async for chunk in request.stream():
+            lines.extend(buffer.feed(chunk))
+            if len(lines) >= IMPORT_BATCH_SIZE:
+                await run_in_threadpool(importer.import_lines, lines)
+                lines = []
+        lines.extend(buffer.close())
+        await run_in_threadpool(importer.import_lines, lines)
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=dict(importer.stats(), message=f"gzipの展開に失敗しました: {e}"))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=dict(importer.stats(), message=str(e)))
+    return importer.stats()
+
+@router.get("/recipes/search", response_model=List[RecipeSearchResult])
+def search_recipes_endpoint(q: str, limit: int = 20, db: Session = Depends(get_db)):
+    """タイトル・説明・手順・食材名からレシピを全文検索"""
+    return search_recipes(db, q, limit=limit)
+
+@router.post("/recipes/what-can-i-cook", response_model=List[Dict])
+def what_can_i_cook(query: PantryQuery, db: Session = Depends(get_db)):
+    """手持ちの食材で作れる保存済みレシピをスコア順に取得（LLMは呼ばない）"""
+    if query.metric not in ("coverage", "jaccard"):
+        raise HTTPException(status_code=400, detail="metricはcoverageまたはjaccardを指定してください")
+    results = pantry_index.search(
+        query.ingredients,
+        metric=query.metric,
+        max_missing=query.max_missing,
+        limit=query.limit
+    )
+    titles = dict(db.execute(
+        select(RecipeModel.id, RecipeModel.title).where(RecipeModel.id.in_([r["id"] for r in results]))
+    ).all())
+    for result in results:
+        result["title"] = titles.get(result["id"])
+    return results
+
+@router.get("/recipes/nutrition", response_model=List[RecipeNutrition])
+def read_recipes_nutrition(
+    ids: Optional[List[int]] = Query(None),
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """複数レシピの栄養価をまとめて計算（idsを省略した場合は一覧と同じページ単位）"""
+    if ids is None:
+        stmt = select(RecipeModel.id).order_by(RecipeModel.id).limit(limit)
+        if after_id is not None:
+            stmt = stmt.where(RecipeModel.id > after_id)
+        elif skip:
+            stmt = stmt.offset(skip)
+        ids = db.execute(stmt).scalars().all()
+    nutrition = compute_nutrition(db, ids)
+    return [dict(nutrition[recipe_id], recipe_id=recipe_id) for recipe_id in ids if recipe_id in nutrition]
 
 @router.get("/recipes/{recipe_id}", response_model=Recipe)
-def read_recipe(recipe_id: int, db: Session = Depends(get_db)):
+def read_recipe(recipe_id: int, request: Request, db: Session = Depends(get_db)):
+    """レシピを取得
+
+    最終更新日時からETag・Last-Modifiedを作り、条件付きリクエストには食材を読み込まずに304を返す。
+    シリアライズ済みの本文はETagごとにキャッシュする。
+    """
+    version = get_recipe_version(db, recipe_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    etag = make_etag(recipe_id, version.last_modified)
+    headers = cache_headers(etag, version.last_modified)
+    if is_not_modified(request, etag, version.last_modified):
+        return not_modified_response(headers)
+
+    body = rendered_cache.get(recipe_id, etag)
+    if body is None:
+        db_recipe = get_recipe(db, recipe_id=recipe_id)
+        if db_recipe is None:
+            raise HTTPException(status_code=404, detail="Recipe not found")
+        with stage("serialize"):
+            body = orjson.dumps(db_recipe)
+        rendered_cache.set(recipe_id, etag, body)
+    return Response(body, media_type="application/json", headers=headers)
+
+@router.get("/recipes/{recipe_id}/nutrition", response_model=RecipeNutrition)
+def read_recipe_nutrition(recipe_id: int, db: Session = Depends(get_db)):
+    """レシピの栄養価の合計と1人分の値を取得"""
+    nutrition = compute_nutrition(db, [recipe_id])
+    if recipe_id not in nutrition:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return dict(nutrition[recipe_id], recipe_id=recipe_id)
+
+@router.get("/recipes/{recipe_id}/scaled", response_model=Recipe)
+def read_scaled_recipe(recipe_id: int, servings: int, db: Session = Depends(get_db)):
+    """レシピを指定した人数分に換算して取得"""
+    if servings < 1:
+        raise HTTPException(status_code=400, detail="servingsは1以上を指定してください")
     db_recipe = get_recipe(db, recipe_id=recipe_id)
     if db_recipe is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
-    return db_recipe
+    return ORJSONResponse(scale_recipe(db_recipe, servings))
 
 @router.put("/recipes/{recipe_id}", response_model=Recipe)
 def update_recipe_endpoint(recipe_id: int, recipe: RecipeCreate, db: Session = Depends(get_db)):
     db_recipe = update_recipe(db, recipe_id=recipe_id, recipe=recipe)
     if db_recipe is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
+    variation_cache.invalidate(recipe_id)
+    rendered_cache.invalidate(recipe_id)
     return db_recipe
 
 @router.delete("/recipes/{recipe_id}", response_model=RecipeSchema)
@@ -72,56 +324,394 @@ def delete_recipe_endpoint(recipe_id: int, db: Session = Depends(get_db)):
     db_recipe = delete_recipe(db, recipe_id=recipe_id)
     if db_recipe is None:
         raise HTTPException(status_code=404, detail="Recipe not found")
-    return RecipeSchema.from_orm(db_recipe)
+    variation_cache.invalidate(recipe_id)
+    rendered_cache.invalidate(recipe_id)
+    return db_recipe
 
-@router.post("/recipes/generate/ai", response_model=Dict)
-def generate_recipe_with_ai(request: RecipeGenerationRequest, db: Session = Depends(get_db)):
-    """AIを使用してレシピを生成"""
+@router.post("/recipes/{recipe_id}/image", response_model=Dict)
+async def upload_recipe_image(recipe_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """レシピの画像をアップロード
+
+    デコードと縮小はプロセスプールで行い、サイズ（sm/md/lg）・形式（webp/jpeg）ごとのサムネイルを作る。
+    image_url は GET /images/{hash} のURLになり、thumbnails に各サムネイルのURLが入る。
+    """
+    if await run_in_threadpool(get_recipe_version, db, recipe_id) is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    data = await file.read(IMAGE_MAX_UPLOAD_BYTES + 1)
+    if len(data) > IMAGE_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"画像は{IMAGE_MAX_UPLOAD_BYTES // (1024 * 1024)}MBまでです")
     try:
-        # OpenAIを使用してレシピを生成
-        recipe = openai_service.generate_recipe(request.ingredients, request.servings)
-    
-        if not recipe:
-            raise HTTPException(status_code=500, detail="レシピの生成に失敗しました")
-        
-        # 生成されたレシピをデータベースに保存
-        recipe_create = RecipeCreate(
-            title=recipe["title"],
-            description=recipe["description"],
-            instructions=recipe["instructions"],
-            difficulty=recipe["difficulty"],
-            cooking_time=recipe["cooking_time"],
-            servings=recipe["servings"],
-            ingredients=[
-                {
-                    "name": ing["name"],
-                    "unit": ing["unit"],
-                    "amount": ing["amount"],
-                    "calories": ing["calories"],  # カロリー情報は後で更新可能
-                    "protein": ing["protein"],
-                    "fat": ing["fat"],
-                    "carbs": ing["carbs"],
-                    "season": ing["season"],
-                    "category": ing["category"],
-                    "is_vegetarian": ing["is_vegetarian"],  # デフォルト値
-                    "is_vegan": True  # デフォルト値
-                }
-                for ing in recipe["ingredients"]
-            ]
+        key = await add_image(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    db_recipe = await run_in_threadpool(set_recipe_image, db, recipe_id, image_url(key))
+    if db_recipe is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    rendered_cache.invalidate(recipe_id)
+    return {"recipe_id": recipe_id, "image_url": db_recipe["image_url"], "thumbnails": thumbnail_urls(key)}
+
+@router.get("/images/stats", response_model=Dict)
+def read_image_stats():
+    """サムネイルのキャッシュの使用量・ヒット数・削除数を取得"""
+    return image_store.stats()
+
+@router.get("/images/{image_hash}")
+async def read_image(
+    request: Request,
+    image_hash: str = Path(..., regex="^[0-9a-f]{32}$"),
+    size: str = Query("lg", regex="^(" + "|".join(THUMBNAIL_SIZES) + ")$"),
+    format: Optional[str] = Query(None, regex="^(" + "|".join(THUMBNAIL_FORMATS) + ")$"),
+):
+    """画像のサムネイルを取得
+
+    formatを省略した場合はAcceptヘッダーがWebPに対応していればWebP、そうでなければJPEGを返す。
+    URLは内容のハッシュで決まるため、長期間キャッシュさせる。
+    """
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL}
+    if format is None:
+        format = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+        headers["Vary"] = "Accept"
+    etag = f'"{image_hash}-{size}.{format}"'
+    headers["ETag"] = etag
+    if is_not_modified(request, etag, None):
+        return not_modified_response(headers)
+
+    try:
+        body = await read_thumbnail(image_hash, size, format)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if body is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return Response(body, media_type=THUMBNAIL_FORMATS[format][1], headers=headers)
+
+async def _get_variations(recipe_id: int, recipe: Dict) -> Optional[List[Dict]]:
+    """保存済みレシピのバリエーションをキャッシュから取得し、なければ生成する（失敗した場合はNone）"""
+    variations = variation_cache.get(recipe_id)
+    if variations is not None:
+        return variations
+    try:
+        variations = await get_async_openai_service().get_recipe_variations(recipe)
+    except Exception:
+        logger.warning("バリエーションの生成に失敗しました（レシピID %s）", recipe_id, exc_info=True)
+        return None
+    variation_cache.set(recipe_id, variations)
+    return variations
+
+async def _generate(db: Session, request: RecipeGenerationRequest, job_id: Optional[str] = None) -> Dict:
+    """レシピを生成して保存し、レスポンス本文（recipe / variations / reused）を返す
+
+    バリエーションの生成に失敗した場合は保存したレシピを variations=None で返す。
+    job_id を指定した場合はレシピの保存と同じトランザクションでジョブにレシピIDを記録する。
+    """
+    if request.reuse_similar and not request.bypass_cache:
+        similar = await run_in_threadpool(_find_similar_recipe, db, request.ingredients, request.servings)
+        if similar is not None:
+            variations = None
+            if request.include_variations:
+                variations = await _get_variations(similar["reused"]["recipe_id"], similar["recipe"])
+            return dict(similar, variations=variations)
+
+    # OpenAIを使用してレシピを生成（待機中はイベントループを解放）
+    recipe = await get_async_openai_service().generate_recipe(
+        request.ingredients,
+        request.servings,
+        use_cache=not request.bypass_cache
+    )
+
+    if not recipe:
+        raise ValueError("レシピの生成に失敗しました")
+
+    # 生成されたレシピをデータベースに保存
+    recipe_create = _to_recipe_create(recipe)
+
+    # DBアクセスはブロッキングなのでスレッドプールで実行
+    save_task = run_in_threadpool(
+        create_recipe, db=db, recipe=recipe_create, source_ingredients=request.ingredients, job_id=job_id
+    )
+
+    if request.include_variations:
+        # 保存とバリエーション生成を並行して実行
+        created_recipe, variations = await asyncio.gather(
+            save_task,
+            get_async_openai_service().get_recipe_variations(recipe),
+            return_exceptions=True
         )
-        
-        created_recipe = create_recipe(db=db, recipe=recipe_create)
-        
-        # 生成されたレシピとバリエーションを返す
-        variations = openai_service.get_recipe_variations(recipe)
-        
-        # レスポンスからtipsフィールドを削除
-        response = {
-            "recipe": created_recipe,
-            "variations": variations
-        }
-        
-        return response
-        
+        if isinstance(created_recipe, BaseException):
+            raise created_recipe
+        if isinstance(variations, BaseException):
+            # レシピは保存済みのため失敗にはせず、バリエーションは GET /recipes/{id}/variations で後から生成する
+            logger.warning(
+                "バリエーションの生成に失敗しました（レシピID %s）", created_recipe["id"], exc_info=variations
+            )
+            variations = None
+        else:
+            variation_cache.set(created_recipe["id"], variations)
+    else:
+        created_recipe = await save_task
+        variations = None
+
+    # レスポンスからtipsフィールドを削除
+    return {
+        "recipe": created_recipe,
+        "variations": variations,
+        "reused": None
+    }
+
+async def run_generation_job(job: Dict) -> Dict:
+    """ジョブとして登録された生成リクエストを実行する（job_workersから呼ばれる）
+
+    レシピの保存後に停止して再実行された場合は、生成し直さずに保存済みのレシピを返す。
+    """
+    request = RecipeGenerationRequest.parse_obj(job["request"])
+    db = SessionLocal()
+    try:
+        if job["recipe_id"] is not None:
+            saved = await run_in_threadpool(get_recipe, db, job["recipe_id"])
+            if saved is not None:
+                variations = None
+                if request.include_variations:
+                    variations = await _get_variations(saved["id"], saved)
+                return {"recipe": saved, "variations": variations, "reused": None}
+        return await _generate(db, request, job_id=job["id"])
+    finally:
+        db.close()
+
+def _job_response(job: Dict) -> Dict:
+    return dict(job, status_url=f"/api/v1/jobs/{job['id']}")
+
+@router.post("/recipes/generate/ai", response_model=Dict)
+async def generate_recipe_with_ai(
+    request: RecipeGenerationRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """AIを使用してレシピを生成
+
+    reuse_similar=true の場合、手持ちの食材がほぼ同じ保存済みレシピがあれば生成せずにそれを返す
+    （reused に元のレシピIDと食材のJaccard係数が入る）。
+
+    background=true（または Prefer: respond-async ヘッダー）の場合はジョブとして登録して
+    202とジョブを返し、結果は GET /jobs/{id} で取得する。
+    Idempotency-Key ヘッダーを指定した場合もジョブとして実行し、同じキーの再送には
+    新たに生成せず同じジョブ（の結果）を返す。
+    """
+    background = request.background or "respond-async" in http_request.headers.get("prefer", "")
+    if background or idempotency_key is not None:
+        try:
+            job, created = await run_in_threadpool(
+                create_job, db, request.dict(exclude={"background"}), idempotency_key
+            )
+        except IdempotencyKeyConflict as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if created:
+            job_workers.notify()
+        else:
+            LLM_CALLS_AVOIDED.inc("idempotency")
+
+        if background:
+            pending = job["status"] in (QUEUED, RUNNING)
+            return ORJSONResponse(
+                _job_response(job),
+                status_code=202 if pending else 200,
+                headers={"Location": f"/api/v1/jobs/{job['id']}"}
+            )
+        job = await job_workers.wait(job["id"])
+        if job["status"] == FAILED:
+            raise HTTPException(status_code=500, detail=job["error"])
+        with stage("serialize"):
+            return ORJSONResponse(job["result"])
+
+    try:
+        response = await _generate(db, request)
+        with stage("serialize"):
+            return ORJSONResponse(response)
+
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/stats", response_model=Dict)
+async def read_job_stats():
+    """生成ジョブの状態ごとの件数と、このプロセスのワーカーの状況を取得"""
+    return await job_workers.stats()
+
+@router.get("/jobs/{job_id}", response_model=Dict)
+def read_job(job_id: str, db: Session = Depends(get_db)):
+    """生成ジョブの状態（queued / running / succeeded / failed）と結果を取得"""
+    job = get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return ORJSONResponse(_job_response(job))
+
+@router.post("/recipes/generate/ai/stream")
+async def generate_recipe_with_ai_stream(request: RecipeGenerationRequest, db: Session = Depends(get_db)):
+    """AIによるレシピ生成をServer-Sent Eventsで逐次返す
+
+    title → 各フィールド → ingredient（食材ごと） → instruction（手順ごと）の順に
+    確定したものから送信し、保存後に保存済みIDを含む done イベントを送る。
+    reuse_similar=true で保存済みレシピを使う場合は、生成せずに done イベントだけを送る。
+    """
+    async def event_stream():
+        parser = IncrementalRecipeParser()
+        try:
+            if request.reuse_similar and not request.bypass_cache:
+                similar = await run_in_threadpool(_find_similar_recipe, db, request.ingredients, request.servings)
+                if similar is not None:
+                    yield _format_sse("done", dict(similar, id=similar["reused"]["recipe_id"]))
+                    return
+
+            openai_service = get_async_openai_service()
+            chunks = openai_service.stream_recipe(
+                request.ingredients,
+                request.servings,
+                use_cache=not request.bypass_cache
+            )
+            async for text in chunks:
+                for event, data in parser.feed(text):
+                    if event == "field" and data["name"] == "title":
+                        yield _format_sse("title", {"title": data["value"]})
+                    else:
+                        yield _format_sse(event, data)
+
+            recipe = await openai_service.parse_recipe_output(parser.buf, len(request.ingredients))
+            await openai_service.cache_recipe(request.ingredients, request.servings, recipe)
+
+            # ストリーム完了後にレシピを保存
+            created_recipe = await run_in_threadpool(
+                create_recipe, db=db, recipe=_to_recipe_create(recipe), source_ingredients=request.ingredients
+            )
+            yield _format_sse("done", {"id": created_recipe["id"], "recipe": created_recipe, "reused": None})
+        except Exception as e:
+            yield _format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/recipes/generate/batch")
+async def generate_recipes_batch(request: BatchGenerationRequest, db: Session = Depends(get_db)):
+    """複数のレシピ（献立など）をまとめて生成し、Server-Sent Eventsで逐次返す
+
+    同じ食材・人数の指定は1回の生成にまとめ、完了したものから item イベント
+    （indexes: 対応するリクエストの位置）を送る。全件の生成後に1トランザクションで
+    一括保存し、保存済みレシピを含む done イベントを送る。
+    バリエーションは生成しないため、必要な場合は GET /recipes/{id}/variations で取得する。
+    """
+    if not request.requests:
+        raise HTTPException(status_code=400, detail="requestsが空です")
+    if len(request.requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"一度に生成できるレシピは{BATCH_MAX_ITEMS}件までです")
+
+    try:
+        openai_service = get_async_openai_service()
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # 同じ内容のリクエストをまとめる
+    groups: Dict[str, List[int]] = {}
+    for index, item in enumerate(request.requests):
+        key = make_generation_key(item.ingredients, item.servings, openai_service.cache_scope) + str(item.bypass_cache)
+        groups.setdefault(key, []).append(index)
+    concurrency = min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def generate(indexes: List[int]):
+        item = request.requests[indexes[0]]
+        async with semaphore:
+            try:
+                recipe = await openai_service.generate_recipe(
+                    item.ingredients,
+                    item.servings,
+                    use_cache=not item.bypass_cache,
+                    priority=BATCH
+                )
+                return indexes, recipe, None
+            except Exception as e:
+                return indexes, None, e
+
+    async def event_stream():
+        tasks = [asyncio.ensure_future(generate(indexes)) for indexes in groups.values()]
+        generated = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                indexes, recipe, error = await next_done
+                if error is not None:
+                    yield _format_sse("error", {"indexes": indexes, "detail": str(error)})
+                    continue
+                generated.append((indexes, recipe))
+                yield _format_sse("item", {"indexes": indexes, "recipe": recipe})
+
+            # 生成できたレシピを1トランザクションで一括保存
+            created = await run_in_threadpool(
+                create_recipes,
+                db=db,
+                recipes=[_to_recipe_create(recipe) for _, recipe in generated],
+                source_ingredients=[request.requests[indexes[0]].ingredients for indexes, _ in generated]
+            )
+            yield _format_sse("done", {
+                "recipes": sorted(
+                    (
+                        {"index": index, "id": created_recipe["id"], "recipe": created_recipe}
+                        for (indexes, _), created_recipe in zip(generated, created)
+                        for index in indexes
+                    ),
+                    key=lambda r: r["index"]
+                ),
+                "failed": len(request.requests) - sum(len(indexes) for indexes, _ in generated)
+            })
+        except Exception as e:
+            yield _format_sse("error", {"detail": str(e)})
+        finally:
+            # クライアントが切断した場合は残りの生成を止める
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/generation-cache/stats", response_model=Dict)
+def read_generation_cache_stats():
+    """生成キャッシュのヒット・ミス数を取得"""
+    return get_generation_cache().stats()
+
+@router.get("/near-duplicate/stats", response_model=Dict)
+def read_near_duplicate_stats():
+    """食材がほぼ同じ保存済みレシピの検索回数・一致数（生成を省略した回数）を取得"""
+    return near_duplicate_index.stats()
+
+@router.get("/rendered-cache/stats", response_model=Dict)
+def read_rendered_cache_stats():
+    """シリアライズ済みレシピのキャッシュのヒット・ミス数を取得"""
+    return rendered_cache.stats()
+
+@router.get("/openai/scheduler/stats", response_model=Dict)
+def read_scheduler_stats():
+    """OpenAI APIの呼び出しキューの状況（待ち件数・待ち時間・再試行数）を取得"""
+    return rate_limit_scheduler.stats()
+
+@router.get("/recipes/{recipe_id}/variations", response_model=List[Dict])
+async def read_recipe_variations(recipe_id: int, db: AsyncSession = Depends(get_async_db)):
+    """レシピのバリエーションを取得（初回アクセス時に生成してキャッシュ）"""
+    variations = variation_cache.get(recipe_id)
+    if variations is not None:
+        return variations
+
+    db_recipe = await db.run_sync(get_recipe, recipe_id)
+    # 生成を待つ間に接続を占有しないよう先に返却する
+    await db.close()
+    if db_recipe is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+
+    try:
+        variations = await get_async_openai_service().get_recipe_variations(db_recipe)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    variation_cache.set(recipe_id, variations)
+    return variations
@@ -1 +1,3 @@
-from .recipe import get_recipe, get_recipes, create_recipe, update_recipe, delete_recipe 
\ No newline at end of file
+from .recipe import get_recipe, get_recipes, create_recipe, create_recipes, update_recipe, delete_recipe
+from .search import search_recipes, rebuild_search_index
+from .transfer import iter_export_chunks, RecipeImporter
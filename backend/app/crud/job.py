@@ -0,0 +1,205 @@
+import uuid
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+import orjson
+from sqlalchemy import inspect, select, text, update, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..models.job import GenerationJob, QUEUED, RUNNING, SUCCEEDED, FAILED
+
+# 状態の確認で返す列（リクエストのハッシュやリースは返さない）
+JOB_COLUMNS = (
+    GenerationJob.id,
+    GenerationJob.status,
+    GenerationJob.attempts,
+    GenerationJob.request,
+    GenerationJob.result,
+    GenerationJob.error,
+    GenerationJob.recipe_id,
+    GenerationJob.created_at,
+    GenerationJob.started_at,
+    GenerationJob.finished_at,
+)
+JOB_FIELDS = tuple(str(c.key) for c in JOB_COLUMNS)
+
+
+class IdempotencyKeyConflict(Exception):
+    """同じIdempotency-Keyで内容の異なるリクエストが送られた"""
+
+
+def ensure_job_table(db: Session):
+    GenerationJob.__table__.create(bind=db.get_bind(), checkfirst=True)
+    # lease_tokenを追加する前に作ったテーブルには列を足す
+    columns = {column["name"] for column in inspect(db.get_bind()).get_columns(GenerationJob.__tablename__)}
+    if "lease_token" not in columns:
+        db.execute(text(f"ALTER TABLE {GenerationJob.__tablename__} ADD COLUMN lease_token VARCHAR"))
+        db.commit()
+
+
+def _request_hash(request: Dict) -> str:
+    return hashlib.blake2b(orjson.dumps(request, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+def _to_dict(row) -> Dict:
+    job = dict(zip(JOB_FIELDS, row))
+    job["request"] = orjson.loads(job["request"])
+    if job["result"] is not None:
+        job["result"] = orjson.loads(job["result"])
+    return job
+
+
+def get_job(db: Session, job_id: str) -> Optional[Dict]:
+    row = db.execute(select(*JOB_COLUMNS).where(GenerationJob.id == job_id)).first()
+    return _to_dict(row) if row else None
+
+
+def _get_job_by_key(db: Session, idempotency_key: str) -> Optional[Tuple[Dict, str]]:
+    row = db.execute(
+        select(*JOB_COLUMNS, GenerationJob.request_hash).where(GenerationJob.idempotency_key == idempotency_key)
+    ).first()
+    return (_to_dict(row[:-1]), row[-1]) if row else None
+
+
+def create_job(db: Session, request: Dict, idempotency_key: Optional[str] = None) -> Tuple[Dict, bool]:
+    """ジョブを登録し、(ジョブ, 新しく登録したか) を返す
+
+    idempotency_keyが登録済みならそのジョブを返す（内容が異なる場合はIdempotencyKeyConflict）。
+    """
+    request_hash = _request_hash(request)
+    if idempotency_key is not None:
+        existing = _get_job_by_key(db, idempotency_key)
+        if existing is not None:
+            if existing[1] != request_hash:
+                raise IdempotencyKeyConflict("このIdempotency-Keyは別の内容のリクエストで使われています")
+            return existing[0], False
+
+    job_id = uuid.uuid4().hex
+    db.add(GenerationJob(
+        id=job_id,
+        idempotency_key=idempotency_key,
+        request_hash=request_hash,
+        request=orjson.dumps(request).decode(),
+        status=QUEUED,
+        attempts=0,
+        created_at=datetime.now(),
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # 同じキーのリクエストが同時に登録された
+        db.rollback()
+        return create_job(db, request, idempotency_key)
+    return get_job(db, job_id), True
+
+
+def _claimable(now: datetime):
+    # 未実行のジョブと、リースが切れた（実行していたプロセスが停止した）ジョブ
+    return or_(
+        GenerationJob.status == QUEUED,
+        and_(GenerationJob.status == RUNNING, GenerationJob.lease_until < now),
+    )
+
+
+def claim_job(db: Session, lease_seconds: float, max_attempts: int) -> Optional[Dict]:
+    """実行できるジョブを古い順に1件取り出してrunningにする（なければNone）
+
+    状態を条件にしたUPDATEで取り出すため、複数のプロセスで同じジョブを実行することはない。
+    試行回数がmax_attemptsに達したジョブは実行せずにfailedにする。
+    返すジョブにはリースの延長・結果の保存に使う lease_token を含める。
+    """
+    now = datetime.now()
+    candidates = db.execute(
+        select(GenerationJob.id, GenerationJob.attempts)
+        .where(_claimable(now))
+        .order_by(GenerationJob.created_at)
+        .limit(10)
+    ).all()
+    for job_id, attempts in candidates:
+        if attempts >= max_attempts:
+            db.execute(
+                update(GenerationJob)
+                .where(GenerationJob.id == job_id, _claimable(now))
+                .values(
+                    status=FAILED, error="試行回数の上限に達しました", lease_until=None, lease_token=None,
+                    finished_at=now
+                )
+            )
+            db.commit()
+            continue
+        lease_token = uuid.uuid4().hex
+        claimed = db.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id, _claimable(now))
+            .values(
+                status=RUNNING,
+                attempts=GenerationJob.attempts + 1,
+                lease_until=now + timedelta(seconds=lease_seconds),
+                lease_token=lease_token,
+                started_at=now,
+            )
+        ).rowcount
+        db.commit()
+        if claimed:
+            return dict(get_job(db, job_id), lease_token=lease_token)
+    return None
+
+
+def _holds_lease(job_id: str, lease_token: str):
+    # リースが切れて他のワーカーが取り出したジョブはトークンが変わっている
+    return and_(
+        GenerationJob.id == job_id, GenerationJob.status == RUNNING, GenerationJob.lease_token == lease_token
+    )
+
+
+def renew_lease(db: Session, job_id: str, lease_token: str, lease_seconds: float) -> bool:
+    """リースを延長する（リースを失っていた場合はFalse）"""
+    renewed = db.execute(
+        update(GenerationJob)
+        .where(_holds_lease(job_id, lease_token))
+        .values(lease_until=datetime.now() + timedelta(seconds=lease_seconds))
+    ).rowcount
+    db.commit()
+    return renewed > 0
+
+
+def set_job_recipe(db: Session, job_id: str, recipe_id: int):
+    """ジョブで保存したレシピのIDを記録する
+
+    レシピを保存するトランザクション内で呼び（コミットは呼び出し元で行う）、
+    保存後に停止して再実行されたジョブが同じレシピをもう一度保存しないようにする。
+    """
+    db.execute(update(GenerationJob).where(GenerationJob.id == job_id).values(recipe_id=recipe_id))
+
+
+def finish_job(
+    db: Session, job_id: str, lease_token: str, result: Optional[Dict] = None, error: Optional[str] = None
+) -> bool:
+    """結果を保存する（errorを指定した場合はfailedにする）
+
+    リースを失っていた（他のワーカーが再実行している・すでに終わっている）場合は保存せずFalseを返す。
+    """
+    values = {"lease_until": None, "lease_token": None, "finished_at": datetime.now()}
+    if error is not None:
+        values.update(status=FAILED, error=error)
+    else:
+        values.update(status=SUCCEEDED, result=orjson.dumps(result).decode(), recipe_id=result["recipe"].get("id"))
+    finished = db.execute(update(GenerationJob).where(_holds_lease(job_id, lease_token)).values(**values)).rowcount
+    db.commit()
+    return finished > 0
+
+
+def release_job(db: Session, job_id: str, lease_token: str):
+    """停止時に実行中のジョブを未実行に戻す（次に起動したワーカーがすぐに再実行できるようにする）"""
+    db.execute(
+        update(GenerationJob)
+        .where(_holds_lease(job_id, lease_token))
+        .values(status=QUEUED, attempts=GenerationJob.attempts - 1, lease_until=None, lease_token=None)
+    )
+    db.commit()
+
+
+def count_jobs(db: Session) -> Dict[str, int]:
+    """状態ごとのジョブ数"""
+    counts = dict(db.execute(select(GenerationJob.status, func.count()).group_by(GenerationJob.status)).all())
+    return {status: counts.get(status, 0) for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)}
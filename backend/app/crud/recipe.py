@@ -1,91 +1,195 @@
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
-from ..models.recipe import Recipe, Ingredient
+from typing import List, Dict, Optional, Tuple
+from ..models.recipe import Recipe, Ingredient, recipe_ingredient, recipe_cooking_method, recipe_seasoning, recipe_minhash
 from ..schemas.recipe import RecipeCreate, IngredientCreate
+from ..services.normalize import normalize_ingredient_name
+from .search import index_recipe, remove_recipe
+from .job import set_job_recipe
+from ..services.pantry_index import pantry_index
+from ..services.minhash_index import near_duplicate_index, minhash_row
+from ..services.nutrition import parse_amount
+from ..services.reference_catalog import reference_catalog
+from ..services.metrics import stage
 from datetime import datetime
 
+# 行→辞書変換で使うカラム（起動時に一度だけ作成）
+RECIPE_FIELDS = tuple(str(c.key) for c in Recipe.__table__.columns)
+INGREDIENT_COLUMNS = (
+    Ingredient.id,
+    Ingredient.name,
+    recipe_ingredient.c.amount,
+    recipe_ingredient.c.amount_value,
+    recipe_ingredient.c.unit,
+    recipe_ingredient.c.calories,
+    recipe_ingredient.c.protein,
+    recipe_ingredient.c.fat,
+    recipe_ingredient.c.carbs,
+    Ingredient.season,
+    Ingredient.category,
+    Ingredient.is_vegetarian,
+    Ingredient.is_vegan,
+)
+INGREDIENT_FIELDS = tuple(str(c.key) for c in INGREDIENT_COLUMNS)
+
+def _load_recipes(db: Session, stmt) -> List[Dict]:
+    """レシピと食材をまとめて取得し、レスポンス用の辞書に変換
+
+    レシピ1件ごとの遅延読み込みは行わず、ページ全体で2クエリに抑える。
+    """
+    return _attach_ingredients(db, [dict(zip(RECIPE_FIELDS, row)) for row in db.execute(stmt)])
+
+def _attach_ingredients(db: Session, recipes: List[Dict]) -> List[Dict]:
+    """レシピ辞書のリストに食材を1クエリで読み込んで付け加える"""
+    if not recipes:
+        return recipes
+
+    recipes_by_id = {}
+    for recipe in recipes:
+        recipe["ingredients"] = []
+        recipes_by_id[recipe["id"]] = recipe
+
+    ingredient_rows = db.execute(
+        select(recipe_ingredient.c.recipe_id, *INGREDIENT_COLUMNS)
+        .join(Ingredient, Ingredient.id == recipe_ingredient.c.ingredient_id)
+        .where(recipe_ingredient.c.recipe_id.in_(list(recipes_by_id)))
+        .order_by(recipe_ingredient.c.recipe_id, recipe_ingredient.c.position)
+    )
+    for row in ingredient_rows:
+        recipes_by_id[row[0]]["ingredients"].append(dict(zip(INGREDIENT_FIELDS, row[1:])))
+    return recipes
+
 def get_recipe(db: Session, recipe_id: int):
-    db_recipe = db.query(Recipe).filter(Recipe.id == recipe_id).first()
-    if db_recipe:
-        # レスポンス用の辞書を作成
-        response_dict = {
-            "id": db_recipe.id,
-            "title": db_recipe.title,
-            "description": db_recipe.description,
-            "instructions": db_recipe.instructions,
-            "difficulty": db_recipe.difficulty,
-            "cooking_time": db_recipe.cooking_time,
-            "servings": db_recipe.servings,
-            "image_url": db_recipe.image_url,
-            "season": db_recipe.season,
-            "cuisine_type": db_recipe.cuisine_type,
-            "created_at": db_recipe.created_at,
-            "updated_at": db_recipe.updated_at,
-            "ingredients": [
-                {
-                    "id": ing.id,
-                    "name": ing.name,
-                    "unit": ing.unit,
-                    "calories": ing.calories,
-                    "amount": ing.amount,
-                    "protein": ing.protein,
-                    "fat": ing.fat,
-                    "carbs": ing.carbs,
-                    "season": ing.season,
-                    "category": ing.category,
-                    "is_vegetarian": ing.is_vegetarian,
-                    "is_vegan": ing.is_vegan
-                }
-                for ing in db_recipe.ingredients
-            ]
-        }
-        return response_dict
-    return None
+    recipes = _load_recipes(db, select(*Recipe.__table__.columns).where(Recipe.id == recipe_id))
+    return recipes[0] if recipes else None
 
-def get_recipes(db: Session, skip: int = 0, limit: int = 100):
-    db_recipes = db.query(Recipe).offset(skip).limit(limit).all()
-    return [
-        {
-            "id": recipe.id,
-            "title": recipe.title,
-            "description": recipe.description,
-            "instructions": recipe.instructions,
-            "difficulty": recipe.difficulty,
-            "cooking_time": recipe.cooking_time,
-            "servings": recipe.servings,
-            "image_url": recipe.image_url,
-            "season": recipe.season,
-            "cuisine_type": recipe.cuisine_type,
-            "created_at": recipe.created_at,
-            "updated_at": recipe.updated_at,
-            "ingredients": [
-                {
-                    "id": ing.id,
-                    "name": ing.name,
-                    "unit": ing.unit,
-                    "amount": ing.amount,
-                    "calories": ing.calories,
-                    "protein": ing.protein,
-                    "fat": ing.fat,
-                    "carbs": ing.carbs,
-                    "season": ing.season,
-                    "category": ing.category,
-                    "is_vegetarian": ing.is_vegetarian,
-                    "is_vegan": ing.is_vegan
-                }
-                for ing in recipe.ingredients
-            ]
+def _page(stmt, skip: int, limit: int, after_id: Optional[int]):
+    stmt = stmt.order_by(Recipe.id).limit(limit)
+    if after_id is not None:
+        return stmt.where(Recipe.id > after_id)
+    if skip:
+        return stmt.offset(skip)
+    return stmt
+
+def get_recipes(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    """レシピ一覧を取得（after_idを指定するとOFFSETを使わないキーセットページングになる）"""
+    return _load_recipes(db, _page(select(*Recipe.__table__.columns), skip, limit, after_id))
+
+# 最終更新日時（更新されていなければ作成日時）
+_LAST_MODIFIED = func.coalesce(Recipe.updated_at, Recipe.created_at).label("last_modified")
+
+def get_recipe_version(db: Session, recipe_id: int):
+    """レシピの最終更新日時を食材を読み込まずに取得（存在しない場合はNone）"""
+    return db.execute(select(Recipe.id, _LAST_MODIFIED).where(Recipe.id == recipe_id)).first()
+
+def get_recipes_versions(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    """get_recipes と同じページの (ID, 最終更新日時) の一覧"""
+    return db.execute(_page(select(Recipe.id, _LAST_MODIFIED), skip, limit, after_id)).all()
+
+def _upsert_ingredients(db: Session, ingredients: List[IngredientCreate]) -> Dict[str, int]:
+    """食材カタログに未登録の食材を追加し、正規化名→IDの対応を返す
+
+    登録済みかどうかに関わらず、INSERT .. ON CONFLICT DO UPDATE .. RETURNING の1文でIDまで取得する。
+    """
+    catalog = {}
+    for ingredient in ingredients:
+        name = normalize_ingredient_name(ingredient.name)
+        if name and name not in catalog:
+            catalog[name] = {
+                "name": name,
+                "season": ingredient.season,
+                "category": ingredient.category,
+                "is_vegetarian": ingredient.is_vegetarian,
+                "is_vegan": ingredient.is_vegan,
+            }
+    if not catalog:
+        return {}
+
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    table = Ingredient.__table__
+    stmt = dialect.insert(table)
+    # 既存の食材は未設定の属性だけ補完する（DO UPDATEは既存の行も更新するため、RETURNINGで全件のIDが返る）
+    # 件数によらず同じ文になるようexecutemanyで渡し、SQLAlchemyに複数行のVALUESの1文にまとめさせる
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={
+            "season": func.coalesce(table.c.season, stmt.excluded.season),
+            "category": func.coalesce(table.c.category, stmt.excluded.category),
         }
-        for recipe in db_recipes
-    ]
-
-def create_recipe(db: Session, recipe: RecipeCreate):
-    # 食材を作成
-    db_ingredients = []
-    for ingredient in recipe.ingredients:
-        db_ingredient = Ingredient(**ingredient.dict())
-        db.add(db_ingredient)
-        db_ingredients.append(db_ingredient)
-    
+    ).returning(table.c.id, table.c.name)
+    rows = db.execute(stmt, list(catalog.values()))
+    ingredient_ids = {name: ingredient_id for ingredient_id, name in rows}
+    if any(values["season"] for values in catalog.values()):
+        # 旬の食材のキャッシュを読み込み直させる
+        reference_catalog.invalidate()
+    return ingredient_ids
+
+def _add_recipe_ingredients(db: Session, recipe_id: int, ingredients: List[IngredientCreate]):
+    """レシピの食材を中間テーブルに一括登録"""
+    _add_recipes_ingredients(db, [(recipe_id, ingredients)])
+
+def _add_recipes_ingredients(db: Session, items: List[Tuple[int, List[IngredientCreate]]]):
+    """複数レシピの食材をまとめて登録（食材カタログの登録も1文で行う）"""
+    ingredient_ids = _upsert_ingredients(db, [ingredient for _, ingredients in items for ingredient in ingredients])
+    rows = []
+    for recipe_id, ingredients in items:
+        for position, ingredient in enumerate(ingredients):
+            name = normalize_ingredient_name(ingredient.name)
+            if name not in ingredient_ids:
+                continue
+            rows.append({
+                "recipe_id": recipe_id,
+                "ingredient_id": ingredient_ids[name],
+                "position": position,
+                "amount": ingredient.amount,
+                # 集計や人数換算で毎回パースしないよう保存時に数値化しておく
+                "amount_value": parse_amount(ingredient.amount),
+                "unit": ingredient.unit,
+                "calories": ingredient.calories,
+                "protein": ingredient.protein,
+                "fat": ingredient.fat,
+                "carbs": ingredient.carbs,
+            })
+    if rows:
+        db.execute(insert(recipe_ingredient), rows)
+
+def _save_minhash(db: Session, items: List[Tuple[int, List[str]]]) -> List[Tuple[int, Optional[Dict]]]:
+    """レシピの元になった食材とMinHashシグネチャを保存（コミットは呼び出し元で行う）"""
+    rows = [(recipe_id, minhash_row(recipe_id, names)) for recipe_id, names in items]
+    values = [row for _, row in rows if row is not None]
+    if values:
+        db.execute(insert(recipe_minhash), values)
+    return rows
+
+def _index_minhash(rows: List[Tuple[int, Optional[Dict]]]):
+    """コミット後に近似検索のインデックスへ反映する"""
+    for recipe_id, row in rows:
+        near_duplicate_index.set_recipe(recipe_id, row)
+
+def _add_recipe_references(db: Session, recipe_id: int, cooking_methods: List[Tuple[int, Optional[int]]],
+                           seasoning_ids: List[int]):
+    """調理方法（ID, 所要時間）と調味料のIDを中間テーブルに登録"""
+    if cooking_methods:
+        db.execute(insert(recipe_cooking_method), [
+            {"recipe_id": recipe_id, "cooking_method_id": method_id, "order": order, "duration": duration}
+            for order, (method_id, duration) in enumerate(cooking_methods, 1)
+        ])
+    if seasoning_ids:
+        db.execute(insert(recipe_seasoning), [
+            {"recipe_id": recipe_id, "seasoning_id": seasoning_id} for seasoning_id in seasoning_ids
+        ])
+
+def create_recipe(db: Session, recipe: RecipeCreate, source_ingredients: Optional[List[str]] = None,
+                  cooking_methods: Optional[List[Tuple[int, Optional[int]]]] = None,
+                  seasoning_ids: Optional[List[int]] = None, job_id: Optional[str] = None):
+    """レシピを登録
+
+    source_ingredients: 生成時に指定された手持ちの食材（省略時はレシピの食材）。
+    手持ちの食材がほぼ同じ生成リクエストにこのレシピを使う際の比較に使う。
+    cooking_methods / seasoning_ids: 調理方法の (ID, 所要時間) と調味料のID（RecipeGeneratorの提案）。
+    job_id: 生成ジョブから保存する場合のジョブID（同じトランザクションでジョブにレシピIDを記録する）。
+    """
     db_recipe = Recipe(
         title=recipe.title,
         description=recipe.description,
@@ -96,42 +200,129 @@ def create_recipe(db: Session, recipe: RecipeCreate):
         image_url=recipe.image_url,
         season=recipe.season,
         cuisine_type=recipe.cuisine_type,
-        ingredients=db_ingredients,
         created_at=datetime.now()
     )
-    db.add(db_recipe)
-    db.commit()
-    db.refresh(db_recipe)
+    with stage("db_insert"):
+        db.add(db_recipe)
+        db.flush()
+
+        # 食材を登録
+        _add_recipe_ingredients(db, db_recipe.id, recipe.ingredients)
+        _add_recipe_references(db, db_recipe.id, cooking_methods or [], seasoning_ids or [])
+        index_recipe(db, db_recipe.id)
+        minhash = _save_minhash(db, [
+            (db_recipe.id, source_ingredients or [ingredient.name for ingredient in recipe.ingredients])
+        ])
+        if job_id is not None:
+            set_job_recipe(db, job_id, db_recipe.id)
+    with stage("db_commit"):
+        db.commit()
+    pantry_index.set_recipe(db_recipe.id, [ingredient.name for ingredient in recipe.ingredients])
+    _index_minhash(minhash)
     return get_recipe(db, db_recipe.id)
 
+def _insert_recipes(db: Session, recipes: List[RecipeCreate],
+                    created_at: Optional[List[Optional[datetime]]] = None) -> List[int]:
+    """レシピと食材をexecutemanyで登録し、入力と同じ順序でIDを返す（コミットは呼び出し元で行う）"""
+    now = datetime.now()
+    table = Recipe.__table__
+    recipe_ids = list(db.execute(
+        insert(table).returning(table.c.id, sort_by_parameter_order=True),
+        [
+            {
+                "title": recipe.title,
+                "description": recipe.description,
+                "instructions": recipe.instructions,
+                "difficulty": recipe.difficulty,
+                "cooking_time": recipe.cooking_time,
+                "servings": recipe.servings,
+                "image_url": recipe.image_url,
+                "season": recipe.season,
+                "cuisine_type": recipe.cuisine_type,
+                "created_at": (created_at[i] if created_at else None) or now,
+            }
+            for i, recipe in enumerate(recipes)
+        ]
+    ).scalars())
+    _add_recipes_ingredients(db, [(recipe_id, recipe.ingredients) for recipe_id, recipe in zip(recipe_ids, recipes)])
+    return recipe_ids
+
+def create_recipes(db: Session, recipes: List[RecipeCreate],
+                   source_ingredients: Optional[List[List[str]]] = None) -> List[Dict]:
+    """複数のレシピを1トランザクションで一括登録し、入力と同じ順序で返す
+
+    source_ingredients: レシピごとの生成時に指定された手持ちの食材（create_recipe を参照）
+    """
+    if not recipes:
+        return []
+    with stage("db_insert"):
+        recipe_ids = _insert_recipes(db, recipes)
+        for recipe_id in recipe_ids:
+            index_recipe(db, recipe_id)
+        minhash = _save_minhash(db, [
+            (recipe_id, (source_ingredients[i] if source_ingredients else None)
+             or [ingredient.name for ingredient in recipe.ingredients])
+            for i, (recipe_id, recipe) in enumerate(zip(recipe_ids, recipes))
+        ])
+    with stage("db_commit"):
+        db.commit()
+    for recipe_id, recipe in zip(recipe_ids, recipes):
+        pantry_index.set_recipe(recipe_id, [ingredient.name for ingredient in recipe.ingredients])
+    _index_minhash(minhash)
+
+    created = {
+        recipe["id"]: recipe
+        for recipe in _load_recipes(db, select(*Recipe.__table__.columns).where(Recipe.id.in_(recipe_ids)))
+    }
+    return [created[recipe_id] for recipe_id in recipe_ids]
+
 def update_recipe(db: Session, recipe_id: int, recipe: RecipeCreate):
-    db_recipe = get_recipe(db, recipe_id)
+    db_recipe = get_recipe_instance(db, recipe_id)
     if db_recipe:
         # 既存の食材を削除
-        db_recipe.ingredients = []
-        
-        # 新しい食材を作成
-        db_ingredients = []
-        for ingredient in recipe.ingredients:
-            db_ingredient = Ingredient(**ingredient.dict())
-            db.add(db_ingredient)
-            db_ingredients.append(db_ingredient)
+        db.execute(delete(recipe_ingredient).where(recipe_ingredient.c.recipe_id == recipe_id))
         
         # レシピを更新
         for key, value in recipe.dict(exclude={'ingredients'}).items():
             setattr(db_recipe, key, value)
+        # 食材だけの変更でもETagが変わるよう、列の変更の有無に関わらず更新日時を進める
+        db_recipe.updated_at = datetime.now()
         
-        db_recipe.ingredients = db_ingredients
+        # 新しい食材を登録
+        _add_recipe_ingredients(db, recipe_id, recipe.ingredients)
+        db.flush()
+        index_recipe(db, recipe_id)
+        # 内容が変わったため、元になった食材は新しい食材で置き換える
+        db.execute(delete(recipe_minhash).where(recipe_minhash.c.recipe_id == recipe_id))
+        minhash = _save_minhash(db, [(recipe_id, [ingredient.name for ingredient in recipe.ingredients])])
         db.commit()
-        db.refresh(db_recipe)
-    return db_recipe
+        pantry_index.set_recipe(recipe_id, [ingredient.name for ingredient in recipe.ingredients])
+        _index_minhash(minhash)
+        return get_recipe(db, recipe_id)
+    return None
+
+def set_recipe_image(db: Session, recipe_id: int, image_url: Optional[str]):
+    """レシピの画像のURLを更新（レシピがなければNone）"""
+    result = db.execute(
+        update(Recipe).where(Recipe.id == recipe_id).values(image_url=image_url, updated_at=datetime.now())
+    )
+    if result.rowcount == 0:
+        return None
+    db.commit()
+    return get_recipe(db, recipe_id)
 
 def get_recipe_instance(db: Session, recipe_id: int):
     return db.query(Recipe).filter(Recipe.id == recipe_id).first()
 
 def delete_recipe(db: Session, recipe_id: int):
-    db_recipe = get_recipe_instance(db, recipe_id)
-    if db_recipe:
-        db.delete(db_recipe)
+    # 削除後は食材を参照できないため、先にレスポンス用の辞書を作成しておく
+    deleted_recipe = get_recipe(db, recipe_id)
+    if deleted_recipe:
+        for table in (recipe_ingredient, recipe_cooking_method, recipe_seasoning, recipe_minhash):
+            db.execute(delete(table).where(table.c.recipe_id == recipe_id))
+        db.execute(delete(Recipe).where(Recipe.id == recipe_id))
+        remove_recipe(db, recipe_id)
         db.commit()
-    return db_recipe 
\ No newline at end of file
+        pantry_index.remove_recipe(recipe_id)
+        near_duplicate_index.remove_recipe(recipe_id)
+    return deleted_recipe
@@ -0,0 +1,187 @@
+from sqlalchemy import text, select, inspect
+from sqlalchemy.orm import Session
+from typing import List, Dict
+from ..models.recipe import Recipe, Ingredient, recipe_ingredient
+from ..services.normalize import normalize_ingredient_name
+
+# FTS5の仮想テーブル（rowidはレシピID）
+# trigramトークナイザーは分かち書きが不要なため日本語でも部分一致で検索できる
+SEARCH_TABLE = "recipe_search"
+SEARCH_COLUMNS = ("title", "description", "instructions", "ingredients")
+# bm25の列ごとの重み（タイトル・食材の一致を優先）
+SEARCH_WEIGHTS = (10.0, 3.0, 1.0, 5.0)
+# trigramで検索できる最小の文字数
+MIN_MATCH_LENGTH = 3
+SNIPPET_OPEN, SNIPPET_CLOSE = "【", "】"
+
+
+def _is_sqlite(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def _search_document(db: Session, recipe_id: int):
+    recipe = db.execute(
+        select(Recipe.title, Recipe.description, Recipe.instructions).where(Recipe.id == recipe_id)
+    ).first()
+    if recipe is None:
+        return None
+    names = db.execute(
+        select(Ingredient.name)
+        .join(recipe_ingredient, Ingredient.id == recipe_ingredient.c.ingredient_id)
+        .where(recipe_ingredient.c.recipe_id == recipe_id)
+        .order_by(recipe_ingredient.c.position)
+    ).scalars()
+    return {
+        "id": recipe_id,
+        "title": recipe.title or "",
+        "description": recipe.description or "",
+        "instructions": recipe.instructions or "",
+        "ingredients": " ".join(names),
+    }
+
+
+def ensure_search_index(db: Session):
+    """検索用の仮想テーブルがなければ作成し、既存のレシピを登録する"""
+    if not _is_sqlite(db) or inspect(db.get_bind()).has_table(SEARCH_TABLE):
+        return
+    db.execute(text(
+        f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+        f"{', '.join(SEARCH_COLUMNS)}, tokenize='trigram')"
+    ))
+    rebuild_search_index(db)
+
+
+def rebuild_search_index(db: Session) -> int:
+    """検索インデックスを全件作り直す"""
+    if not _is_sqlite(db):
+        return 0
+    db.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    count = 0
+    for recipe_id in db.execute(select(Recipe.id)).scalars().all():
+        index_recipe(db, recipe_id)
+        count += 1
+    db.commit()
+    return count
+
+
+def index_recipe(db: Session, recipe_id: int):
+    """レシピを検索インデックスに登録（更新時も同じ関数で置き換える）
+
+    呼び出し元のトランザクション内で実行し、コミットは呼び出し元で行う。
+    """
+    if not _is_sqlite(db):
+        return
+    remove_recipe(db, recipe_id)
+    document = _search_document(db, recipe_id)
+    if document is not None:
+        db.execute(
+            text(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) "
+                f"VALUES (:id, {', '.join(':' + c for c in SEARCH_COLUMNS)})"
+            ),
+            document
+        )
+
+
+def add_search_documents(db: Session, documents: List[Dict]):
+    """新規のレシピをまとめて検索インデックスに登録（一括登録用。既存の行は削除しない）
+
+    documentsは id と SEARCH_COLUMNS の各列を持つ辞書。ingredientsは正規化済みの食材名を空白で連結したもの。
+    """
+    if not _is_sqlite(db) or not documents:
+        return
+    db.execute(
+        text(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) "
+            f"VALUES (:id, {', '.join(':' + c for c in SEARCH_COLUMNS)})"
+        ),
+        documents
+    )
+
+
+def remove_recipe(db: Session, recipe_id: int):
+    if not _is_sqlite(db):
+        return
+    db.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {"id": recipe_id})
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _make_snippet(row: Dict, terms: List[str], width: int = 20) -> str:
+    """MATCHを使わない検索結果用に、最初に一致した箇所の前後を切り出す"""
+    for column in SEARCH_COLUMNS:
+        value = row[column] or ""
+        for term in terms:
+            index = value.find(term)
+            if index == -1:
+                continue
+            start = max(0, index - width)
+            end = min(len(value), index + len(term) + width)
+            snippet = value[start:end].replace(term, f"{SNIPPET_OPEN}{term}{SNIPPET_CLOSE}")
+            return ("…" if start > 0 else "") + snippet + ("…" if end < len(value) else "")
+    return (row["description"] or row["title"] or "")[:width * 2]
+
+
+def search_recipes(db: Session, q: str, limit: int = 20) -> List[Dict]:
+    """全文検索（スコア順）
+
+    3文字以上の語はFTS5のMATCHで検索してbm25で順位付けし、
+    trigramで扱えない2文字以下の語はLIKEで絞り込む。
+    """
+    terms = [normalize_ingredient_name(term) for term in q.split()]
+    terms = [term for term in terms if term]
+    if not terms:
+        return []
+
+    if not _is_sqlite(db):
+        # FTS5が使えないデータベースでは単純な部分一致で検索する
+        stmt = select(Recipe.id, Recipe.title, Recipe.description, Recipe.instructions)
+        for term in terms:
+            stmt = stmt.where(Recipe.title.contains(term) | Recipe.description.contains(term) | Recipe.instructions.contains(term))
+        rows = db.execute(stmt.order_by(Recipe.id.desc()).limit(limit)).mappings()
+        return [
+            {"id": row["id"], "title": row["title"], "description": row["description"],
+             "snippet": _make_snippet(dict(row, ingredients=""), terms), "score": 0.0}
+            for row in rows
+        ]
+
+    match_terms = [term for term in terms if len(term) >= MIN_MATCH_LENGTH]
+    like_terms = [term for term in terms if len(term) < MIN_MATCH_LENGTH]
+    conditions = []
+    params = {"limit": limit}
+    if match_terms:
+        conditions.append(f"{SEARCH_TABLE} MATCH :match")
+        params["match"] = " ".join('"' + term.replace('"', '""') + '"' for term in match_terms)
+    for i, term in enumerate(like_terms):
+        conditions.append("(" + " OR ".join(f"{column} LIKE :like{i} ESCAPE '\\'" for column in SEARCH_COLUMNS) + ")")
+        params[f"like{i}"] = f"%{_escape_like(term)}%"
+
+    if match_terms:
+        weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+        columns = (
+            f"rowid AS id, title, description, "
+            f"snippet({SEARCH_TABLE}, -1, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', '…', 16) AS snippet, "
+            f"bm25({SEARCH_TABLE}, {weights}) AS rank"
+        )
+        order = "rank"
+    else:
+        columns = f"rowid AS id, {', '.join(SEARCH_COLUMNS)}, 0.0 AS rank"
+        order = "rowid DESC"
+
+    rows = db.execute(
+        text(f"SELECT {columns} FROM {SEARCH_TABLE} WHERE {' AND '.join(conditions)} ORDER BY {order} LIMIT :limit"),
+        params
+    ).mappings()
+    return [
+        {
+            "id": row["id"],
+            "title": row["title"],
+            "description": row["description"] or None,
+            "snippet": row["snippet"] if match_terms else _make_snippet(row, terms),
+            # bm25は小さいほど関連度が高いため符号を反転する
+            "score": -row["rank"] if match_terms else 0.0,
+        }
+        for row in rows
+    ]
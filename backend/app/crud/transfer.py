@@ -0,0 +1,176 @@
+import zlib
+import hashlib
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+import orjson
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from ..models.recipe import Recipe
+from ..schemas.recipe import RecipeCreate
+from ..services.normalize import normalize_ingredient_name
+from ..services.pantry_index import pantry_index
+from .recipe import RECIPE_FIELDS, _attach_ingredients, _insert_recipes, _save_minhash, _index_minhash
+from .search import add_search_documents
+
+# 書き出し・取り込みで1度に扱うレシピ数
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+# 取り込み結果に含めるエラーの件数の上限
+MAX_REPORTED_ERRORS = 20
+
+
+def iter_export_chunks(db: Session, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """全レシピをNDJSON（1行1レシピ、GET /recipes/{id} と同じ形式）で返す
+
+    サーバー側カーソルからbatch_size件ずつ読み込み、食材はバッチごとに1クエリで付け加えるため、
+    レシピの件数に関わらずメモリ使用量は一定になる。
+    """
+    result = db.execute(
+        select(*Recipe.__table__.columns).order_by(Recipe.id).execution_options(yield_per=batch_size)
+    )
+    for rows in result.partitions():
+        recipes = _attach_ingredients(db, [dict(zip(RECIPE_FIELDS, row)) for row in rows])
+        yield b"".join(orjson.dumps(recipe) + b"\n" for recipe in recipes)
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """バイト列の断片を順にgzip圧縮して返す"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class LineBuffer:
+    """受信したバイト列の断片を行に分割する（gzip圧縮された入力は展開しながら分割する）"""
+
+    def __init__(self, compressed: bool = False):
+        self._decompressor = zlib.decompressobj(47) if compressed else None
+        self._rest = b""
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """完結した行を返し、最後の書きかけの行は次の断片まで持ち越す"""
+        if self._decompressor is not None:
+            chunk = self._decompressor.decompress(chunk)
+        lines = (self._rest + chunk).split(b"\n")
+        self._rest = lines.pop()
+        return lines
+
+    def close(self) -> List[bytes]:
+        tail = self._rest
+        if self._decompressor is not None:
+            tail += self._decompressor.flush()
+        self._rest = b""
+        return tail.split(b"\n")
+
+
+def recipe_fingerprint(title: str, description: Optional[str], instructions: str) -> bytes:
+    """重複判定用のハッシュ（空白の違いは無視する）"""
+    text = "\x1f".join(" ".join((value or "").split()) for value in (title, description, instructions))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _parse_created_at(value) -> Optional[datetime]:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return None
+
+
+class RecipeImporter:
+    """NDJSONのレシピを一括登録する
+
+    import_lines に渡した行をまとめてexecutemanyで登録し、呼び出しごとにコミットする。
+    タイトル・説明・手順が同じレシピは、取り込み済みのものもデータベースに既にあるものも重複として登録しない。
+    途中で失敗した場合は committed_line 行目までが登録済みで、同じ本文を送り直しても登録済みの分は重複として飛ばす。
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.imported = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+        self.committed_line = 0
+        self._line = 0
+        self._seen: Set[bytes] = set()
+
+    def _fail(self, line: int, error: Exception):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": str(error)})
+
+    def import_lines(self, lines: Iterable[Union[bytes, str]]):
+        """NDJSONの行をまとめて登録（空行は無視する）"""
+        batch: List[Tuple[bytes, RecipeCreate, Optional[datetime]]] = []
+        for line in lines:
+            self._line += 1
+            if not line.strip():
+                continue
+            try:
+                data = orjson.loads(line)
+                recipe = RecipeCreate.parse_obj(data)
+                created_at = _parse_created_at(data.get("created_at"))
+            except (ValueError, TypeError) as e:
+                self._fail(self._line, e)
+                continue
+            key = recipe_fingerprint(recipe.title, recipe.description, recipe.instructions)
+            if key in self._seen:
+                self.duplicates += 1
+                continue
+            self._seen.add(key)
+            batch.append((key, recipe, created_at))
+        if batch:
+            self._insert(batch)
+        self.committed_line = self._line
+
+    def _existing_fingerprints(self, titles: Set[str]) -> Set[bytes]:
+        rows = self.db.execute(
+            select(Recipe.title, Recipe.description, Recipe.instructions).where(Recipe.title.in_(titles))
+        )
+        return {recipe_fingerprint(*row) for row in rows}
+
+    def _insert(self, batch: List[Tuple[bytes, RecipeCreate, Optional[datetime]]]):
+        existing = self._existing_fingerprints({recipe.title for _, recipe, _ in batch})
+        new = [item for item in batch if item[0] not in existing]
+        self.duplicates += len(batch) - len(new)
+        if not new:
+            return
+
+        recipes = [recipe for _, recipe, _ in new]
+        try:
+            recipe_ids = _insert_recipes(self.db, recipes, [created_at for _, _, created_at in new])
+            add_search_documents(self.db, [
+                {
+                    "id": recipe_id,
+                    "title": recipe.title,
+                    "description": recipe.description or "",
+                    "instructions": recipe.instructions,
+                    "ingredients": " ".join(
+                        name for name in (normalize_ingredient_name(i.name) for i in recipe.ingredients) if name
+                    ),
+                }
+                for recipe_id, recipe in zip(recipe_ids, recipes)
+            ])
+            minhash = _save_minhash(self.db, [
+                (recipe_id, [ingredient.name for ingredient in recipe.ingredients])
+                for recipe_id, recipe in zip(recipe_ids, recipes)
+            ])
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        for recipe_id, recipe in zip(recipe_ids, recipes):
+            pantry_index.set_recipe(recipe_id, [ingredient.name for ingredient in recipe.ingredients])
+        _index_minhash(minhash)
+        self.imported += len(new)
+
+    def stats(self) -> Dict:
+        return {
+            "imported": self.imported,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": self.errors,
+            "committed_line": self.committed_line,
+        }
@@ -1,21 +1,117 @@
+from dotenv import load_dotenv
+
+# 各モジュールが読み込み時に参照する環境変数より先に.envを読み込む
+load_dotenv()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
 from .api import recipes
+from .database import SessionLocal, dispose_async_engine
+from .crud.search import ensure_search_index
+from .crud.job import ensure_job_table
+from .services.pantry_index import pantry_index
+from .services.minhash_index import near_duplicate_index
+from .services.metrics import MetricsMiddleware, render_metrics
+from .services.openai_service import close_async_openai_service
+from .services.image_store import shutdown_image_executor
+from .services.job_queue import job_workers
+from .migrations import amount_value, ingredient_catalog
+
+
+def migrate_database(db: Session):
+    """未移行のデータベースを移行する
+
+    SQLiteのファイルはその場で移行する（各移行は移行済みなら何もしない）。
+    それ以外のデータベースは移行できないため、旧スキーマのままなら起動を中止する。
+    """
+    bind = db.get_bind()
+    if bind.url.get_backend_name() == "sqlite" and bind.url.database not in (None, "", ":memory:"):
+        ingredient_catalog.migrate(bind.url.database)
+        amount_value.migrate(bind.url.database)
+        # 食材IDの付け替えで相性テーブルも書き換わるため、読み込み済みのグラフは使わない
+        # （numpyの読み込みを起動時まで遅らせるためここで読み込む）
+        from .services.compatibility_graph import compatibility_graph
+        compatibility_graph.invalidate()
+
+    inspector = inspect(bind)
+    if inspector.has_table("recipe_ingredient"):
+        columns = {column["name"] for column in inspector.get_columns("recipe_ingredient")}
+        if "amount_value" not in columns:
+            raise RuntimeError(
+                "データベースが旧スキーマのままです。"
+                "app.migrations.ingredient_catalog と app.migrations.amount_value で移行してから起動してください"
+            )
+
+
+def init_indexes():
+    db = SessionLocal()
+    try:
+        migrate_database(db)
+        ensure_search_index(db)
+        ensure_job_table(db)
+        pantry_index.load(db)
+        near_duplicate_index.load(db)
+    finally:
+        db.close()
+
+
+async def start_job_workers():
+    # 再起動前に登録されたジョブ・実行途中だったジョブもワーカーがデータベースから取り出して実行する
+    job_workers.start(recipes.run_generation_job)
+
+
+async def close_services():
+    # 実行中のジョブは未実行に戻してから、ジョブが使うクライアントを閉じる
+    await job_workers.stop()
+    # OpenAIクライアントと画像処理のプロセスプールは最初に使う時に作るため、作成済みの場合だけ閉じる
+    await close_async_openai_service()
+    shutdown_image_executor()
+    await dispose_async_engine()
+
+
+def create_app() -> FastAPI:
+    """アプリケーションを作成
+
+    読み込み時にはルーティングの登録だけを行い、インデックスの読み込みは起動時、
+    OpenAIクライアントの作成（openaiの読み込みを含む）は最初の生成時、
+    画像処理のプロセスプールの起動は最初のアップロード時まで遅らせる。
+    起動時間は bench.cold_start で計測できる。
+    """
+    app = FastAPI(title="Recipe Creator API")
+
+    # CORSの設定
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # 開発環境では全てのオリジンを許可
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "X-Request-ID", "Server-Timing", "ETag", "Last-Modified"],
+    )
+
+    # トレースIDの付与と処理時間の計測（CORSより外側で全リクエストを計測する）
+    app.add_middleware(MetricsMiddleware)
+
+    # ルーターの追加
+    app.include_router(recipes.router, prefix="/api/v1")
+
+    app.add_event_handler("startup", init_indexes)
+    app.add_event_handler("startup", start_job_workers)
+    app.add_event_handler("shutdown", close_services)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics():
+        """Prometheus形式のメトリクス"""
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-app = FastAPI(title="Recipe Creator API")
+    @app.get("/")
+    async def root():
+        return {"message": "Welcome to Recipe Creator API"}
 
-# CORSの設定
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # 開発環境では全てのオリジンを許可
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    return app
 
-# ルーターの追加
-app.include_router(recipes.router, prefix="/api/v1")
 
-@app.get("/")
-async def root():
-    return {"message": "Welcome to Recipe Creator API"} 
\ No newline at end of file
+app = create_app()
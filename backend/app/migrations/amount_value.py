@@ -0,0 +1,36 @@
+"""recipe_ingredient に数値化した分量（amount_value）を追加する
+
+使い方:
+    python -m app.migrations.amount_value [recipe.dbのパス]
+"""
+import sys
+import sqlite3
+from ..services.nutrition import parse_amount
+
+
+def migrate(path: str):
+    conn = sqlite3.connect(path)
+    try:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(recipe_ingredient)")]
+        if not columns:
+            print("recipe_ingredient テーブルがありません")
+            return
+        if "amount_value" not in columns:
+            conn.execute("ALTER TABLE recipe_ingredient ADD COLUMN amount_value FLOAT")
+
+        # 数値化済みの行は読み直さない（起動のたびに実行しても未設定の行だけを更新する）
+        rows = conn.execute(
+            "SELECT rowid, amount FROM recipe_ingredient WHERE amount_value IS NULL AND amount IS NOT NULL"
+        ).fetchall()
+        conn.executemany(
+            "UPDATE recipe_ingredient SET amount_value = ? WHERE rowid = ?",
+            [(parse_amount(amount), rowid) for rowid, amount in rows]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"{len(rows)} 件の分量を数値化しました")
+
+
+if __name__ == "__main__":
+    migrate(sys.argv[1] if len(sys.argv) > 1 else "./recipe.db")
@@ -0,0 +1,143 @@
+"""食材テーブルを正規化した食材カタログに移行する
+
+レシピごとに作られていた重複食材を正規化名ごとの1行にまとめ、
+分量・単位・栄養価は recipe_ingredient に移す。
+
+使い方:
+    python -m app.migrations.ingredient_catalog [recipe.dbのパス]
+"""
+import sys
+import sqlite3
+from ..services.normalize import normalize_ingredient_name
+
+LINE_FIELDS = ("amount", "unit", "calories", "protein", "fat", "carbs")
+CATALOG_FIELDS = ("season", "category", "is_vegetarian", "is_vegan")
+
+
+def migrate(path: str):
+    conn = sqlite3.connect(path)
+    conn.isolation_level = None
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(ingredients)")]
+    if "unit" not in columns:
+        print("すでに移行済みです")
+        conn.close()
+        return
+
+    conn.execute("BEGIN")
+    try:
+        select_fields = ["id", "name"] + [
+            field if field in columns else "NULL" for field in LINE_FIELDS + CATALOG_FIELDS
+        ]
+        rows = conn.execute(f"SELECT {', '.join(select_fields)} FROM ingredients ORDER BY id").fetchall()
+
+        # 正規化名ごとに最小IDの行を代表とし、未設定の属性は重複行の値で補完する
+        catalog = {}
+        id_map = {}
+        lines = {}
+        for row in rows:
+            old_id, name = row[0], normalize_ingredient_name(row[1] or "")
+            line = dict(zip(LINE_FIELDS, row[2:2 + len(LINE_FIELDS)]))
+            attrs = dict(zip(CATALOG_FIELDS, row[2 + len(LINE_FIELDS):]))
+            lines[old_id] = line
+            if not name:
+                continue
+            entry = catalog.get(name)
+            if entry is None:
+                catalog[name] = dict(attrs, id=old_id, name=name)
+            else:
+                for field, value in attrs.items():
+                    if entry[field] is None:
+                        entry[field] = value
+            id_map[old_id] = catalog[name]["id"]
+
+        conn.execute("""
+            CREATE TABLE ingredients_new (
+                id INTEGER NOT NULL,
+                name VARCHAR,
+                season VARCHAR,
+                category VARCHAR,
+                is_vegetarian BOOLEAN,
+                is_vegan BOOLEAN,
+                PRIMARY KEY (id)
+            )
+        """)
+        conn.executemany(
+            "INSERT INTO ingredients_new (id, name, season, category, is_vegetarian, is_vegan) "
+            "VALUES (:id, :name, :season, :category, :is_vegetarian, :is_vegan)",
+            list(catalog.values())
+        )
+
+        conn.execute("""
+            CREATE TABLE recipe_ingredient_new (
+                recipe_id INTEGER,
+                ingredient_id INTEGER,
+                position INTEGER,
+                amount VARCHAR,
+                unit VARCHAR,
+                calories FLOAT,
+                protein FLOAT,
+                fat FLOAT,
+                carbs FLOAT,
+                FOREIGN KEY(recipe_id) REFERENCES recipes (id),
+                FOREIGN KEY(ingredient_id) REFERENCES ingredients (id)
+            )
+        """)
+        positions = {}
+        new_lines = []
+        for recipe_id, ingredient_id in conn.execute(
+            "SELECT recipe_id, ingredient_id FROM recipe_ingredient ORDER BY rowid"
+        ):
+            if ingredient_id not in id_map:
+                continue
+            position = positions.get(recipe_id, 0)
+            positions[recipe_id] = position + 1
+            new_lines.append(dict(
+                lines[ingredient_id],
+                recipe_id=recipe_id,
+                ingredient_id=id_map[ingredient_id],
+                position=position
+            ))
+        conn.executemany(
+            "INSERT INTO recipe_ingredient_new "
+            "(recipe_id, ingredient_id, position, amount, unit, calories, protein, fat, carbs) "
+            "VALUES (:recipe_id, :ingredient_id, :position, :amount, :unit, :calories, :protein, :fat, :carbs)",
+            new_lines
+        )
+
+        # 相性テーブルのIDも代表IDに付け替え、重複した組み合わせはスコアの高い方を残す
+        pairs = {}
+        for ingredient1_id, ingredient2_id, score, notes in conn.execute(
+            "SELECT ingredient1_id, ingredient2_id, compatibility_score, notes FROM ingredient_compatibility"
+        ):
+            pair = (id_map.get(ingredient1_id), id_map.get(ingredient2_id))
+            if None in pair or pair[0] == pair[1]:
+                continue
+            if pair not in pairs or (score or 0) > (pairs[pair][0] or 0):
+                pairs[pair] = (score, notes)
+        conn.execute("DELETE FROM ingredient_compatibility")
+        conn.executemany(
+            "INSERT INTO ingredient_compatibility (ingredient1_id, ingredient2_id, compatibility_score, notes) "
+            "VALUES (?, ?, ?, ?)",
+            [(pair[0], pair[1], score, notes) for pair, (score, notes) in pairs.items()]
+        )
+
+        conn.execute("DROP TABLE recipe_ingredient")
+        conn.execute("DROP TABLE ingredients")
+        conn.execute("ALTER TABLE ingredients_new RENAME TO ingredients")
+        conn.execute("ALTER TABLE recipe_ingredient_new RENAME TO recipe_ingredient")
+        conn.execute("CREATE INDEX ix_ingredients_id ON ingredients (id)")
+        conn.execute("CREATE UNIQUE INDEX ix_ingredients_name ON ingredients (name)")
+        conn.execute("CREATE INDEX ix_recipe_ingredient_recipe_id ON recipe_ingredient (recipe_id)")
+        conn.execute("CREATE INDEX ix_recipe_ingredient_ingredient_id ON recipe_ingredient (ingredient_id)")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    print(f"食材 {len(rows)} 行を {len(catalog)} 件のカタログに統合しました")
+
+
+if __name__ == "__main__":
+    migrate(sys.argv[1] if len(sys.argv) > 1 else "./recipe.db")
@@ -0,0 +1,76 @@
+"""手元の画像ファイルをレシピの画像として登録する
+
+サムネイルの作成はAPIからのアップロードと同じくプロセスプールで行う。
+import-dir ではファイル名（拡張子を除く）をレシピIDとして扱う（例: 12.jpg → ID 12 のレシピ）。
+
+使い方:
+    python -m app.migrations.recipe_images attach 12 curry.jpg
+    python -m app.migrations.recipe_images import-dir images_to_import/
+"""
+import os
+import sys
+import time
+import asyncio
+from typing import List, Tuple
+from ..database import SessionLocal
+from ..crud.recipe import set_recipe_image
+from ..services.image_store import add_image, image_url, shutdown_image_executor, IMAGE_WORKERS
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp")
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def _attach_all(items: List[Tuple[int, str]]):
+    started = time.perf_counter()
+    # ワーカーが空かないよう、プロセス数より少し多く並行して読み込む
+    semaphore = asyncio.Semaphore(IMAGE_WORKERS * 2)
+    attached = 0
+    db = SessionLocal()
+
+    async def attach(recipe_id: int, path: str):
+        nonlocal attached
+        async with semaphore:
+            try:
+                key = await add_image(_read(path))
+            except (OSError, ValueError) as e:
+                print(f"  {path}: {e}")
+                return
+        if set_recipe_image(db, recipe_id, image_url(key)) is None:
+            print(f"  {path}: ID {recipe_id} のレシピがありません")
+            return
+        attached += 1
+
+    try:
+        await asyncio.gather(*(attach(recipe_id, path) for recipe_id, path in items))
+    finally:
+        db.close()
+        shutdown_image_executor()
+    print(f"{attached} 件の画像を登録しました（{time.perf_counter() - started:.1f}秒）")
+
+
+def _scan_dir(directory: str) -> List[Tuple[int, str]]:
+    items = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in IMAGE_EXTENSIONS and stem.isdigit():
+            items.append((int(stem), os.path.join(directory, name)))
+    return items
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "attach" and sys.argv[2].isdigit():
+        items = [(int(sys.argv[2]), sys.argv[3])]
+    elif len(sys.argv) == 3 and sys.argv[1] == "import-dir":
+        items = _scan_dir(sys.argv[2])
+    else:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(_attach_all(items))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""レシピをNDJSON（1行1レシピ）で書き出す・取り込む
+
+拡張子が .gz のファイルはgzip圧縮として扱う。取り込み時は既存のレシピと同じもの
+（タイトル・説明・手順が同じもの）は登録しない。
+
+使い方:
+    python -m app.migrations.recipes_ndjson export recipes.ndjson.gz
+    python -m app.migrations.recipes_ndjson import recipes.ndjson.gz
+"""
+import sys
+import gzip
+import time
+from itertools import islice
+from ..database import SessionLocal
+from ..crud.search import ensure_search_index
+from ..services.minhash_index import ensure_minhash_table
+from ..crud.transfer import iter_export_chunks, RecipeImporter, IMPORT_BATCH_SIZE
+
+
+def _open(path: str, mode: str):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+def export_recipes(path: str):
+    db = SessionLocal()
+    try:
+        with _open(path, "wb") as f:
+            for chunk in iter_export_chunks(db):
+                f.write(chunk)
+    finally:
+        db.close()
+    print(f"{path} に書き出しました")
+
+
+def import_recipes(path: str):
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        ensure_search_index(db)
+        ensure_minhash_table(db)
+        importer = RecipeImporter(db)
+        with _open(path, "rb") as f:
+            while True:
+                lines = list(islice(f, IMPORT_BATCH_SIZE))
+                if not lines:
+                    break
+                importer.import_lines(lines)
+                print(f"\r{importer.imported} 件登録しました", end="", flush=True)
+    finally:
+        db.close()
+    stats = importer.stats()
+    print(f"\r{stats['imported']} 件登録しました（重複 {stats['duplicates']} 件、"
+          f"エラー {stats['failed']} 件、{time.perf_counter() - started:.1f}秒）")
+    for error in stats["errors"]:
+        print(f"  {error['line']}行目: {error['error']}")
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "import"):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == "export":
+        export_recipes(sys.argv[2])
+    else:
+        import_recipes(sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
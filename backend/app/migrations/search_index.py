@@ -0,0 +1,21 @@
+"""全文検索インデックスを作り直す
+
+使い方:
+    python -m app.migrations.search_index
+"""
+from ..database import SessionLocal
+from ..crud.search import ensure_search_index, rebuild_search_index
+
+
+def main():
+    db = SessionLocal()
+    try:
+        ensure_search_index(db)
+        count = rebuild_search_index(db)
+    finally:
+        db.close()
+    print(f"{count} 件のレシピを検索インデックスに登録しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,2 @@
-from .recipe import Recipe, Ingredient 
\ No newline at end of file
+from .recipe import Recipe, Ingredient
+from .job import GenerationJob
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from ..database import Base
+
+# ジョブの状態（queued → running → succeeded / failed）
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+class GenerationJob(Base):
+    """AIによるレシピ生成のジョブ
+
+    ワーカーはrunningにする際にlease_untilを設定して実行中は延長し続けるため、
+    lease_untilを過ぎたrunningのジョブはプロセスが停止したものとして再実行する。
+    lease_tokenは取り出すたびに作り直し、リースを失ったワーカーが結果を上書きしないようにする。
+    """
+    __tablename__ = "generation_jobs"
+
+    id = Column(String, primary_key=True)  # uuid4().hex
+    idempotency_key = Column(String, unique=True, nullable=True)  # クライアントが指定した Idempotency-Key
+    request_hash = Column(String, nullable=False)  # 同じキーで内容の異なるリクエストを拒否するためのハッシュ
+    request = Column(String, nullable=False)  # リクエスト本文（JSON）
+    status = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    result = Column(String, nullable=True)  # 成功時のレスポンス本文（JSON）
+    error = Column(String, nullable=True)
+    recipe_id = Column(Integer, nullable=True)  # 保存（または再利用）したレシピ（保存と同じトランザクションで記録する）
+    lease_until = Column(DateTime(timezone=True), nullable=True)
+    lease_token = Column(String, nullable=True)  # 実行中のワーカーが取り出した時に作ったトークン
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (Index("ix_generation_jobs_status_created_at", "status", "created_at"),)
@@ -1,14 +1,34 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Table, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Table, Boolean, DateTime, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
 
-# レシピと食材の中間テーブル
+# レシピと食材の中間テーブル（分量や栄養価はレシピごとに異なるためこちらに持つ）
 recipe_ingredient = Table(
     'recipe_ingredient',
     Base.metadata,
     Column('recipe_id', Integer, ForeignKey('recipes.id')),
-    Column('ingredient_id', Integer, ForeignKey('ingredients.id'))
+    Column('ingredient_id', Integer, ForeignKey('ingredients.id')),
+    Column('position', Integer),  # レシピ内での並び順
+    Column('amount', String, nullable=True),
+    Column('amount_value', Float, nullable=True),  # amountを数値化した値（適量・少々などはNULL）
+    Column('unit', String),  # g, ml, 個など
+    Column('calories', Float, nullable=True),
+    Column('protein', Float, nullable=True),
+    Column('fat', Float, nullable=True),
+    Column('carbs', Float, nullable=True),
+    Index('ix_recipe_ingredient_recipe_id', 'recipe_id'),
+    Index('ix_recipe_ingredient_ingredient_id', 'ingredient_id')
+)
+
+# レシピの元になった食材（生成時に指定された手持ちの食材）とそのMinHashシグネチャ
+# 手持ちの食材がほぼ同じ生成リクエストに保存済みのレシピを使うために持つ
+recipe_minhash = Table(
+    'recipe_minhash',
+    Base.metadata,
+    Column('recipe_id', Integer, ForeignKey('recipes.id'), primary_key=True),
+    Column('ingredients', String, nullable=False),  # 正規化した食材名を改行で連結したもの
+    Column('signature', LargeBinary, nullable=False)
 )
 
 # 食材の相性テーブル
@@ -37,29 +57,24 @@ class Recipe(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
-    # リレーションシップ
-    ingredients = relationship("Ingredient", secondary=recipe_ingredient, back_populates="recipes")
+    # リレーションシップ（中間テーブルへの書き込みはcrudで一括して行う）
+    ingredients = relationship("Ingredient", secondary=recipe_ingredient, back_populates="recipes", viewonly=True)
     cooking_methods = relationship("CookingMethod", secondary="recipe_cooking_method")
     seasonings = relationship("Seasoning", secondary="recipe_seasoning")
 
 class Ingredient(Base):
+    """食材カタログ（正規化した名前ごとに1行）"""
     __tablename__ = "ingredients"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
-    amount = Column(String, nullable=True)
-    unit = Column(String)  # g, ml, 個など
-    calories = Column(Float, nullable=True)
-    protein = Column(Float, nullable=True)
-    fat = Column(Float, nullable=True)
-    carbs = Column(Float, nullable=True)
+    name = Column(String, unique=True, index=True)
     season = Column(String)  # spring, summer, autumn, winter
     category = Column(String)  # vegetable, meat, fish, etc.
     is_vegetarian = Column(Boolean, default=False)
     is_vegan = Column(Boolean, default=False)
     
     # リレーションシップ
-    recipes = relationship("Recipe", secondary=recipe_ingredient, back_populates="ingredients")
+    recipes = relationship("Recipe", secondary=recipe_ingredient, back_populates="ingredients", viewonly=True)
     compatible_with = relationship(
         "Ingredient",
         secondary=ingredient_compatibility,
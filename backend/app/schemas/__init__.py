@@ -1 +1 @@
-from .recipe import Recipe, RecipeCreate, Ingredient, IngredientCreate 
\ No newline at end of file
+from .recipe import Recipe, RecipeCreate, Ingredient, IngredientCreate, RecipeSearchResult, RecipeNutrition 
\ No newline at end of file
@@ -4,8 +4,9 @@ from datetime import datetime
 
 class IngredientBase(BaseModel):
     name: str
-    amount: str
-    unit: str
+    # 適量・少々などで分量や単位のない食材はNone（データベースの列もNULLを許す）
+    amount: Optional[str] = None
+    unit: Optional[str] = None
     calories: Optional[float] = None
     protein: Optional[float] = None
     fat: Optional[float] = None
@@ -20,6 +21,7 @@ class IngredientCreate(IngredientBase):
 
 class Ingredient(IngredientBase):
     id: int
+    amount_value: Optional[float] = None
 
     class Config:
         orm_mode = True
@@ -47,4 +49,24 @@ class Recipe(RecipeBase):
 
     class Config:
         orm_mode = True
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class RecipeSearchResult(BaseModel):
+    id: int
+    title: str
+    description: Optional[str] = None
+    snippet: str
+    score: float
+
+class NutritionValues(BaseModel):
+    calories: float
+    protein: float
+    fat: float
+    carbs: float
+
+class RecipeNutrition(BaseModel):
+    recipe_id: int
+    total: NutritionValues
+    per_serving: NutritionValues
+    # カロリーが未設定の食材の数
+    missing: int
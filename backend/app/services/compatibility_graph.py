@@ -0,0 +1,114 @@
+import os
+import time
+import threading
+import numpy as np
+from typing import List, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from ..models.recipe import ingredient_compatibility
+
+# スコアが未設定の組み合わせに使う値
+DEFAULT_SCORE = 1.0
+
+
+class CompatibilityGraph:
+    """食材の相性テーブルをCSR形式の配列で保持する
+
+    nodes:     相性データを持つ食材ID（昇順）
+    indptr:    nodes[i] の隣接リストは neighbors[indptr[i]:indptr[i + 1]]
+    neighbors: 相性の良い食材ID
+    scores:    neighbors に対応する compatibility_score
+
+    アプリが相性テーブルを書き換えるのは起動時の移行だけで、移行後に invalidate() を呼ぶ。
+    それ以外（SQLでの直接の更新など）の変更は refresh_interval 秒ごとの再読み込みで反映する。
+    """
+
+    def __init__(self, refresh_interval: float = 300):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._loaded_at = 0.0
+        self._rng = np.random.default_rng()
+        self.nodes = np.empty(0, dtype=np.int64)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.neighbors = np.empty(0, dtype=np.int64)
+        self.scores = np.empty(0, dtype=np.float32)
+
+    def invalidate(self):
+        """相性データが変更されたときに呼び出す（次回利用時に再読み込みする）"""
+        self._dirty = True
+
+    def ensure_loaded(self, db: Session):
+        if self._dirty or time.monotonic() - self._loaded_at > self.refresh_interval:
+            self.load(db)
+
+    def load(self, db: Session):
+        """相性テーブルを1クエリで読み込み、CSR配列を作り直す"""
+        rows = db.execute(select(
+            ingredient_compatibility.c.ingredient1_id,
+            ingredient_compatibility.c.ingredient2_id,
+            ingredient_compatibility.c.compatibility_score
+        )).all()
+        src = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        dst = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+        scores = np.fromiter(
+            (DEFAULT_SCORE if r[2] is None else r[2] for r in rows), dtype=np.float32, count=len(rows)
+        )
+
+        order = np.lexsort((dst, src))
+        src, dst, scores = src[order], dst[order], scores[order]
+        nodes, starts = np.unique(src, return_index=True)
+        indptr = np.append(starts, len(src)).astype(np.int64)
+
+        with self._lock:
+            self.nodes, self.indptr, self.neighbors, self.scores = nodes, indptr, dst, scores
+            self._dirty = False
+            self._loaded_at = time.monotonic()
+
+    def neighbors_of(self, ingredient_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """食材と相性の良い食材IDとスコアを返す"""
+        i = np.searchsorted(self.nodes, ingredient_id)
+        if i == len(self.nodes) or self.nodes[i] != ingredient_id:
+            return self.neighbors[:0], self.scores[:0]
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.neighbors[start:end], self.scores[start:end]
+
+    def score_candidates(self, ingredient_ids: List[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """複数の食材と相性の良い候補を集計する
+
+        戻り値は (候補ID, 相性の良い入力食材の数, スコアの合計) で、
+        多くの入力食材と相性の良い候補ほど先頭に来るよう並べる。
+        """
+        with self._lock:
+            parts = [self.neighbors_of(ingredient_id) for ingredient_id in ingredient_ids]
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = np.concatenate([p[0] for p in parts])
+        scores = np.concatenate([p[1] for p in parts])
+
+        # 入力食材自身は候補から除く
+        keep = ~np.isin(ids, np.asarray(ingredient_ids, dtype=np.int64))
+        ids, scores = ids[keep], scores[keep]
+        candidates, inverse = np.unique(ids, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(candidates))
+        totals = np.bincount(inverse, weights=scores, minlength=len(candidates))
+
+        order = np.lexsort((-totals, -counts))
+        return candidates[order], counts[order], totals[order]
+
+    def sample(self, ingredient_ids: List[int], k: int) -> List[int]:
+        """相性スコアで重み付けして候補を最大k件選ぶ（重複なし）"""
+        candidates, _, totals = self.score_candidates(ingredient_ids)
+        if len(candidates) == 0 or k <= 0:
+            return []
+        weights = np.clip(totals, 0, None)
+        if weights.sum() <= 0:
+            weights = np.ones(len(candidates))
+        # 重みが正の候補の数を超えて非復元抽出はできないため上限を揃える
+        size = min(k, int(np.count_nonzero(weights)))
+        chosen = self._rng.choice(candidates, size=size, replace=False, p=weights / weights.sum())
+        return [int(ingredient_id) for ingredient_id in chosen]
+
+
+compatibility_graph = CompatibilityGraph(float(os.getenv("COMPATIBILITY_REFRESH_INTERVAL", "300")))
+
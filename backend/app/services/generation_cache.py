@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+from .normalize import normalize_ingredient_name
+
+
+def normalize_ingredients(ingredients: List[str]) -> List[str]:
+    """食材リストを正規化（前後の空白除去・全角半角統一・重複除去・ソート）"""
+    normalized = set()
+    for name in ingredients:
+        name = normalize_ingredient_name(name)
+        if name:
+            normalized.add(name)
+    return sorted(normalized)
+
+
+def make_generation_key(ingredients: List[str], servings: int, model: str) -> str:
+    """正規化した食材・人数・モデルからキャッシュキーを作成"""
+    payload = json.dumps(
+        [normalize_ingredients(ingredients), servings, model],
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_variation_key(recipe: Dict, model: str) -> str:
+    """バリエーション生成のプロンプトに使う項目からキーを作成"""
+    payload = json.dumps(
+        ["variations", recipe["title"], recipe["description"], model],
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """生成結果の2層キャッシュ
+
+    1層目: プロセス内のTTL付きLRU
+    2層目: SQLiteファイル（再起動後も有効で、uvicornの複数ワーカー間で共有される）
+    """
+
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, path: str, max_size: int = 1024, memory_ttl: float = 3600, persistent_ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_size = max_size
+        self.memory_ttl = memory_ttl
+        self.persistent_ttl = persistent_ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3の接続はスレッド間で共有できないためスレッドごとに保持する
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS generation_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _get_memory(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < now:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _set_memory(self, key: str, value: str, now: float):
+        with self._lock:
+            self._memory[key] = (now + self.memory_ttl, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """キャッシュから値を取得（見つからない場合はNone）"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return json.loads(value)
+
+        row = self._connect().execute(
+            "SELECT value FROM generation_cache WHERE key = ? AND expires_at >= ?",
+            (key, now)
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.persistent_hits += 1
+        self._set_memory(key, row[0], now)
+        return json.loads(row[0])
+
+    def set(self, key: str, value):
+        now = time.time()
+        serialized = json.dumps(value, ensure_ascii=False)
+        self._set_memory(key, serialized, now)
+
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO generation_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, serialized, now + self.persistent_ttl)
+        )
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_INTERVAL == 0
+        if purge:
+            # 期限切れの行を定期的に削除
+            conn.execute("DELETE FROM generation_cache WHERE expires_at < ?", (now,))
+        conn.commit()
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.persistent_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.persistent_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+_generation_cache = None
+_generation_cache_lock = threading.Lock()
+
+
+def get_generation_cache() -> GenerationCache:
+    """GenerationCacheの共有インスタンス（最初に使われた時点で作成する）
+
+    作成時にSQLiteファイルを開くため、読み込み時には作らずに起動を軽くし、
+    生成を行わないプロセスでは作業ディレクトリにファイルを作らない。
+    """
+    global _generation_cache
+    if _generation_cache is None:
+        with _generation_cache_lock:
+            if _generation_cache is None:
+                _generation_cache = GenerationCache(
+                    path=os.getenv("GENERATION_CACHE_PATH", "./generation_cache.db"),
+                    max_size=int(os.getenv("GENERATION_CACHE_SIZE", "1024")),
+                    memory_ttl=float(os.getenv("GENERATION_CACHE_MEMORY_TTL", "3600")),
+                    persistent_ttl=float(os.getenv("GENERATION_CACHE_TTL", str(7 * 24 * 3600))),
+                )
+    return _generation_cache
@@ -0,0 +1,142 @@
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    # brotliがあればAccept-Encodingでbrを優先し、なければgzipのみ使う
+    import brotli
+except ImportError:
+    brotli = None
+
+# レスポンスの形式を変えた場合に上げる（ETagに含めてブラウザ・CDNのキャッシュを無効にする）
+CONTENT_VERSION = "1"
+RECIPE_CACHE_CONTROL = os.getenv("RECIPE_CACHE_CONTROL", "public, max-age=60, stale-while-revalidate=300")
+# これより小さいレスポンスは圧縮しない
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+
+
+def make_etag(*parts) -> str:
+    """更新日時などの値からETagを作る（圧縮の有無で本文が変わるため弱いETagにする）"""
+    digest = hashlib.blake2b(
+        "\x1f".join(str(part) for part in (CONTENT_VERSION,) + parts).encode("utf-8"), digest_size=12
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _to_utc(value: datetime) -> datetime:
+    # SQLiteから読んだタイムゾーンなしの日時はサーバーのローカル時刻として扱う
+    return value.astimezone(timezone.utc)
+
+
+def format_http_date(value: datetime) -> str:
+    return format_datetime(_to_utc(value).replace(microsecond=0), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """条件付きリクエストに対して304を返せるか（If-None-MatchがあればIf-Modified-Sinceより優先する）"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # 弱い比較（W/の有無は無視する）
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return _to_utc(last_modified).replace(microsecond=0) <= since
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime]) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": RECIPE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_http_date(last_modified)
+    return headers
+
+
+def not_modified_response(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+def _accepted_encodings(request: Request) -> Dict[str, float]:
+    encodings = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        if name:
+            encodings[name.lower()] = quality
+    return encodings
+
+
+def compress_body(request: Request, body: bytes) -> Tuple[bytes, Optional[str]]:
+    """Accept-Encodingに合わせて本文を圧縮する（戻り値は本文とContent-Encoding）"""
+    if len(body) < COMPRESS_MIN_SIZE:
+        return body, None
+    accepted = _accepted_encodings(request)
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return brotli.compress(body, quality=4), "br"
+    if accepted.get("gzip", 0) > 0:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
+
+
+class RenderedCache:
+    """レシピIDごとにシリアライズ済みのレスポンス本文を保持するLRUキャッシュ
+
+    エントリはETagと一緒に保持し、ETagが一致する場合だけ使う。
+    """
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, Tuple[str, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, recipe_id: int, etag: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(recipe_id)
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(recipe_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, recipe_id: int, etag: str, body: bytes):
+        with self._lock:
+            self._entries[recipe_id] = (etag, body)
+            self._entries.move_to_end(recipe_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, recipe_id: int):
+        """レシピの更新・削除時に呼び出す"""
+        with self._lock:
+            self._entries.pop(recipe_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+rendered_cache = RenderedCache(int(os.getenv("RENDERED_CACHE_SIZE", "512")))
@@ -0,0 +1,278 @@
+import io
+import os
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from .single_flight import async_single_flight
+
+# 元画像とサムネイルの保存先
+IMAGE_DIR = os.getenv("IMAGE_DIR", "./images")
+# サムネイルの合計サイズの上限（超えたら最後に使われてから最も時間が経ったものから削除し、次に使われた時に作り直す）
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_MB", "512")) * 1024 * 1024
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_MB", "10")) * 1024 * 1024
+# デコード・縮小を行うプロセス数
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# 展開後の画素数の上限（圧縮率の極端に高い画像でメモリを使い果たさないようにする）
+IMAGE_MAX_PIXELS = 50_000_000
+
+# サムネイルの幅（px）。縦横比は元の画像のままにし、元より大きくはしない
+THUMBNAIL_SIZES = {"sm": 320, "md": 640, "lg": 1280}
+# 形式ごとの拡張子・Content-Type・エンコードの設定
+THUMBNAIL_FORMATS = {
+    "webp": ("webp", "image/webp", {"format": "WEBP", "quality": 80, "method": 4}),
+    "jpeg": ("jpg", "image/jpeg", {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}),
+}
+# 画像のURLは内容のハッシュから決まり、同じURLの内容は変わらないため長期間キャッシュさせる
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# ルーターは /api/v1 にマウントされる
+IMAGE_URL_PREFIX = "/api/v1/images/"
+
+
+def image_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def image_url(image_hash: str) -> str:
+    return IMAGE_URL_PREFIX + image_hash
+
+
+def thumbnail_urls(image_hash: str) -> Dict[str, Dict[str, str]]:
+    """サイズ・形式ごとのサムネイルのURL"""
+    return {
+        size: {fmt: f"{image_url(image_hash)}?size={size}&format={fmt}" for fmt in THUMBNAIL_FORMATS}
+        for size in THUMBNAIL_SIZES
+    }
+
+
+def render_thumbnails(data: bytes) -> Dict[Tuple[str, str], bytes]:
+    """画像をデコードし、全サイズ・全形式のサムネイルを作る（ワーカープロセスで実行する）
+
+    JPEGは必要な大きさまでしか展開せず、小さいサイズは1つ大きいサイズから縮小する。
+    読み込めない画像はValueErrorにする（Pillowの例外はプロセス間で受け渡せないものがあるため）。
+    """
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    largest = max(THUMBNAIL_SIZES.values())
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            source.draft("RGB", (largest, largest))
+            image = ImageOps.exif_transpose(source)
+            if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+                # 透過部分は白で塗る（JPEGには透過がないため両形式で揃える）
+                rgba = image.convert("RGBA")
+                image = Image.new("RGB", rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel("A"))
+            else:
+                image = image.convert("RGB")
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError(f"画像を読み込めません: {e}")
+
+    results = {}
+    for size, width in sorted(THUMBNAIL_SIZES.items(), key=lambda item: -item[1]):
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for fmt, (_, _, options) in THUMBNAIL_FORMATS.items():
+            buf = io.BytesIO()
+            image.save(buf, **options)
+            results[(size, fmt)] = buf.getvalue()
+    return results
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ImageStore:
+    """内容のハッシュをファイル名にして元画像とサムネイルを保存する
+
+    元画像は削除しない。サムネイルはキャッシュとして扱い、合計がmax_bytesを超えたら
+    最後に使われてから最も時間が経ったものから削除する（使うたびに更新日時を進めるため、
+    再起動後も使われた順序を引き継ぐ）。
+    """
+
+    def __init__(self, root: str = IMAGE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._thumbnails: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def original_path(self, image_hash: str) -> str:
+        return os.path.join(self.root, "originals", image_hash[:2], image_hash)
+
+    def thumbnail_path(self, image_hash: str, size: str, fmt: str) -> str:
+        ext = THUMBNAIL_FORMATS[fmt][0]
+        return os.path.join(self.root, "thumbnails", image_hash[:2], f"{image_hash}-{size}.{ext}")
+
+    def _load_locked(self):
+        # 起動時間に影響しないよう、最初に使われた時に保存済みのサムネイルを読み込む
+        if self._loaded:
+            return
+        self._loaded = True
+        entries = []
+        for directory, _, names in os.walk(os.path.join(self.root, "thumbnails")):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self._thumbnails[path] = size
+            self._total += size
+
+    def has_original(self, image_hash: str) -> bool:
+        return os.path.exists(self.original_path(image_hash))
+
+    def read_original(self, image_hash: str) -> bytes:
+        with open(self.original_path(image_hash), "rb") as f:
+            return f.read()
+
+    def save_original(self, image_hash: str, data: bytes):
+        path = self.original_path(image_hash)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+
+    def get_thumbnail(self, image_hash: str, size: str, fmt: str) -> Optional[str]:
+        """保存済みのサムネイルのパス（削除済み・未作成ならNone）"""
+        path = self.thumbnail_path(image_hash, size, fmt)
+        with self._lock:
+            self._load_locked()
+            tracked = path in self._thumbnails
+            if tracked:
+                self._thumbnails.move_to_end(path)
+        try:
+            os.utime(path)
+            file_size = os.path.getsize(path)
+        except FileNotFoundError:
+            # 未作成か、他のプロセスが削除した
+            with self._lock:
+                self._total -= self._thumbnails.pop(path, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            if not tracked and path not in self._thumbnails:
+                # 他のプロセスが作成した
+                self._thumbnails[path] = file_size
+                self._total += file_size
+            self.hits += 1
+        return path
+
+    def put_thumbnails(self, image_hash: str, thumbnails: Dict[Tuple[str, str], bytes]):
+        written = []
+        for (size, fmt), data in thumbnails.items():
+            path = self.thumbnail_path(image_hash, size, fmt)
+            _write_atomic(path, data)
+            written.append((path, len(data)))
+        evicted = []
+        with self._lock:
+            self._load_locked()
+            for path, size in written:
+                self._total += size - self._thumbnails.pop(path, 0)
+                self._thumbnails[path] = size
+            while self._total > self.max_bytes and len(self._thumbnails) > len(written):
+                path, size = self._thumbnails.popitem(last=False)
+                self._total -= size
+                self.evictions += 1
+                evicted.append(path)
+        for path in evicted:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._load_locked()
+            return {
+                "thumbnails": len(self._thumbnails),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+image_store = ImageStore()
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    """画像処理用のプロセスプール（最初に使われた時に作成する）
+
+    fork したプロセスにイベントループやDB接続の状態を持ち込まないようspawnで起動する。
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown_image_executor():
+    """作成済みであればプロセスプールを終了する"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _render(image_hash: str, data: Optional[bytes] = None):
+    async def render():
+        source = data if data is not None else await run_in_threadpool(image_store.read_original, image_hash)
+        thumbnails = await asyncio.get_running_loop().run_in_executor(get_image_executor(), render_thumbnails, source)
+        await run_in_threadpool(image_store.put_thumbnails, image_hash, thumbnails)
+
+    # 同じ画像の同時アップロード・同時アクセスでは1回だけ処理する
+    await async_single_flight.do(f"image:{image_hash}", render)
+
+
+async def add_image(data: bytes) -> str:
+    """画像を保存してサムネイルを作り、ハッシュを返す（読み込めない画像はValueError）"""
+    if len(data) > IMAGE_MAX_UPLOAD_BYTES:
+        raise ValueError(f"画像は{IMAGE_MAX_UPLOAD_BYTES // (1024 * 1024)}MBまでです")
+    key = image_hash(data)
+    # 先にサムネイルを作り、読み込める画像だけを元画像として保存する
+    await _render(key, data)
+    await run_in_threadpool(image_store.save_original, key, data)
+    return key
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def read_thumbnail(image_hash: str, size: str, fmt: str) -> Optional[bytes]:
+    """サムネイルの内容（削除済みなら元画像から作り直す。元画像がなければNone）"""
+    for _ in range(2):
+        path = image_store.get_thumbnail(image_hash, size, fmt)
+        if path is None:
+            if not await run_in_threadpool(image_store.has_original, image_hash):
+                return None
+            await _render(image_hash)
+            path = image_store.thumbnail_path(image_hash, size, fmt)
+        try:
+            return await run_in_threadpool(_read_file, path)
+        except FileNotFoundError:
+            # 読み込む前に上限を超えて削除された
+            continue
+    return None
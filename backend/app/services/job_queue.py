@@ -0,0 +1,135 @@
+import os
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from fastapi.concurrency import run_in_threadpool
+from ..database import SessionLocal
+from ..crud.job import claim_job, renew_lease, finish_job, release_job, get_job, count_jobs
+from ..models.job import SUCCEEDED, FAILED
+from .metrics import GENERATION_JOBS
+
+# 1プロセスで同時に実行するジョブ数
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# 実行中のジョブのリース（この間に延長されなければ、プロセスが停止したものとして他のワーカーが再実行する）
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# 他のプロセスが登録したジョブを確認する間隔
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+
+def _with_session(fn: Callable, *args, **kwargs):
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+def _call(fn: Callable, *args, **kwargs) -> Awaitable:
+    """ジョブテーブルの操作を専用のセッションでスレッドプールで実行する"""
+    return run_in_threadpool(_with_session, fn, *args, **kwargs)
+
+
+class JobWorkerPool:
+    """generation_jobs のジョブを実行するワーカー
+
+    ジョブはデータベースから取り出すため、再起動前に登録されたジョブや
+    他のプロセスが登録したジョブも実行する。実行中はリースを延長し続け、
+    停止時は実行中のジョブを未実行に戻す（異常終了した場合はリースが切れた後に再実行される）。
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, lease_seconds: float = JOB_LEASE_SECONDS,
+                 poll_seconds: float = JOB_POLL_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self._handler: Optional[Callable[[Dict], Awaitable[Dict]]] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: Set[str] = set()
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self, handler: Callable[[Dict], Awaitable[Dict]]):
+        """ワーカーを起動（handlerはジョブ（request・recipe_idなど）を受け取り、レスポンス本文を返す）"""
+        self._handler = handler
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def notify(self):
+        """ジョブを登録したことをワーカーに知らせる"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def wait(self, job_id: str) -> Dict:
+        """ジョブが終わるまで待って返す（他のプロセスで実行中のジョブは一定間隔で確認する）"""
+        while True:
+            job = await _call(get_job, job_id)
+            if job is None or job["status"] in (SUCCEEDED, FAILED):
+                self._finished.pop(job_id, None)
+                return job
+            event = self._finished.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            # 取り出しの前にクリアし、取り出しと待機の間の通知を取りこぼさないようにする
+            self._wakeup.clear()
+            try:
+                job = await _call(claim_job, self.lease_seconds, self.max_attempts)
+            except Exception as e:
+                print(f"ジョブの取り出しに失敗しました: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict):
+        job_id, lease_token = job["id"], job["lease_token"]
+        self._running.add(job_id)
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, lease_token))
+        try:
+            result = await self._handler(job)
+        except asyncio.CancelledError:
+            # 停止時は次に起動したワーカーが再実行する
+            await asyncio.shield(_call(release_job, job_id, lease_token))
+            GENERATION_JOBS.inc("released")
+            raise
+        except Exception as e:
+            finished = await _call(finish_job, job_id, lease_token, error=str(e))
+            GENERATION_JOBS.inc("failed" if finished else "lost")
+        else:
+            finished = await _call(finish_job, job_id, lease_token, result=result)
+            GENERATION_JOBS.inc("succeeded" if finished else "lost")
+        finally:
+            heartbeat.cancel()
+            self._running.discard(job_id)
+            event = self._finished.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    async def _heartbeat(self, job_id: str, lease_token: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await _call(renew_lease, job_id, lease_token, self.lease_seconds)
+            except Exception as e:
+                print(f"ジョブのリースの延長に失敗しました: {e}")
+
+    async def stats(self) -> Dict:
+        return {"workers": len(self._tasks), "running": len(self._running), "jobs": await _call(count_jobs)}
+
+
+job_workers = JobWorkerPool()
@@ -0,0 +1,136 @@
+import re
+import json
+from typing import Any, List, Optional, Tuple
+
+# ```json ... ``` のコードブロック
+_FENCE = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|$)", re.DOTALL)
+# 値の位置にある引用符なしの分数（例: "amount": 1/4 や 1 1/2）
+_BARE_FRACTION = re.compile(r"(?<=[:\[,])(\s*)(\d+(?:\s+\d+)?\s*/\s*\d+)(?=\s*(?:[,}\]]|$))")
+# 閉じ括弧の直前の余分なカンマ
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+# 途中で切れた末尾（カンマ・コロン・書きかけのキーワードや数値）
+_DANGLING = re.compile(r"(?:,|:|\btru|\btr|\bt|\bfals|\bfal|\bfa|\bf|\bnul|\bnu|\bn|-|\d+\.)\s*$")
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _quote_fraction(match) -> str:
+    return match.group(1) + '"' + " ".join(match.group(2).replace("/", " / ").split()).replace(" / ", "/") + '"'
+
+
+def _fix_chunk(chunk: str) -> str:
+    """文字列の外側の部分だけに適用する修正"""
+    chunk = _BARE_FRACTION.sub(_quote_fraction, chunk)
+    return _TRAILING_COMMA.sub(r"\1", chunk)
+
+
+def _scan(text: str, start: int) -> Tuple[List[str], List[str], bool, List[Tuple[int, List[str]]]]:
+    """startの括弧から対応する閉じ括弧までを1文字ずつ走査して修正済みの断片を作る
+
+    戻り値は (修正済みの断片, 閉じられていない括弧, 文字列の途中で終わったか, 切り詰め可能な位置)。
+    切り詰め可能な位置は、要素が1つ完結した直後の断片の数とその時点の未閉じの括弧。
+    """
+    out: List[str] = []
+    chunk: List[str] = []
+    stack: List[str] = []
+    cut_points: List[Tuple[int, List[str]]] = []
+    in_string = False
+    escape = False
+
+    def flush_chunk():
+        if chunk:
+            out.append(_fix_chunk("".join(chunk)))
+            chunk.clear()
+
+    for i in range(start, len(text)):
+        c = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+            elif c == "\n":
+                # 文字列中の生の改行はJSONとして不正なのでエスケープする
+                c = "\\n"
+            out.append(c)
+            continue
+
+        if c == '"':
+            flush_chunk()
+            in_string = True
+            out.append(c)
+        elif c in "{[":
+            stack.append(c)
+            chunk.append(c)
+        elif c in "}]":
+            if stack and _CLOSERS[stack[-1]] == c:
+                stack.pop()
+            chunk.append(c)
+            flush_chunk()
+            if not stack:
+                return out, stack, False, cut_points
+            cut_points.append((len(out), list(stack)))
+        elif c == ",":
+            flush_chunk()
+            cut_points.append((len(out), list(stack)))
+            chunk.append(c)
+        else:
+            chunk.append(c)
+
+    flush_chunk()
+    return out, stack, in_string, cut_points
+
+
+def _close(text: str, stack: List[str]) -> str:
+    text = _DANGLING.sub("", text.rstrip())
+    text = _TRAILING_COMMA.sub(r"\1", text)
+    return text + "".join(_CLOSERS[c] for c in reversed(stack))
+
+
+def salvage_json(text: str, expect: str = "object") -> Tuple[Any, bool]:
+    """LLMの出力から壊れたJSONを可能な範囲で復元する
+
+    前後の説明文・コードブロックを取り除き、引用符なしの分数や余分なカンマを直し、
+    max_tokensで途中で切れた構造は閉じ括弧を補って完結させる（書きかけの要素は捨てる）。
+    expectは "object"（{...}）または "array"（[...]）。
+    戻り値は (値, 修復が必要だったか)。復元できない場合はValueErrorを送出する。
+    """
+    try:
+        value = json.loads(text)
+        if isinstance(value, dict if expect == "object" else list):
+            return value, False
+    except ValueError:
+        pass
+
+    fence = _FENCE.search(text)
+    if fence:
+        text = fence.group(1)
+    opener = "{" if expect == "object" else "["
+    start = text.find(opener)
+    if start == -1:
+        raise ValueError("JSONの開始位置が見つかりません")
+
+    pieces, stack, in_string, cut_points = _scan(text, start)
+    candidates: List[str] = []
+    if not stack:
+        candidates.append("".join(pieces))
+    else:
+        # 途中で切れている場合はまず閉じ括弧を補って完結させ、だめなら最後に完結した要素の位置まで切り詰める。
+        # 文字列の途中で切れた場合は閉じると別の値（"砂糖" → "砂"）になるため、切り詰めを先に試す
+        closed = _close("".join(pieces) + ('"' if in_string else ""), stack)
+        if not in_string:
+            candidates.append(closed)
+        for position, cut_stack in reversed(cut_points[-5:]):
+            candidates.append(_close("".join(pieces[:position]), cut_stack))
+        if in_string:
+            candidates.append(closed)
+
+    error: Optional[ValueError] = None
+    for candidate in candidates:
+        try:
+            return json.loads(candidate), True
+        except ValueError as e:
+            error = e
+    raise ValueError(f"JSONを復元できませんでした: {error}")
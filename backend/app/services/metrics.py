@@ -0,0 +1,224 @@
+import os
+import re
+import time
+import asyncio
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from .profiler import SamplingProfiler
+
+# レイテンシのヒストグラムのバケット（秒）
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 受け付けるX-Request-IDの形式（プロファイルのファイル名にも使うため制限する）
+_TRACE_ID = re.compile(r"[\w\-]{1,64}")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: Tuple[str, str] = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # ラベルごとに [バケットごとの件数..., 合計, 件数]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, entry in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, entry):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', bound))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', '+Inf'))} {entry[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {entry[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {entry[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTPリクエストの処理時間", ("method", "handler", "status"))
+STAGE_SECONDS = Histogram("recipe_stage_duration_seconds", "処理段階ごとの所要時間", ("stage",))
+LLM_SECONDS = Histogram("openai_request_duration_seconds", "OpenAI APIの応答時間（全体）", ("operation",))
+LLM_FIRST_TOKEN_SECONDS = Histogram("openai_time_to_first_token_seconds", "OpenAI APIの最初のトークンまでの時間", ("operation",))
+LLM_TOKENS = Counter("openai_tokens_total", "OpenAI APIで消費したトークン数", ("operation", "kind"))
+# outcome: clean（そのまま読めた）/ salvaged（ローカルで修復）/ failed（修復できず）
+LLM_JSON_PARSE = Counter("llm_json_parse_total", "LLMの出力したJSONの解析結果", ("operation", "outcome"))
+# outcome: success / failed（修復を依頼した再問い合わせの結果）
+LLM_JSON_REPAIR = Counter("llm_json_repair_total", "壊れたJSONの修復の再問い合わせ結果", ("operation", "outcome"))
+# reason: generation_cache（同じ食材・人数の生成結果）/ near_duplicate（食材がほぼ同じ保存済みレシピ）
+# / idempotency（Idempotency-Keyが同じ再送）
+LLM_CALLS_AVOIDED = Counter("llm_calls_avoided_total", "保存済みの結果を使って省略したレシピ生成の呼び出し数", ("reason",))
+# outcome: succeeded / failed / released（停止時に未実行へ戻した）
+# / lost（リースが切れて他のワーカーが取り出したため結果を捨てた）
+GENERATION_JOBS = Counter("generation_jobs_total", "バックグラウンドで実行したレシピ生成ジョブ数", ("outcome",))
+METRICS = [
+    REQUEST_SECONDS, STAGE_SECONDS, LLM_SECONDS, LLM_FIRST_TOKEN_SECONDS, LLM_TOKENS, LLM_JSON_PARSE, LLM_JSON_REPAIR,
+    LLM_CALLS_AVOIDED, GENERATION_JOBS
+]
+
+
+class Trace:
+    """1リクエスト分の段階ごとの所要時間"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.stages: List[Tuple[str, float]] = []
+
+    def server_timing(self) -> str:
+        """Server-Timingヘッダーの値（ブラウザの開発者ツールで段階ごとの時間を確認できる）"""
+        return ", ".join(f"{name};dur={duration * 1000:.1f}" for name, duration in self.stages)
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def record_stage(name: str, duration: float):
+    STAGE_SECONDS.observe(duration, name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.stages.append((name, duration))
+
+
+@contextmanager
+def stage(name: str):
+    """with文で囲んだ処理の時間を段階名ごとに記録"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_usage(operation: str, usage):
+    """レスポンスのusageからトークン数を記録"""
+    if usage is None:
+        return
+    LLM_TOKENS.inc(operation, "prompt", amount=usage.prompt_tokens)
+    LLM_TOKENS.inc(operation, "completion", amount=usage.completion_tokens)
+
+
+def render_metrics() -> str:
+    """Prometheusのテキスト形式で全メトリクスを出力"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """リクエストごとにトレースIDを割り当て、処理時間を記録するASGIミドルウェア
+
+    X-Request-IDヘッダーがあればそれをトレースIDとして使い、レスポンスにも付ける。
+    PROFILING_ENABLED=1 の場合、X-Profile: 1 を付けたリクエストだけサンプリング
+    プロファイラーを動かし、結果をPROFILE_DIRに<トレースID>.foldedとして保存する。
+    ストリーミングレスポンスも本文を送り終えるまでを計測する。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.profiling_enabled = os.getenv("PROFILING_ENABLED") == "1"
+        self.profile_dir = os.getenv("PROFILE_DIR", "./profiles")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id = headers.get(b"x-request-id", b"").decode("latin-1")
+        trace = Trace(trace_id if _TRACE_ID.fullmatch(trace_id) else uuid.uuid4().hex)
+        token = _current_trace.set(trace)
+        profiler = None
+        if self.profiling_enabled and headers.get(b"x-profile") == b"1":
+            profiler = SamplingProfiler()
+            profiler.start()
+
+        started = time.perf_counter()
+        state = {"status": 500, "finished": False}
+
+        def save_profile() -> str:
+            profiler.stop()
+            return profiler.save(self.profile_dir, trace.trace_id)
+
+        async def finish():
+            if state["finished"]:
+                return
+            state["finished"] = True
+            endpoint = scope.get("endpoint")
+            handler = getattr(endpoint, "__name__", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], handler, str(state["status"]))
+            if profiler is not None:
+                # スレッドの終了待ちとファイルの書き込みで他のリクエストを止めないようスレッドで行う
+                path = await asyncio.to_thread(save_profile)
+                print(f"プロファイルを保存しました: {path}")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                response_headers = list(message.get("headers") or [])
+                response_headers.append((b"x-request-id", trace.trace_id.encode("latin-1")))
+                if trace.stages:
+                    response_headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = dict(message, headers=response_headers)
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                await finish()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            await finish()
+            _current_trace.reset(token)
@@ -0,0 +1,149 @@
+import os
+import hashlib
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, insert
+from sqlalchemy.orm import Session
+from ..models.recipe import recipe_minhash
+from .generation_cache import normalize_ingredients
+from .pantry_index import pantry_index
+
+# シグネチャの長さとLSHのバンド分割（変える場合は recipe_minhash を作り直す）
+# 8バンド×4行では、Jaccard係数0.6で約67%、0.75で約95%、0.8で約98%の確率で候補になる
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+# 保存済みのレシピを使う食材のJaccard係数の下限
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.75"))
+
+
+def _signature(names: List[str]) -> bytes:
+    # 食材ごとにshake_128でNUM_PERM個の独立した32bitハッシュ値を作り、位置ごとの最小値をとる
+    # （プロセスによらず同じ値になるため保存したシグネチャと比較できる）
+    hashes = [array("I", hashlib.shake_128(name.encode("utf-8")).digest(NUM_PERM * 4)) for name in names]
+    return array("I", map(min, zip(*hashes))).tobytes()
+
+
+def minhash_row(recipe_id: int, ingredients: Iterable[str]) -> Optional[Dict]:
+    """recipe_minhash に保存する行（食材がない場合はNone）"""
+    names = normalize_ingredients(list(ingredients))
+    if not names:
+        return None
+    return {"recipe_id": recipe_id, "ingredients": "\n".join(names), "signature": _signature(names)}
+
+
+def _band_keys(signature: bytes) -> List[int]:
+    width = ROWS * 4
+    return [hash((band, signature[band * width:(band + 1) * width])) for band in range(BANDS)]
+
+
+def ensure_minhash_table(db: Session):
+    recipe_minhash.create(bind=db.get_bind(), checkfirst=True)
+
+
+class NearDuplicateIndex:
+    """元になった食材がほぼ同じ保存済みレシピを探すLSHインデックス
+
+    MinHashシグネチャをバンドに分け、いずれかのバンドが一致したレシピだけを候補にするため、
+    全件と比較せずに検索できる。候補は食材集合の実際のJaccard係数で確かめる。
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self._buckets: Dict[int, List[int]] = {}
+        self._entries: Dict[int, Tuple[str, List[int]]] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches = 0
+
+    def load(self, db: Session):
+        """保存済みのシグネチャから作り直す
+
+        シグネチャのないレシピ（この機能より前に保存されたもの）はレシピの食材から計算して保存する。
+        食材はpantry_indexから取得するため、pantry_indexを先に読み込んでおくこと。
+        """
+        ensure_minhash_table(db)
+        rows = {row["recipe_id"]: row for row in db.execute(select(recipe_minhash)).mappings()}
+        missing = []
+        for recipe_id in pantry_index.recipe_ids():
+            if recipe_id not in rows:
+                row = minhash_row(recipe_id, pantry_index.ingredients(recipe_id))
+                if row is not None:
+                    missing.append(row)
+        if missing:
+            db.execute(insert(recipe_minhash), missing)
+            db.commit()
+
+        buckets: Dict[int, List[int]] = {}
+        entries: Dict[int, Tuple[str, List[int]]] = {}
+        for row in list(rows.values()) + missing:
+            keys = _band_keys(row["signature"])
+            entries[row["recipe_id"]] = (row["ingredients"], keys)
+            for key in keys:
+                buckets.setdefault(key, []).append(row["recipe_id"])
+        with self._lock:
+            self._buckets = buckets
+            self._entries = entries
+
+    def _remove_locked(self, recipe_id: int):
+        entry = self._entries.pop(recipe_id, None)
+        if entry is None:
+            return
+        for key in entry[1]:
+            bucket = self._buckets[key]
+            bucket.remove(recipe_id)
+            if not bucket:
+                del self._buckets[key]
+
+    def set_recipe(self, recipe_id: int, row: Optional[Dict]):
+        """保存した recipe_minhash の行を登録（更新時は置き換え、Noneなら削除）"""
+        with self._lock:
+            self._remove_locked(recipe_id)
+            if row is None:
+                return
+            keys = _band_keys(row["signature"])
+            self._entries[recipe_id] = (row["ingredients"], keys)
+            for key in keys:
+                self._buckets.setdefault(key, []).append(recipe_id)
+
+    def remove_recipe(self, recipe_id: int):
+        with self._lock:
+            self._remove_locked(recipe_id)
+
+    def find(self, ingredients: Iterable[str], threshold: Optional[float] = None) -> Optional[Tuple[int, float]]:
+        """元になった食材とのJaccard係数がthreshold以上で最も近いレシピの (ID, 係数)。なければNone"""
+        names = normalize_ingredients(list(ingredients))
+        if not names:
+            return None
+        threshold = self.threshold if threshold is None else threshold
+        query = set(names)
+        best = None
+        with self._lock:
+            self.lookups += 1
+            candidates = set()
+            for key in _band_keys(_signature(names)):
+                candidates.update(self._buckets.get(key, ()))
+            for recipe_id in candidates:
+                stored = self._entries[recipe_id][0].split("\n")
+                common = len(query.intersection(stored))
+                similarity = common / (len(query) + len(stored) - common)
+                # 同じ係数なら新しいレシピを優先する
+                if similarity >= threshold and (best is None or (similarity, recipe_id) > (best[1], best[0])):
+                    best = (recipe_id, similarity)
+            if best is not None:
+                self.matches += 1
+        return best
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "recipes": len(self._entries),
+                "buckets": len(self._buckets),
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "matches": self.matches,
+            }
+
+
+near_duplicate_index = NearDuplicateIndex()
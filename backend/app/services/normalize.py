@@ -0,0 +1,6 @@
+import unicodedata
+
+
+def normalize_ingredient_name(name: str) -> str:
+    """食材名を正規化（全角半角の統一と前後の空白除去）"""
+    return unicodedata.normalize("NFKC", name).strip()
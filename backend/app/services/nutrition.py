@@ -0,0 +1,138 @@
+import re
+import unicodedata
+from typing import Dict, List, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from ..models.recipe import Recipe, recipe_ingredient
+
+NUTRIENTS = ("calories", "protein", "fat", "carbs")
+
+# 「1と1/2」「1 1/2」などの帯分数
+_MIXED = re.compile(r"^(\d+(?:\.\d+)?)\s*(?:と|\s)\s*(\d+)\s*/\s*(\d+)$")
+_FRACTION = re.compile(r"^(\d+)\s*/\s*(\d+)$")
+_NUMBER = re.compile(r"^\d+(?:\.\d+)?$")
+# 「2〜3」「2-3」などの範囲（長音符「ー」は語の一部のことがあるため区切りにしない）
+_RANGE = re.compile(r"^(.+?)\s*[〜~\-–－]\s*(.+)$")
+
+
+def parse_amount(amount) -> Optional[float]:
+    """分量の文字列を数値に変換（適量・少々など数値にできないものはNone）"""
+    if amount is None:
+        return None
+    if isinstance(amount, (int, float)):
+        return float(amount)
+    # 全角数字や「½」をASCIIに揃える
+    text = unicodedata.normalize("NFKC", str(amount)).replace("⁄", "/").strip()
+    text = re.sub(r"(約|程度|くらい|ぐらい|強|弱)", "", text).strip()
+    if not text:
+        return None
+
+    if _NUMBER.match(text):
+        return float(text)
+    match = _FRACTION.match(text)
+    if match:
+        denominator = int(match.group(2))
+        return int(match.group(1)) / denominator if denominator else None
+    match = _MIXED.match(text)
+    if match:
+        denominator = int(match.group(3))
+        return float(match.group(1)) + int(match.group(2)) / denominator if denominator else None
+    match = _RANGE.match(text)
+    if match:
+        low, high = parse_amount(match.group(1)), parse_amount(match.group(2))
+        if low is not None and high is not None:
+            return (low + high) / 2
+    return None
+
+
+def format_amount(value: float) -> str:
+    """数値の分量を表示用の文字列に変換（1/2, 1/3, 1/4 単位は分数で表す）"""
+    for denominator in (2, 3, 4):
+        scaled = value * denominator
+        if abs(scaled - round(scaled)) < 1e-6:
+            whole, numerator = divmod(int(round(scaled)), denominator)
+            if numerator == 0:
+                return str(whole)
+            if whole == 0:
+                return f"{numerator}/{denominator}"
+            return f"{whole}と{numerator}/{denominator}"
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def compute_nutrition(db: Session, recipe_ids: List[int]) -> Dict[int, Dict]:
+    """複数レシピの栄養価の合計と1人分の値をまとめて計算
+
+    対象レシピの食材行を1クエリで取得し、栄養素ごとの列配列をNumPyで集計する。
+    値が未設定の食材は0として扱い、カロリーが未設定の食材の数をmissingに含める。
+    """
+    if not recipe_ids:
+        return {}
+    servings = dict(db.execute(
+        select(Recipe.id, Recipe.servings).where(Recipe.id.in_(recipe_ids))
+    ).all())
+    rows = db.execute(
+        select(recipe_ingredient.c.recipe_id, *(recipe_ingredient.c[n] for n in NUTRIENTS))
+        .where(recipe_ingredient.c.recipe_id.in_(list(servings)))
+    ).all()
+
+    # NumPyは読み込みに時間がかかるため、起動時ではなく最初の集計時に読み込む
+    import numpy as np
+    ids = np.fromiter(servings.keys(), dtype=np.int64, count=len(servings))
+    result = {
+        int(recipe_id): {"total": dict.fromkeys(NUTRIENTS, 0.0), "per_serving": dict.fromkeys(NUTRIENTS, 0.0), "missing": 0}
+        for recipe_id in ids
+    }
+    if not rows:
+        return result
+
+    # 行ごとのレシピIDをレシピの添字に変換
+    row_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    order = np.argsort(ids)
+    index = order[np.searchsorted(ids, row_ids, sorter=order)]
+    values = np.array([row[1:] for row in rows], dtype=np.float64)
+    missing = np.isnan(values)
+
+    totals = np.stack([
+        np.bincount(index, weights=np.where(missing[:, i], 0.0, values[:, i]), minlength=len(ids))
+        for i in range(len(NUTRIENTS))
+    ], axis=1)
+    missing_counts = np.bincount(index, weights=missing[:, 0], minlength=len(ids))
+    serving_counts = np.array([servings[int(i)] or 1 for i in ids], dtype=np.float64)
+    per_serving = totals / serving_counts[:, None]
+
+    for position, recipe_id in enumerate(ids):
+        entry = result[int(recipe_id)]
+        entry["total"] = {n: round(float(totals[position, i]), 1) for i, n in enumerate(NUTRIENTS)}
+        entry["per_serving"] = {n: round(float(per_serving[position, i]), 1) for i, n in enumerate(NUTRIENTS)}
+        entry["missing"] = int(missing_counts[position])
+    return result
+
+
+def scale_recipe(recipe: Dict, servings: int) -> Dict:
+    """レシピの分量と栄養価を指定した人数分に換算（LLMは呼ばない）
+
+    分量は保存時に数値化したamount_valueを使い、数値にできない分量（適量など）はそのまま残す。
+    """
+    factor = servings / (recipe["servings"] or 1)
+    ingredients = recipe["ingredients"]
+    import numpy as np
+    amounts = np.array(
+        [np.nan if ing["amount_value"] is None else ing["amount_value"] for ing in ingredients],
+        dtype=np.float64
+    ) * factor
+    nutrients = np.array(
+        [[np.nan if ing[n] is None else ing[n] for n in NUTRIENTS] for ing in ingredients],
+        dtype=np.float64
+    ).reshape(len(ingredients), len(NUTRIENTS)) * factor
+
+    scaled = dict(recipe, servings=servings, ingredients=[])
+    for i, ingredient in enumerate(ingredients):
+        ingredient = dict(ingredient)
+        if not np.isnan(amounts[i]):
+            ingredient["amount"] = format_amount(float(amounts[i]))
+            ingredient["amount_value"] = float(amounts[i])
+        for j, n in enumerate(NUTRIENTS):
+            if not np.isnan(nutrients[i, j]):
+                ingredient[n] = round(float(nutrients[i, j]), 1)
+        scaled["ingredients"].append(ingredient)
+    return scaled
@@ -1,114 +1,279 @@
 import os
 import json
-from openai import OpenAI
-from typing import List, Dict
-from dotenv import load_dotenv
+import asyncio
+from typing import List, Dict, AsyncIterator, Callable, NamedTuple
 import traceback
 import re
+import time
+from .generation_cache import get_generation_cache, make_generation_key, make_variation_key
+from .single_flight import single_flight, async_single_flight
+from .rate_limiter import rate_limit_scheduler, estimate_tokens, INTERACTIVE
+from .tokenizer import count_message_tokens, count_tokens
+from .metrics import stage, record_stage, record_usage, LLM_SECONDS, LLM_FIRST_TOKEN_SECONDS, LLM_JSON_PARSE, LLM_JSON_REPAIR, LLM_CALLS_AVOIDED
+from .json_salvage import salvage_json
+from .prompts import (
+    PROMPT_VARIANT, build_recipe_messages, build_variation_messages, build_repair_messages,
+    recipe_max_tokens, variation_max_tokens
+)
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+MAX_TOKENS = 3000
+
+REQUIRED_FIELDS = ("title", "description", "instructions", "difficulty", "cooking_time", "servings", "ingredients")
+
+# JSONモード（response_format）に対応していないモデル
+JSON_MODE_UNSUPPORTED = ("gpt-3.5-turbo-0301", "gpt-3.5-turbo-0613", "gpt-3.5-turbo-16k-0613", "gpt-4-0314", "gpt-4-0613", "gpt-4-32k")
+
+
+def _get_api_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEYが設定されていません。.envファイルを確認してください。")
+    return api_key
+
+
+def supports_json_mode(model: str) -> bool:
+    """response_format={"type": "json_object"} を指定できるか（OPENAI_JSON_MODE=0で無効化）"""
+    if os.getenv("OPENAI_JSON_MODE", "1") == "0":
+        return False
+    if model == "gpt-4" or model.startswith(JSON_MODE_UNSUPPORTED):
+        return False
+    return model.startswith(("gpt-3.5-turbo", "gpt-4", "gpt-4o"))
+
+
+def _get_base_url():
+    """OPENAI_BASE_URLが設定されていればその互換サーバーに接続する（ベンチマーク用の代替サーバーなど）"""
+    return os.getenv("OPENAI_BASE_URL") or None
+
+
+class StreamUsage(NamedTuple):
+    """ストリーミングの usage（record_usage・スケジューラーの精算に使う）"""
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+
+def _stream_usage(usage, messages: List[Dict], completion: str) -> StreamUsage:
+    """ストリームの最後に届いたusageを読む（返さない互換サーバーではトークン数を数えて代わりにする）"""
+    if usage is not None:
+        if isinstance(usage, dict):
+            return StreamUsage(usage["prompt_tokens"], usage["completion_tokens"], usage["total_tokens"])
+        return StreamUsage(usage.prompt_tokens, usage.completion_tokens, usage.total_tokens)
+    prompt_tokens = count_message_tokens(messages)
+    completion_tokens = count_tokens(completion)
+    return StreamUsage(prompt_tokens, completion_tokens, prompt_tokens + completion_tokens)
+
+
+def _load_json(text: str, expect: str, operation: str):
+    """JSONを読み込み、修復の要否を記録"""
+    try:
+        value, salvaged = salvage_json(text, expect)
+    except ValueError:
+        LLM_JSON_PARSE.inc(operation, "failed")
+        raise
+    LLM_JSON_PARSE.inc(operation, "salvaged" if salvaged else "clean")
+    return value
+
+
+def _to_int(value) -> int:
+    """「15分」「約2人分」のような値も先頭の数値を整数として読む"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.search(r"\d+", str(value))
+    if match is None:
+        raise ValueError(f"数値に変換できません: {value}")
+    return int(match.group(0))
+
+
+def parse_recipe_response(recipe_json: str) -> Dict:
+    """AIのレスポンスをレシピ辞書に変換"""
+    print("AIからの生JSONレスポンス:\n", recipe_json)
+    # JSON文字列をPythonオブジェクトに変換（コードブロックや途中で切れた出力は修復する）
+    with stage("parse"):
+        recipe = _load_json(recipe_json, "object", "recipe")
+    print("パース後のレシピ辞書:\n", recipe)
+    with stage("normalize"):
+        return _normalize_recipe(recipe)
+
+
+def _normalize_recipe(recipe: Dict) -> Dict:
+    """パースしたレシピの必須項目を確認し、食材の欠けている項目を補う"""
+    # 必須フィールドの存在確認
+    for field in REQUIRED_FIELDS:
+        if field not in recipe:
+            raise ValueError(f"必須フィールド '{field}' が欠落しています")
+
+    # 型の確認と変換
+    recipe["cooking_time"] = _to_int(recipe["cooking_time"])
+    recipe["servings"] = _to_int(recipe["servings"])
+
+    # 途中で切れた出力を修復した場合、名前のない食材は除く
+    recipe["ingredients"] = [ingredient for ingredient in recipe["ingredients"] if ingredient.get("name")]
+
+    # 食材の形式を修正
+    for ingredient in recipe["ingredients"]:
+        if "amount" not in ingredient:
+            ingredient["amount"] = "(未入力)"
+        if "calories" not in ingredient:
+            ingredient["calories"] = 0
+        if "unit" not in ingredient or ingredient["unit"] is None:
+            ingredient["unit"] = ""
+        if "protein" not in ingredient:
+            ingredient["protein"] = None
+        if "fat" not in ingredient:
+            ingredient["fat"] = None
+        if "carbs" not in ingredient:
+            ingredient["carbs"] = None
+        if "season" not in ingredient:
+            ingredient["season"] = None
+        if "category" not in ingredient:
+            ingredient["category"] = None
+        if "is_vegetarian" not in ingredient:
+            ingredient["is_vegetarian"] = True
+        if "is_vegan" not in ingredient:
+            ingredient["is_vegan"] = True
+
+    # 不要なフィールドを削除
+    if "tips" in recipe:
+        del recipe["tips"]
+
+    return recipe
+
+
+def parse_variations_response(variations_json: str) -> List[Dict]:
+    """AIのレスポンスをバリエーションのリストに変換"""
+    print("AIからのバリエーション生レスポンス:\n", variations_json)
+    with stage("parse"):
+        # JSONモードでは {"variations": [...]}、それ以外は配列で返される
+        object_start, array_start = variations_json.find("{"), variations_json.find("[")
+        if object_start != -1 and (array_start == -1 or object_start < array_start):
+            variations = _load_json(variations_json, "object", "variations")
+            if "variations" not in variations:
+                raise ValueError("variationsが見つかりません")
+            variations = variations["variations"]
+        else:
+            variations = _load_json(variations_json, "array", "variations")
+        # 途中で切れた出力を修復した場合、項目の揃っていない末尾のバリエーションは除く
+        complete = [v for v in variations if all(field in v for field in REQUIRED_FIELDS)]
+        if complete:
+            variations = complete
+    with stage("normalize"):
+        return _normalize_variations(variations)
+
+
+def _normalize_variations(variations: List[Dict]) -> List[Dict]:
+    """パースしたバリエーションの型を揃え、食材の欠けている項目を補う"""
+    # 各バリエーションの型を確認
+    for variation in variations:
+        variation["cooking_time"] = _to_int(variation["cooking_time"])
+        variation["servings"] = _to_int(variation["servings"])
+
+        # 食材の形式を修正
+        for ingredient in variation["ingredients"]:
+            if "amount" in ingredient:
+                del ingredient["amount"]
+            if "calories" not in ingredient:
+                ingredient["calories"] = None
+            if "protein" not in ingredient:
+                ingredient["protein"] = None
+            if "fat" not in ingredient:
+                ingredient["fat"] = None
+            if "carbs" not in ingredient:
+                ingredient["carbs"] = None
+            if "season" not in ingredient:
+                ingredient["season"] = None
+            if "category" not in ingredient:
+                ingredient["category"] = None
+            if "is_vegetarian" not in ingredient:
+                ingredient["is_vegetarian"] = True
+            if "is_vegan" not in ingredient:
+                ingredient["is_vegan"] = True
+
+        # 不要なフィールドを削除
+        if "tips" in variation:
+            del variation["tips"]
+
+    return variations
 
-load_dotenv()
 
 class OpenAIService:
+    """スレッドから同期的に呼び出すOpenAIサービス（スクリプトやスレッドプールのワーカー用）
+
+    プロンプト・出力トークン数の上限・生成キャッシュ・JSONの修復はAsyncOpenAIServiceと共通。
+    rate_limit_schedulerはイベントループ上で動くため通さず、再試行はopenaiクライアントに任せる。
+    """
+
     def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEYが設定されていません。.envファイルを確認してください。")
-        self.client = OpenAI(api_key=api_key)
-        self.model = "gpt-3.5-turbo"
-
-    def generate_recipe(self, ingredients: List[str], servings: int) -> Dict:
-        """食材からレシピを生成"""
-        prompt = f"""
-        以下の食材と調味料のみを使用して、オーブンなど専門的な調理機器を使わない、{servings}人前の美味しいレシピを生成してください。食材は指定された分量以上は使わないようにしてください。しかし、指定された分量以下で作ることはかまいません。：
-        {', '.join(ingredients)}
-
-        各食材について「量（amount）」と「単位（unit）」と「カロリー（calories, kcal）」は必ず実際の数値や目安を入れてください。空欄や「-」やnullは禁止です。必ず全ての食材に値を入れてください。
-
-        ※注意：amountは必ず数値（例: 1, 2, 0.5）か、分数の場合は必ず文字列（例: "1/4", "1/2"）で返してください。amountに1/4や1/2のような数式は使わず、必ず"1/4"のような文字列にしてください。
-
-        以下の形式でJSONを返してください：
-        {{
-            "title": "レシピのタイトル",
-            "description": "レシピの簡単な説明（加える食材や調味料の量も明記してください）",
-            "instructions": "調理手順（番号付きリスト）",
-            "difficulty": "easy/medium/hard",
-            "cooking_time": 調理時間（分）,
-            "servings": 何人分,
-            "ingredients": [
-                {{
-                    "name": "食材名",
-                    "amount": 数値または文字列,
-                    "unit": "単位",
-                    "calories": 数値(kcal),
-                    "protein": null,
-                    "fat": null,
-                    "carbs": null,
-                    "season": null,
-                    "category": null,
-                    "is_vegetarian": true,
-                    "is_vegan": true
-                }}
-            ]
-        }}
-        """
+        from openai import OpenAI
+        self.client = OpenAI(api_key=_get_api_key(), base_url=_get_base_url())
+        self.model = DEFAULT_MODEL
+        self.json_mode = supports_json_mode(self.model)
+        self.cache_scope = f"{self.model}/{PROMPT_VARIANT}"
 
+    def _create(self, operation: str, messages: List[Dict], max_tokens: int = MAX_TOKENS, **kwargs):
+        """Chat Completions APIを呼び出す（応答時間とトークン数を記録）"""
+        if self.json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        started = time.perf_counter()
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+        elapsed = time.perf_counter() - started
+        LLM_SECONDS.observe(elapsed, operation)
+        record_stage("llm", elapsed)
+        record_usage(operation, response.usage)
+        return response
+
+    def _parse_with_repair(self, operation: str, text: str, parse: Callable, max_tokens: int):
+        """出力をパースし、ローカルで修復できなかった場合のみJSONの修正を1回だけ依頼する"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "あなたは料理の専門家です。与えられた食材と調味料のみを使って、美味しくて実用的なレシピを提案してください。必ず指定された形式のJSONを返してください。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=3000
-            )
-            
-            # レスポンスからJSONを抽出
-            recipe_json = response.choices[0].message.content
-            print("AIからの生JSONレスポンス:\n", recipe_json)
-            # JSON文字列をPythonオブジェクトに変換
-            recipe = json.loads(recipe_json)
-            print("パース後のレシピ辞書:\n", recipe)
-            
-            # 必須フィールドの存在確認
-            required_fields = ["title", "description", "instructions", "difficulty", "cooking_time", "servings", "ingredients"]
-            for field in required_fields:
-                if field not in recipe:
-                    raise ValueError(f"必須フィールド '{field}' が欠落しています")
-            
-            # 型の確認と変換
-            recipe["cooking_time"] = int(recipe["cooking_time"])
-            recipe["servings"] = int(recipe["servings"])
-            
-            # 食材の形式を修正
-            for ingredient in recipe["ingredients"]:
-                if "amount" not in ingredient:
-                    ingredient["amount"] = "(未入力)"
-                if "calories" not in ingredient:
-                    ingredient["calories"] = 0
-                if "unit" not in ingredient or ingredient["unit"] is None:
-                    ingredient["unit"] = ""
-                if "protein" not in ingredient:
-                    ingredient["protein"] = None
-                if "fat" not in ingredient:
-                    ingredient["fat"] = None
-                if "carbs" not in ingredient:
-                    ingredient["carbs"] = None
-                if "season" not in ingredient:
-                    ingredient["season"] = None
-                if "category" not in ingredient:
-                    ingredient["category"] = None
-                if "is_vegetarian" not in ingredient:
-                    ingredient["is_vegetarian"] = True
-                if "is_vegan" not in ingredient:
-                    ingredient["is_vegan"] = True
-            
-            # 不要なフィールドを削除
-            if "tips" in recipe:
-                del recipe["tips"]
-            
+            return parse(text)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"JSONを修復できなかったため修正を依頼します: {str(e)}")
+            error = e
+        response = self._create(
+            f"{operation}_repair", build_repair_messages(text, str(error)), max_tokens=max_tokens, temperature=0
+        )
+        try:
+            result = parse(response.choices[0].message.content)
+        except (ValueError, KeyError, TypeError):
+            LLM_JSON_REPAIR.inc(operation, "failed")
+            raise
+        LLM_JSON_REPAIR.inc(operation, "success")
+        return result
+
+    def generate_recipe(self, ingredients: List[str], servings: int, use_cache: bool = True) -> Dict:
+        """食材からレシピを生成（use_cache=Falseでキャッシュの参照をスキップ）"""
+        key = make_generation_key(ingredients, servings, self.cache_scope)
+        if use_cache:
+            cached = get_generation_cache().get(key)
+            if cached is not None:
+                LLM_CALLS_AVOIDED.inc("generation_cache")
+                return cached
+
+        def generate():
+            recipe = self._generate_recipe(ingredients, servings)
+            get_generation_cache().set(key, recipe)
             return recipe
-            
+
+        # 同じ入力の同時リクエストは1回の呼び出しにまとめる
+        return single_flight.do(key, generate)
+
+    def _generate_recipe(self, ingredients: List[str], servings: int) -> Dict:
+        try:
+            with stage("prompt_build"):
+                messages = build_recipe_messages(ingredients, servings)
+            max_tokens = recipe_max_tokens(len(ingredients))
+            response = self._create("recipe", messages, max_tokens=max_tokens, temperature=0.7)
+
+            # レスポンスからJSONを抽出
+            return self._parse_with_repair(
+                "recipe", response.choices[0].message.content, parse_recipe_response, max_tokens
+            )
+
         except json.JSONDecodeError as e:
             print(f"JSONの解析に失敗しました: {str(e)}")
             traceback.print_exc()
@@ -120,93 +285,237 @@ class OpenAIService:
 
     def get_recipe_variations(self, recipe: Dict) -> List[Dict]:
         """既存のレシピのバリエーションを生成"""
-        prompt = f"""
-        以下のレシピのバリエーションを3つ、絶対にJSON配列のみで返してください。説明や前置き、コードブロック、コメント、余計なテキストは一切不要です。
-        {recipe['title']}
-        {recipe['description']}
-
-        [
-          {{
-            "title": "バリエーションのタイトル",
-            "description": "変更点の説明",
-            "instructions": "調理手順（番号付きリスト）",
-            "difficulty": "easy/medium/hard",
-            "cooking_time": 調理時間（分）,
-            "servings": 何人分,
-            "ingredients": [
-              {{
-                "name": "食材名",
-                "amount": 数値または文字列,
-                "unit": "単位",
-                "calories": 数値(kcal),
-                "protein": null,
-                "fat": null,
-                "carbs": null,
-                "season": null,
-                "category": null,
-                "is_vegetarian": true,
-                "is_vegan": true
-              }}
-            ]
-          }}
-        ]
+        key = make_variation_key(recipe, self.cache_scope)
+        return single_flight.do(key, lambda: self._get_recipe_variations(recipe))
+
+    def _get_recipe_variations(self, recipe: Dict) -> List[Dict]:
+        try:
+            with stage("prompt_build"):
+                messages = build_variation_messages(recipe, self.json_mode)
+            max_tokens = variation_max_tokens(len(recipe.get("ingredients") or []))
+            response = self._create("variations", messages, max_tokens=max_tokens, temperature=0.8)
+
+            # レスポンスからJSONを抽出
+            return self._parse_with_repair(
+                "variations", response.choices[0].message.content, parse_variations_response, max_tokens
+            )
+
+        except json.JSONDecodeError as e:
+            print(f"JSONの解析に失敗しました: {str(e)}")
+            traceback.print_exc()
+            raise Exception(f"レシピのバリエーション生成中にエラーが発生しました: JSONの解析に失敗しました")
+        except Exception as e:
+            print(f"Error generating recipe variations: {str(e)}")
+            traceback.print_exc()
+            raise Exception(f"レシピのバリエーション生成中にエラーが発生しました: {str(e)}")
+
+
+class AsyncOpenAIService:
+    """イベントループ上で動作するOpenAIサービス
+
+    全リクエストで1つのhttpxコネクションプールを共有するため、
+    1ワーカーで多数の生成を同時に処理できる。
+    API呼び出しはrate_limit_schedulerを通してRPM/TPMの上限内で送り出し、
+    再試行もスケジューラー側で行う（priorityはINTERACTIVE/BATCH）。
+    """
+
+    def __init__(self, http_client=None):
+        """http_client: 接続に使うhttpx.AsyncClient（省略時はコネクションプールの設定をしたものを作る）"""
+        # openai・httpxの読み込みはアプリの起動時間の大半を占めるため、最初の生成まで遅らせる
+        import httpx
+        from openai import AsyncOpenAI
+        if http_client is None:
+            max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+            timeout = float(os.getenv("OPENAI_TIMEOUT", "120"))
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections
+                ),
+                timeout=httpx.Timeout(timeout, connect=10.0)
+            )
+        self.http_client = http_client
+        self.client = AsyncOpenAI(
+            api_key=_get_api_key(),
+            base_url=_get_base_url(),
+            http_client=self.http_client,
+            max_retries=0
+        )
+        self.model = DEFAULT_MODEL
+        self.json_mode = supports_json_mode(self.model)
+        # プロンプトを変えると出力も変わるため、キャッシュはモデルとプロンプトの種類ごとに分ける
+        self.cache_scope = f"{self.model}/{PROMPT_VARIANT}"
+
+    async def _create(self, operation: str, messages: List[Dict], priority: int, max_tokens: int = MAX_TOKENS, **kwargs):
+        """スケジューラーを通してChat Completions APIを呼び出す（応答時間とトークン数を記録）
+
+        stream=True の場合はチャンクを返す非同期イテレーターを返し、読み終えた時点でトークン数を記録する。
+        """
+        if self.json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        if kwargs.get("stream"):
+            # 最後のチャンクでusageを返させる（openai 1.3系にはstream_optionsの引数がないため本文に直接入れる）
+            kwargs["extra_body"] = {"stream_options": {"include_usage": True}}
+        cost = estimate_tokens(messages, max_tokens)
+        attempt = {}
+
+        def call():
+            # 上流の応答時間だけを計るため、スケジューラーの待ち時間・再試行までの待機を除いて試行ごとに計測を始める
+            attempt["started"] = time.perf_counter()
+            return self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+
+        response = await rate_limit_scheduler.run(call, cost, priority)
+        if kwargs.get("stream"):
+            return self._account_stream(operation, messages, cost, response, attempt["started"])
+        elapsed = time.perf_counter() - attempt["started"]
+        LLM_SECONDS.observe(elapsed, operation)
+        record_stage("llm", elapsed)
+        record_usage(operation, response.usage)
+        return response
+
+    async def _account_stream(self, operation: str, messages: List[Dict], cost: int, stream,
+                              started: float) -> AsyncIterator:
+        """チャンクをそのまま返し、終了時（途中で閉じられた場合も）にトークン数を記録して見積もりとの差を精算する
+
+        started: 応答を受け付けた試行の開始時刻（最初のトークンまでの時間と全体の応答時間を計る）
         """
+        usage = None
+        completion = []
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not completion:
+                        first_token = time.perf_counter() - started
+                        LLM_FIRST_TOKEN_SECONDS.observe(first_token, operation)
+                        record_stage("llm_first_token", first_token)
+                    completion.append(chunk.choices[0].delta.content)
+                yield chunk
+            elapsed = time.perf_counter() - started
+            LLM_SECONDS.observe(elapsed, operation)
+            record_stage("llm", elapsed)
+        finally:
+            usage = _stream_usage(usage, messages, "".join(completion))
+            record_usage(operation, usage)
+            rate_limit_scheduler.settle(cost, usage.total_tokens)
 
-        def extract_json_array(text):
-            match = re.search(r'\[.*\]', text, re.DOTALL)
-            if match:
-                return match.group(0)
-            return text
+    async def _parse_with_repair(self, operation: str, text: str, parse: Callable, priority: int, max_tokens: int):
+        """出力をパースし、ローカルで修復できなかった場合のみJSONの修正を1回だけ依頼する
 
+        修正後の出力は元の出力と同程度の長さのため、max_tokensには元の生成と同じ上限を渡す。
+        """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "あなたは料理の専門家です。既存のレシピを基に、新しいバリエーションを提案してください。必ず指定された形式のJSONを返してください。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.8,
-                max_tokens=3000
+            return parse(text)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"JSONを修復できなかったため修正を依頼します: {str(e)}")
+            error = e
+        response = await self._create(
+            f"{operation}_repair", build_repair_messages(text, str(error)), priority, max_tokens=max_tokens, temperature=0
+        )
+        try:
+            result = parse(response.choices[0].message.content)
+        except (ValueError, KeyError, TypeError):
+            LLM_JSON_REPAIR.inc(operation, "failed")
+            raise
+        LLM_JSON_REPAIR.inc(operation, "success")
+        return result
+
+    async def parse_recipe_output(self, text: str, ingredient_count: int, priority: int = INTERACTIVE) -> Dict:
+        """生成されたレシピのテキストをパース（ストリーミングで受け取った出力用）
+
+        ingredient_count: 生成時に指定した食材の数（修正を依頼する場合の出力トークン数の上限に使う）
+        """
+        return await self._parse_with_repair(
+            "recipe", text, parse_recipe_response, priority, recipe_max_tokens(ingredient_count)
+        )
+
+    async def generate_recipe(self, ingredients: List[str], servings: int, use_cache: bool = True,
+                              priority: int = INTERACTIVE) -> Dict:
+        """食材からレシピを生成（use_cache=Falseでキャッシュの参照をスキップ）"""
+        key = make_generation_key(ingredients, servings, self.cache_scope)
+        if use_cache:
+            # 永続層はSQLiteファイルのためスレッドで参照する
+            cached = await asyncio.to_thread(get_generation_cache().get, key)
+            if cached is not None:
+                LLM_CALLS_AVOIDED.inc("generation_cache")
+                return cached
+
+        async def generate():
+            recipe = await self._generate_recipe(ingredients, servings, priority)
+            await asyncio.to_thread(get_generation_cache().set, key, recipe)
+            return recipe
+
+        # 同じ入力の同時リクエストは1回の呼び出しにまとめる
+        return await async_single_flight.do(key, generate)
+
+    async def _generate_recipe(self, ingredients: List[str], servings: int, priority: int = INTERACTIVE) -> Dict:
+        try:
+            with stage("prompt_build"):
+                messages = build_recipe_messages(ingredients, servings)
+            response = await self._create(
+                "recipe", messages, priority, max_tokens=recipe_max_tokens(len(ingredients)), temperature=0.7
             )
-            
+
             # レスポンスからJSONを抽出
-            variations_json = response.choices[0].message.content
-            print("AIからのバリエーション生レスポンス:\n", variations_json)
-            variations_json = extract_json_array(variations_json)
-            variations = json.loads(variations_json)
-            
-            # 各バリエーションの型を確認
-            for variation in variations:
-                variation["cooking_time"] = int(variation["cooking_time"])
-                variation["servings"] = int(variation["servings"])
-                
-                # 食材の形式を修正
-                for ingredient in variation["ingredients"]:
-                    if "amount" in ingredient:
-                        del ingredient["amount"]
-                    if "calories" not in ingredient:
-                        ingredient["calories"] = None
-                    if "protein" not in ingredient:
-                        ingredient["protein"] = None
-                    if "fat" not in ingredient:
-                        ingredient["fat"] = None
-                    if "carbs" not in ingredient:
-                        ingredient["carbs"] = None
-                    if "season" not in ingredient:
-                        ingredient["season"] = None
-                    if "category" not in ingredient:
-                        ingredient["category"] = None
-                    if "is_vegetarian" not in ingredient:
-                        ingredient["is_vegetarian"] = True
-                    if "is_vegan" not in ingredient:
-                        ingredient["is_vegan"] = True
-                
-                # 不要なフィールドを削除
-                if "tips" in variation:
-                    del variation["tips"]
-            
-            return variations
-            
+            return await self.parse_recipe_output(response.choices[0].message.content, len(ingredients), priority)
+
+        except json.JSONDecodeError as e:
+            print(f"JSONの解析に失敗しました: {str(e)}")
+            traceback.print_exc()
+            raise Exception(f"レシピの生成中にエラーが発生しました: JSONの解析に失敗しました")
+        except Exception as e:
+            print(f"Error generating recipe: {str(e)}")
+            traceback.print_exc()
+            raise Exception(f"レシピの生成中にエラーが発生しました: {str(e)}")
+
+    async def stream_recipe(self, ingredients: List[str], servings: int, use_cache: bool = True,
+                            priority: int = INTERACTIVE) -> AsyncIterator[str]:
+        """レシピ生成の出力をテキスト断片として逐次返す（キャッシュヒット時は一括で返す）"""
+        if use_cache:
+            key = make_generation_key(ingredients, servings, self.cache_scope)
+            cached = await asyncio.to_thread(get_generation_cache().get, key)
+            if cached is not None:
+                LLM_CALLS_AVOIDED.inc("generation_cache")
+                yield json.dumps(cached, ensure_ascii=False)
+                return
+
+        with stage("prompt_build"):
+            messages = build_recipe_messages(ingredients, servings)
+        stream = await self._create(
+            "recipe_stream", messages, priority, max_tokens=recipe_max_tokens(len(ingredients)), temperature=0.7, stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def cache_recipe(self, ingredients: List[str], servings: int, recipe: Dict):
+        """ストリーミングで生成したレシピをキャッシュに保存"""
+        key = make_generation_key(ingredients, servings, self.cache_scope)
+        await asyncio.to_thread(get_generation_cache().set, key, recipe)
+
+    async def get_recipe_variations(self, recipe: Dict, priority: int = INTERACTIVE) -> List[Dict]:
+        """既存のレシピのバリエーションを生成"""
+        key = make_variation_key(recipe, self.cache_scope)
+        return await async_single_flight.do(key, lambda: self._get_recipe_variations(recipe, priority))
+
+    async def _get_recipe_variations(self, recipe: Dict, priority: int = INTERACTIVE) -> List[Dict]:
+        try:
+            with stage("prompt_build"):
+                messages = build_variation_messages(recipe, self.json_mode)
+            max_tokens = variation_max_tokens(len(recipe.get("ingredients") or []))
+            response = await self._create("variations", messages, priority, max_tokens=max_tokens, temperature=0.8)
+
+            # レスポンスからJSONを抽出
+            return await self._parse_with_repair(
+                "variations", response.choices[0].message.content, parse_variations_response, priority, max_tokens
+            )
+
         except json.JSONDecodeError as e:
             print(f"JSONの解析に失敗しました: {str(e)}")
             traceback.print_exc()
@@ -214,4 +523,31 @@ class OpenAIService:
         except Exception as e:
             print(f"Error generating recipe variations: {str(e)}")
             traceback.print_exc()
-            raise Exception(f"レシピのバリエーション生成中にエラーが発生しました: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"レシピのバリエーション生成中にエラーが発生しました: {str(e)}")
+
+    async def aclose(self):
+        """コネクションプールを閉じる"""
+        await self.client.close()
+
+
+_async_service = None
+
+
+def get_async_openai_service() -> AsyncOpenAIService:
+    """AsyncOpenAIServiceの共有インスタンス（最初に呼ばれた時点で作成する）
+
+    APIキーの確認とクライアントの作成も最初の生成まで行わないため、
+    OPENAI_API_KEYがなくてもレシピの閲覧などAIを使わない機能は動作する。
+    """
+    global _async_service
+    if _async_service is None:
+        _async_service = AsyncOpenAIService()
+    return _async_service
+
+
+async def close_async_openai_service():
+    """作成済みであればコネクションプールを閉じる"""
+    global _async_service
+    if _async_service is not None:
+        await _async_service.aclose()
+        _async_service = None
@@ -0,0 +1,119 @@
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from ..models.recipe import Ingredient, recipe_ingredient
+from .normalize import normalize_ingredient_name
+
+
+class PantryIndex:
+    """食材名→レシピIDの転置インデックス
+
+    ポスティングリストはソート済みの整数配列で持ち、
+    手持ちの食材で作れる保存済みレシピをLLMを呼ばずに検索する。
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, array] = {}
+        self._recipes: Dict[int, Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, db: Session):
+        """データベースから全件読み込んでインデックスを作り直す"""
+        recipes: Dict[int, set] = {}
+        rows = db.execute(
+            select(recipe_ingredient.c.recipe_id, Ingredient.name)
+            .join(Ingredient, Ingredient.id == recipe_ingredient.c.ingredient_id)
+        )
+        for recipe_id, name in rows:
+            recipes.setdefault(recipe_id, set()).add(name)
+
+        postings: Dict[str, List[int]] = {}
+        for recipe_id in sorted(recipes):
+            for name in recipes[recipe_id]:
+                postings.setdefault(name, []).append(recipe_id)
+
+        with self._lock:
+            self._recipes = {recipe_id: tuple(sorted(names)) for recipe_id, names in recipes.items()}
+            self._postings = {name: array("i", ids) for name, ids in postings.items()}
+
+    def _remove_locked(self, recipe_id: int):
+        for name in self._recipes.pop(recipe_id, ()):
+            ids = self._postings[name]
+            i = bisect_left(ids, recipe_id)
+            if i < len(ids) and ids[i] == recipe_id:
+                ids.pop(i)
+            if not ids:
+                del self._postings[name]
+
+    def set_recipe(self, recipe_id: int, names: Iterable[str]):
+        """レシピの食材を登録（更新時は置き換え）"""
+        names = tuple(sorted({normalize_ingredient_name(name) for name in names} - {""}))
+        with self._lock:
+            self._remove_locked(recipe_id)
+            if not names:
+                return
+            self._recipes[recipe_id] = names
+            for name in names:
+                insort(self._postings.setdefault(name, array("i")), recipe_id)
+
+    def remove_recipe(self, recipe_id: int):
+        with self._lock:
+            self._remove_locked(recipe_id)
+
+    def search(self, pantry: Iterable[str], metric: str = "coverage",
+               max_missing: Optional[int] = None, limit: int = 20) -> List[Dict]:
+        """手持ちの食材で作れるレシピをスコア順に返す
+
+        coverage: レシピの食材のうち手持ちでまかなえる割合
+        jaccard: レシピの食材と手持ちの食材のJaccard係数
+        max_missing: 不足している食材の数の上限
+        """
+        pantry_names = {normalize_ingredient_name(name) for name in pantry} - {""}
+        with self._lock:
+            matches = Counter()
+            for name in pantry_names:
+                postings = self._postings.get(name)
+                if postings is not None:
+                    matches.update(postings)
+
+            results = []
+            for recipe_id, matched in matches.items():
+                names = self._recipes[recipe_id]
+                missing = len(names) - matched
+                if max_missing is not None and missing > max_missing:
+                    continue
+                if metric == "jaccard":
+                    score = matched / (len(names) + len(pantry_names) - matched)
+                else:
+                    score = matched / len(names)
+                results.append((score, -missing, recipe_id, names))
+
+        results.sort(key=lambda r: (r[0], r[1], r[2]), reverse=True)
+        return [
+            {
+                "id": recipe_id,
+                "score": score,
+                "matched": [name for name in names if name in pantry_names],
+                "missing": [name for name in names if name not in pantry_names],
+            }
+            for score, _, recipe_id, names in results[:limit]
+        ]
+
+    def recipe_ids(self) -> List[int]:
+        with self._lock:
+            return list(self._recipes)
+
+    def ingredients(self, recipe_id: int) -> Tuple[str, ...]:
+        """レシピの正規化済み食材名（未登録の場合は空）"""
+        with self._lock:
+            return self._recipes.get(recipe_id, ())
+
+    def __len__(self):
+        return len(self._recipes)
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# 待機中のスレッドのスタック（末尾の関数で判定）は記録しない
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class SamplingProfiler:
+    """一定間隔で全スレッドのスタックを採取するサンプリングプロファイラー
+
+    イベントループのスレッドとスレッドプール（DBアクセスなど）の両方を採取し、
+    flamegraph.pl などで読めるfolded形式（スタック;...;関数 回数）で保存する。
+    イベントループは他のリクエストと共有のため、同時に処理中の別リクエストも含まれる。
+    """
+
+    def __init__(self, interval: float = None):
+        self.interval = interval if interval is not None else float(os.getenv("PROFILE_INTERVAL", "0.005"))
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    thread = threading._active.get(thread_id)
+                    names[thread_id] = thread.name if thread is not None else str(thread_id)
+                stack.append(names[thread_id])
+                self.samples[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+    def save(self, directory: str, name: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        return path
@@ -0,0 +1,165 @@
+import os
+from typing import Dict, List
+
+RECIPE_SYSTEM_PROMPT = "あなたは料理の専門家です。与えられた食材と調味料のみを使って、美味しくて実用的なレシピを提案してください。必ず指定された形式のJSONを返してください。"
+VARIATION_SYSTEM_PROMPT = "あなたは料理の専門家です。既存のレシピを基に、新しいバリエーションを提案してください。必ず指定された形式のJSONを返してください。"
+REPAIR_SYSTEM_PROMPT = "与えられた壊れたJSONを、内容を変えずに正しいJSONに修正してください。修正後のJSONのみを返してください。"
+
+# プロンプトの種類（compact: 既定 / legacy: 以前のプロンプト。A/B比較用）
+PROMPT_VARIANTS = ("compact", "legacy")
+PROMPT_VARIANT = os.getenv("PROMPT_VARIANT", "compact")
+
+# 出力トークン数の見積もり（日本語のレシピで計測した目安）
+RECIPE_BASE_TOKENS = 450
+RECIPE_TOKENS_PER_INGREDIENT = 40
+VARIATION_BASE_TOKENS = 350
+VARIATION_TOKENS_PER_INGREDIENT = 30
+MIN_MAX_TOKENS = 600
+MAX_MAX_TOKENS = 3000
+
+# compactではバックエンドが既定値で補う項目（protein/fat/carbs/season/category/is_vegetarian/is_vegan）を
+# スキーマから除き、空白のないJSONで示す。スキーマ部分は起動時に一度だけ組み立てる
+_RECIPE_SCHEMA = (
+    '{"title":"","description":"説明（使う分量も明記）","instructions":"番号付きの手順",'
+    '"difficulty":"easy|medium|hard","cooking_time":分,"servings":人数,'
+    '"ingredients":[{"name":"","amount":1,"unit":"","calories":kcal}]}'
+)
+# バリエーションの分量は保存時に使わないため求めない
+_VARIATION_SCHEMA = (
+    '{"title":"","description":"変更点","instructions":"番号付きの手順",'
+    '"difficulty":"easy|medium|hard","cooking_time":分,"servings":人数,'
+    '"ingredients":[{"name":"","unit":"","calories":kcal}]}'
+)
+_RECIPE_TEMPLATE = (
+    "次の食材と調味料だけを使い、オーブンなど専門的な調理機器を使わない{servings}人前のレシピを作ってください。"
+    "指定の分量を超えて使わないこと（少なく使うのは可）。\n"
+    "食材: {ingredients}\n"
+    "amount・unit・caloriesは全ての食材で具体的な値にすること（空欄・null・\"-\"は禁止）。"
+    "amountは数値、分数は\"1/4\"のような文字列。\n"
+    "次の形式のJSONのみを返してください:\n" + _RECIPE_SCHEMA.replace("{", "{{").replace("}", "}}")
+)
+_VARIATION_TEMPLATE = (
+    "次のレシピのバリエーションを{count}つ、{output_format}のみで返してください。説明やコードブロックは不要です。\n"
+    "レシピ: {title}\n{description}\n"
+    "各バリエーションの形式:\n" + _VARIATION_SCHEMA.replace("{", "{{").replace("}", "}}")
+)
+
+
+def recipe_max_tokens(ingredient_count: int) -> int:
+    """レシピ生成の出力トークン数の上限（食材の数に比例させる）"""
+    budget = RECIPE_BASE_TOKENS + RECIPE_TOKENS_PER_INGREDIENT * ingredient_count
+    return max(MIN_MAX_TOKENS, min(MAX_MAX_TOKENS, budget))
+
+
+def variation_max_tokens(ingredient_count: int, count: int = 3) -> int:
+    """バリエーション生成の出力トークン数の上限（食材の数×バリエーションの数に比例させる）"""
+    budget = count * (VARIATION_BASE_TOKENS + VARIATION_TOKENS_PER_INGREDIENT * ingredient_count)
+    return max(MIN_MAX_TOKENS, min(MAX_MAX_TOKENS, budget))
+
+
+def build_recipe_messages(ingredients: List[str], servings: int, variant: str = None) -> List[Dict]:
+    """レシピ生成用のメッセージを作成"""
+    if (variant or PROMPT_VARIANT) == "legacy":
+        prompt = _legacy_recipe_prompt(ingredients, servings)
+    else:
+        prompt = _RECIPE_TEMPLATE.format(servings=servings, ingredients="、".join(ingredients))
+    return [
+        {"role": "system", "content": RECIPE_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def build_variation_messages(recipe: Dict, json_mode: bool = False, count: int = 3, variant: str = None) -> List[Dict]:
+    """バリエーション生成用のメッセージを作成（JSONモードでは配列を {"variations": [...]} で包む）"""
+    output_format = '{"variations": [...]} の形式のJSONオブジェクト' if json_mode else "JSON配列"
+    if (variant or PROMPT_VARIANT) == "legacy":
+        prompt = _legacy_variation_prompt(recipe, output_format)
+    else:
+        prompt = _VARIATION_TEMPLATE.format(
+            count=count,
+            output_format=output_format,
+            title=recipe["title"],
+            description=recipe["description"]
+        )
+    return [
+        {"role": "system", "content": VARIATION_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def build_repair_messages(text: str, error: str) -> List[Dict]:
+    """壊れたJSONの修復を依頼するメッセージを作成（レシピを生成し直すより安価）"""
+    return [
+        {"role": "system", "content": REPAIR_SYSTEM_PROMPT},
+        {"role": "user", "content": f"エラー: {error}\n\n{text}"}
+    ]
+
+
+def _legacy_recipe_prompt(ingredients: List[str], servings: int) -> str:
+    return f"""
+        以下の食材と調味料のみを使用して、オーブンなど専門的な調理機器を使わない、{servings}人前の美味しいレシピを生成してください。食材は指定された分量以上は使わないようにしてください。しかし、指定された分量以下で作ることはかまいません。：
+        {', '.join(ingredients)}
+
+        各食材について「量（amount）」と「単位（unit）」と「カロリー（calories, kcal）」は必ず実際の数値や目安を入れてください。空欄や「-」やnullは禁止です。必ず全ての食材に値を入れてください。
+
+        ※注意：amountは必ず数値（例: 1, 2, 0.5）か、分数の場合は必ず文字列（例: "1/4", "1/2"）で返してください。amountに1/4や1/2のような数式は使わず、必ず"1/4"のような文字列にしてください。
+
+        以下の形式でJSONを返してください：
+        {{
+            "title": "レシピのタイトル",
+            "description": "レシピの簡単な説明（加える食材や調味料の量も明記してください）",
+            "instructions": "調理手順（番号付きリスト）",
+            "difficulty": "easy/medium/hard",
+            "cooking_time": 調理時間（分）,
+            "servings": 何人分,
+            "ingredients": [
+                {{
+                    "name": "食材名",
+                    "amount": 数値または文字列,
+                    "unit": "単位",
+                    "calories": 数値(kcal),
+                    "protein": null,
+                    "fat": null,
+                    "carbs": null,
+                    "season": null,
+                    "category": null,
+                    "is_vegetarian": true,
+                    "is_vegan": true
+                }}
+            ]
+        }}
+        """
+
+
+def _legacy_variation_prompt(recipe: Dict, output_format: str) -> str:
+    return f"""
+        以下のレシピのバリエーションを3つ、絶対に{output_format}のみで返してください。説明や前置き、コードブロック、コメント、余計なテキストは一切不要です。
+        {recipe['title']}
+        {recipe['description']}
+
+        [
+          {{
+            "title": "バリエーションのタイトル",
+            "description": "変更点の説明",
+            "instructions": "調理手順（番号付きリスト）",
+            "difficulty": "easy/medium/hard",
+            "cooking_time": 調理時間（分）,
+            "servings": 何人分,
+            "ingredients": [
+              {{
+                "name": "食材名",
+                "amount": 数値または文字列,
+                "unit": "単位",
+                "calories": 数値(kcal),
+                "protein": null,
+                "fat": null,
+                "carbs": null,
+                "season": null,
+                "category": null,
+                "is_vegetarian": true,
+                "is_vegan": true
+              }}
+            ]
+          }}
+        ]
+        """
@@ -0,0 +1,246 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from .tokenizer import count_message_tokens
+
+# 優先度（小さいほど先に処理する）
+INTERACTIVE = 0
+BATCH = 1
+
+
+def estimate_tokens(messages: List[Dict], max_tokens: int = 0) -> int:
+    """プロンプトのトークン数に出力の上限を足した、1回の呼び出しで消費しうるトークン数"""
+    return count_message_tokens(messages) + max_tokens
+
+
+class TokenBucket:
+    """1分あたりの上限を連続的に補充するトークンバケット"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """amount分のトークンが貯まるまでの秒数（0なら今すぐ使える）"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        """見積もりより実際の消費が少なかった分を戻す"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self):
+        """上限に達したと通知された場合に残量を0にする"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Retry-After（retry-after-ms）ヘッダーから待機秒数を取得"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    # openaiは読み込みに時間がかかるため、起動時ではなく使う時点で読み込む（2回目以降はすぐ返る）
+    import openai
+    if isinstance(error, openai.RateLimitError):
+        # クォータ切れは待っても回復しない
+        return getattr(error, "code", None) != "insufficient_quota"
+    return isinstance(error, (openai.APIConnectionError, openai.InternalServerError))
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    import openai
+    return isinstance(error, openai.RateLimitError)
+
+
+class RateLimitScheduler:
+    """OpenAI APIのRPM/TPM上限に合わせて呼び出しを送り出すスケジューラー
+
+    呼び出しは優先度付きキューに入り、リクエスト数・トークン数の両方のバケットに
+    余裕ができた順に送り出される（同じ優先度なら先着順）。
+    429や一時的なエラーはジッター付きの指数バックオフで再試行し、
+    Retry-Afterが返された場合はその間キュー全体の送り出しを止める。
+    """
+
+    def __init__(self, rpm: float, tpm: float, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._queue: List = []
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+        self._wait_times = deque(maxlen=1000)
+        self.dispatched = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.max_queue_depth = 0
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def _dispatch(self):
+        while self._queue:
+            priority, seq, cost, future = self._queue[0]
+            if future.done():
+                # 待機側がキャンセルされた呼び出しは捨てる
+                heapq.heappop(self._queue)
+                continue
+            wait = max(
+                self._paused_until - time.monotonic(),
+                self.requests.time_until(1),
+                self.tokens.time_until(cost)
+            )
+            if wait > 0:
+                # より優先度の高い呼び出しが来たら待機を打ち切って先頭を見直す
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._queue)
+            self.requests.consume(1)
+            self.tokens.consume(cost)
+            self.dispatched += 1
+            future.set_result(None)
+
+    async def acquire(self, cost: int, priority: int = INTERACTIVE):
+        """バケットに余裕ができて送り出し順が来るまで待つ"""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._counter), cost, future))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        started = time.monotonic()
+        try:
+            await future
+        finally:
+            self._wait_times.append(time.monotonic() - started)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # フルジッター: 0〜base*2^attempt の間でランダムに待つ
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def run(self, fn: Callable[[], Awaitable[Any]], cost: int, priority: int = INTERACTIVE) -> Any:
+        """上限に合わせて fn を実行し、一時的なエラーは再試行する
+
+        レスポンスに usage が含まれる場合は見積もりとの差分をトークンバケットに反映する（settle）。
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(cost, priority)
+            try:
+                result = await fn()
+            except Exception as e:
+                if not _is_retryable(e) or attempt == self.max_retries:
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                delay = self._backoff(attempt, e)
+                if _is_rate_limited(e):
+                    # 上限に達しているため他の呼び出しも含めて送り出しを止める
+                    self.rate_limited += 1
+                    self.requests.drain()
+                    self.tokens.drain()
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                print(f"OpenAI APIの呼び出しを{delay:.1f}秒後に再試行します（{attempt + 1}回目）: {e}")
+                await asyncio.sleep(delay)
+                continue
+
+            usage = getattr(result, "usage", None)
+            if usage is not None:
+                self.settle(cost, usage.total_tokens)
+            return result
+
+    def settle(self, cost: int, used_tokens: int):
+        """見積もりと実際に消費したトークン数の差をトークンバケットに反映する
+
+        ストリーミングではレスポンスを返した時点で消費量が分からないため、呼び出し側が読み終えた後に呼ぶ。
+        """
+        if used_tokens < cost:
+            self.tokens.refund(cost - used_tokens)
+        elif used_tokens > cost:
+            self.tokens.consume(used_tokens - cost)
+
+    def stats(self) -> Dict:
+        waits = sorted(self._wait_times)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))], 3)
+
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self.max_queue_depth,
+            "dispatched": self.dispatched,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "wait_p50": percentile(0.5),
+            "wait_p95": percentile(0.95),
+            "wait_max": round(waits[-1], 3) if waits else 0.0,
+            "available_requests": round(self.requests.tokens, 1),
+            "available_tokens": round(self.tokens.tokens, 1),
+        }
+
+
+rate_limit_scheduler = RateLimitScheduler(
+    rpm=float(os.getenv("OPENAI_RPM_LIMIT", "3500")),
+    tpm=float(os.getenv("OPENAI_TPM_LIMIT", "90000")),
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "5")),
+    backoff_base=float(os.getenv("OPENAI_BACKOFF_BASE", "1.0")),
+    backoff_max=float(os.getenv("OPENAI_BACKOFF_MAX", "60"))
+)
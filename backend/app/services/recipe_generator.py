@@ -1,8 +1,27 @@
 from sqlalchemy.orm import Session
-from ..models.recipe import Recipe, Ingredient, CookingMethod, Seasoning
+from ..models.recipe import Ingredient, CookingMethod, Seasoning
+from ..schemas.recipe import RecipeCreate, IngredientCreate
+from ..crud.recipe import create_recipe
 from typing import List, Dict
 import random
 from datetime import datetime
+from .compatibility_graph import compatibility_graph
+from .reference_catalog import reference_catalog
+from .normalize import normalize_ingredient_name
+
+# 食材のカテゴリーごとに向いている調理方法
+CATEGORY_COOKING_METHODS = {
+    "meat": ["grilling", "roasting", "stewing"],
+    "fish": ["steaming", "poaching", "grilling"],
+    "vegetable": ["stir-frying", "steaming", "roasting"],
+}
+
+# 料理の種類ごとに使う調味料のカテゴリー
+CUISINE_SEASONING_CATEGORIES = {
+    "japanese": ["soy_sauce", "miso", "sake", "mirin"],
+    "chinese": ["oyster_sauce", "hoisin_sauce", "sesame_oil"],
+    "italian": ["olive_oil", "basil", "oregano", "parmesan"],
+}
 
 class RecipeGenerator:
     def __init__(self, db: Session):
@@ -20,86 +39,88 @@ class RecipeGenerator:
         else:
             return "winter"
 
+    def _get_ingredients_by_ids(self, ingredient_ids: List[int]) -> List[Ingredient]:
+        """IDの順序を保ったまま食材をまとめて取得"""
+        if not ingredient_ids:
+            return []
+        found = {
+            ingredient.id: ingredient
+            for ingredient in self.db.query(Ingredient).filter(Ingredient.id.in_(ingredient_ids)).all()
+        }
+        return [found[ingredient_id] for ingredient_id in ingredient_ids if ingredient_id in found]
+
     def get_compatible_ingredients(self, ingredients: List[Ingredient]) -> List[Ingredient]:
-        """与えられた食材と相性の良い食材を取得"""
-        compatible_ingredients = []
-        for ingredient in ingredients:
-            compatible = ingredient.compatible_with
-            compatible_ingredients.extend(compatible)
-        return list(set(compatible_ingredients))
+        """与えられた食材と相性の良い食材を取得（相性の良い入力食材が多く、スコアが高い順）"""
+        compatibility_graph.ensure_loaded(self.db)
+        candidates, _, _ = compatibility_graph.score_candidates([ing.id for ing in ingredients])
+        return self._get_ingredients_by_ids([int(ingredient_id) for ingredient_id in candidates])
+
+    def sample_compatible_ingredients(self, ingredients: List[Ingredient], k: int) -> List[Ingredient]:
+        """相性スコアで重み付けして相性の良い食材をk件まで選ぶ"""
+        compatibility_graph.ensure_loaded(self.db)
+        return self._get_ingredients_by_ids(compatibility_graph.sample([ing.id for ing in ingredients], k))
+
+    def _get_ingredients_by_names(self, names: List[str]) -> List[Ingredient]:
+        """名前の順序を保ったまま食材を1クエリで取得（カタログにない名前は除く）"""
+        names = list(dict.fromkeys(name for name in map(normalize_ingredient_name, names) if name))
+        if not names:
+            return []
+        found = {
+            ingredient.name: ingredient
+            for ingredient in self.db.query(Ingredient).filter(Ingredient.name.in_(names)).all()
+        }
+        return [found[name] for name in names if name in found]
 
     def get_seasonal_ingredients(self) -> List[Ingredient]:
         """旬の食材を取得"""
-        current_season = self.get_season()
-        return self.db.query(Ingredient).filter(Ingredient.season == current_season).all()
+        reference_catalog.ensure_loaded(self.db)
+        return list(reference_catalog.ingredients_by_season.get(self.get_season(), []))
 
     def suggest_cooking_methods(self, ingredients: List[Ingredient]) -> List[CookingMethod]:
         """食材に適した調理方法を提案"""
         # 食材のカテゴリーに基づいて調理方法を選択
+        reference_catalog.ensure_loaded(self.db)
         categories = set(ing.category for ing in ingredients)
         methods = []
-        
-        if "meat" in categories:
-            methods.extend(self.db.query(CookingMethod).filter(
-                CookingMethod.name.in_(["grilling", "roasting", "stewing"])
-            ).all())
-        
-        if "fish" in categories:
-            methods.extend(self.db.query(CookingMethod).filter(
-                CookingMethod.name.in_(["steaming", "poaching", "grilling"])
-            ).all())
-        
-        if "vegetable" in categories:
-            methods.extend(self.db.query(CookingMethod).filter(
-                CookingMethod.name.in_(["stir-frying", "steaming", "roasting"])
-            ).all())
-        
+        for category, names in CATEGORY_COOKING_METHODS.items():
+            if category in categories:
+                methods.extend(reference_catalog.get_cooking_methods(names))
         return list(set(methods))
 
     def suggest_seasonings(self, ingredients: List[Ingredient], cuisine_type: str) -> List[Seasoning]:
         """料理の種類に応じた調味料を提案"""
-        seasonings = self.db.query(Seasoning).all()
-        
+        reference_catalog.ensure_loaded(self.db)
         # 料理の種類に基づいて調味料をフィルタリング
-        if cuisine_type == "japanese":
-            return [s for s in seasonings if s.category in ["soy_sauce", "miso", "sake", "mirin"]]
-        elif cuisine_type == "chinese":
-            return [s for s in seasonings if s.category in ["oyster_sauce", "hoisin_sauce", "sesame_oil"]]
-        elif cuisine_type == "italian":
-            return [s for s in seasonings if s.category in ["olive_oil", "basil", "oregano", "parmesan"]]
-        
-        return seasonings
-
-    def generate_recipe(self, input_ingredients: List[Dict]) -> Recipe:
-        """レシピを生成"""
-        # 入力された食材を取得
-        ingredients = []
-        for ing in input_ingredients:
-            ingredient = self.db.query(Ingredient).filter(
-                Ingredient.name == ing["name"]
-            ).first()
-            if ingredient:
-                ingredients.append(ingredient)
+        if cuisine_type in CUISINE_SEASONING_CATEGORIES:
+            return reference_catalog.get_seasonings(CUISINE_SEASONING_CATEGORIES[cuisine_type])
+        return list(reference_catalog.seasonings)
+
+    def generate_recipe(self, input_ingredients: List[Dict]) -> Dict:
+        """レシピを生成
+
+        カタログの調理方法・調味料・食材はプロセス全体で共有しているため、ORMのレシピには結び付けず
+        保存用のRecipeCreateと調理方法・調味料のIDを返す（保存は save_recipe で行う）。
+        """
+        # 入力された食材をまとめて取得
+        inputs = {normalize_ingredient_name(ing["name"]): ing for ing in input_ingredients}
+        ingredients = self._get_ingredients_by_names([ing["name"] for ing in input_ingredients])
 
         # 相性の良い食材を追加
-        compatible_ingredients = self.get_compatible_ingredients(ingredients)
-        additional_ingredients = random.sample(
-            compatible_ingredients,
-            min(3, len(compatible_ingredients))
-        )
+        additional_ingredients = self.sample_compatible_ingredients(ingredients, 3)
         ingredients.extend(additional_ingredients)
 
         # 旬の食材を追加
         seasonal_ingredients = self.get_seasonal_ingredients()
         if seasonal_ingredients:
             seasonal_ingredient = random.choice(seasonal_ingredients)
-            if seasonal_ingredient not in ingredients:
+            # カタログの食材はセッション外のオブジェクトのためIDで比較する
+            if seasonal_ingredient.id not in {ing.id for ing in ingredients}:
                 ingredients.append(seasonal_ingredient)
 
         # 調理方法を提案
         cooking_methods = self.suggest_cooking_methods(ingredients)
         if not cooking_methods:
-            cooking_methods = self.db.query(CookingMethod).all()
+            cooking_methods = list(reference_catalog.cooking_methods)
 
         # 料理の種類を決定
         cuisine_types = ["japanese", "chinese", "italian", "french"]
@@ -108,24 +129,44 @@ class RecipeGenerator:
         # 調味料を提案
         seasonings = self.suggest_seasonings(ingredients, cuisine_type)
 
-        # レシピを作成
-        recipe = Recipe(
+        # レシピを作成（食材は保存時に recipe_ingredient の行として登録される）
+        recipe = RecipeCreate(
             title=f"{ingredients[0].name}を使った{cuisine_type}風レシピ",
             description=f"{', '.join(ing.name for ing in ingredients)}を使った美味しいレシピです。",
             instructions=self._generate_instructions(ingredients, cooking_methods, seasonings),
             difficulty="medium",
-            cooking_time=sum(method.time_required for method in cooking_methods),
+            cooking_time=sum(method.time_required or 0 for method in cooking_methods),
             servings=2,
             season=self.get_season(),
-            cuisine_type=cuisine_type
+            cuisine_type=cuisine_type,
+            ingredients=[
+                IngredientCreate(
+                    name=ing.name,
+                    amount=inputs.get(ing.name, {}).get("amount") or "適量",
+                    unit=inputs.get(ing.name, {}).get("unit") or "",
+                    season=ing.season,
+                    category=ing.category,
+                    is_vegetarian=ing.is_vegetarian,
+                    is_vegan=ing.is_vegan
+                )
+                for ing in ingredients
+            ]
         )
 
-        # リレーションシップを設定
-        recipe.ingredients = ingredients
-        recipe.cooking_methods = cooking_methods
-        recipe.seasonings = seasonings
-
-        return recipe
+        return {
+            "recipe": recipe,
+            "cooking_methods": [(method.id, method.time_required) for method in cooking_methods],
+            "seasoning_ids": [seasoning.id for seasoning in seasonings],
+        }
+
+    def save_recipe(self, generated: Dict) -> Dict:
+        """generate_recipe の結果を保存し、保存したレシピを返す"""
+        return create_recipe(
+            self.db,
+            generated["recipe"],
+            cooking_methods=generated["cooking_methods"],
+            seasoning_ids=generated["seasoning_ids"]
+        )
 
     def _generate_instructions(self, ingredients: List[Ingredient], 
                              cooking_methods: List[CookingMethod],
@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+from typing import Dict, List
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from ..models.recipe import Ingredient, CookingMethod, Seasoning
+
+
+class ReferenceCatalog:
+    """調理方法・調味料・旬の食材のマスタをメモリ上に保持する
+
+    読み込みは専用のセッションで行い、デタッチした状態で保持するため
+    リクエストごとのセッションとは独立して使い回せる。
+    書き込みがあるとバージョンが進み、次回利用時に読み込み直す。
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self.version = 0
+        self._loaded_version = -1
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.cooking_methods: List[CookingMethod] = []
+        self.cooking_methods_by_name: Dict[str, List[CookingMethod]] = {}
+        self.seasonings: List[Seasoning] = []
+        self.seasonings_by_category: Dict[str, List[Seasoning]] = {}
+        self.ingredients_by_season: Dict[str, List[Ingredient]] = {}
+
+    def invalidate(self):
+        self.version += 1
+
+    def ensure_loaded(self, db: Session):
+        if self._loaded_version != self.version or time.monotonic() - self._loaded_at > self.ttl:
+            with self._lock:
+                if self._loaded_version != self.version or time.monotonic() - self._loaded_at > self.ttl:
+                    self._load(db)
+
+    def _load(self, db: Session):
+        version = self.version
+        with Session(bind=db.get_bind()) as session:
+            cooking_methods = session.query(CookingMethod).all()
+            seasonings = session.query(Seasoning).all()
+            seasonal_ingredients = session.query(Ingredient).filter(Ingredient.season.isnot(None)).all()
+            session.expunge_all()
+
+        cooking_methods_by_name: Dict[str, List[CookingMethod]] = {}
+        for method in cooking_methods:
+            cooking_methods_by_name.setdefault(method.name, []).append(method)
+        seasonings_by_category: Dict[str, List[Seasoning]] = {}
+        for seasoning in seasonings:
+            seasonings_by_category.setdefault(seasoning.category, []).append(seasoning)
+        ingredients_by_season: Dict[str, List[Ingredient]] = {}
+        for ingredient in seasonal_ingredients:
+            ingredients_by_season.setdefault(ingredient.season, []).append(ingredient)
+
+        self.cooking_methods = cooking_methods
+        self.cooking_methods_by_name = cooking_methods_by_name
+        self.seasonings = seasonings
+        self.seasonings_by_category = seasonings_by_category
+        self.ingredients_by_season = ingredients_by_season
+        self._loaded_version = version
+        self._loaded_at = time.monotonic()
+
+    def get_cooking_methods(self, names: List[str]) -> List[CookingMethod]:
+        return [method for name in names for method in self.cooking_methods_by_name.get(name, [])]
+
+    def get_seasonings(self, categories: List[str]) -> List[Seasoning]:
+        return [seasoning for category in categories for seasoning in self.seasonings_by_category.get(category, [])]
+
+
+reference_catalog = ReferenceCatalog(float(os.getenv("REFERENCE_CATALOG_TTL", "300")))
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_reference_change(session, flush_context):
+    # ORM経由でマスタが変更された場合は次回利用時に読み込み直す
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (CookingMethod, Seasoning, Ingredient)):
+            reference_catalog.invalidate()
+            return
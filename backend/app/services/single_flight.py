@@ -0,0 +1,103 @@
+import copy
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同じキーの同時呼び出しを1回の実行にまとめる（スレッド版）
+
+    先着の呼び出しだけが関数を実行し、後続の呼び出しはその完了を待って
+    同じ結果（または例外）を受け取る。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # 完了したキーは削除し、次の呼び出しでは再実行させる
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class _AsyncCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """同じキーの同時呼び出しを1回の実行にまとめる（asyncio版）
+
+    上流の呼び出しは共有タスクとして実行し、待機側はshieldで待つため、
+    1つの呼び出し元がキャンセルされても他の呼び出し元には影響しない。
+    全ての呼び出し元がキャンセルされた場合のみ上流の呼び出しもキャンセルする。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _AsyncCall] = {}
+        self.coalesced = 0
+
+    def _forget(self, key: str, call: _AsyncCall):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # 待機者がいない状態で失敗した場合の警告を抑止
+        if not call.task.cancelled():
+            call.task.exception()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _AsyncCall(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            result = await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # キャンセル中のタスクに新しい呼び出し元が合流しないよう先に外す
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+        return copy.deepcopy(result)
+
+
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
@@ -0,0 +1,163 @@
+import json
+from typing import Dict, List, Tuple
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class IncrementalRecipeParser:
+    """ストリーミングで届くレシピJSONを逐次解析する
+
+    feed()にテキスト断片を渡すと、その時点で確定した要素を
+    (イベント名, データ) のリストで返す。
+      - "field": トップレベルのフィールド（title, description など）
+      - "ingredient": ingredients配列の各要素
+      - "instruction": 調理手順の1行
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0
+        self.started = False
+        self.stack: List[str] = []
+        self.in_string = False
+        self.escape = ""
+        self.expect_key = False
+        self.key = None
+        self.string_start = 0
+        self.value_start = None
+        self.item_start = None
+        self.line = ""
+
+    def feed(self, text: str) -> List[Tuple[str, Dict]]:
+        self.buf += text
+        events = []
+        buf = self.buf
+        while self.pos < len(buf):
+            i = self.pos
+            c = buf[i]
+            if not self.started:
+                # JSONの前にある前置きやコードブロックの記号は読み飛ばす
+                if c == "{":
+                    self.started = True
+                    self.stack.append("{")
+                    self.expect_key = True
+                self.pos += 1
+                continue
+
+            if self.in_string:
+                if self._streams_instructions():
+                    if not self._consume_instruction_char(buf, i, events):
+                        break
+                elif self.escape:
+                    self.escape = ""
+                elif c == "\\":
+                    self.escape = c
+                elif c == '"':
+                    self.in_string = False
+                    self._end_string(buf, i, events)
+                self.pos += 1
+                continue
+
+            depth = len(self.stack)
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+                if depth == 1 and not self.expect_key and self.value_start is None:
+                    self.value_start = i
+            elif c in "{[":
+                if depth == 1 and self.value_start is None:
+                    self.value_start = i
+                elif depth == 2 and self.key in ("ingredients", "instructions"):
+                    self.item_start = i
+                self.stack.append(c)
+            elif c in "}]":
+                self.stack.pop()
+                depth = len(self.stack)
+                if depth == 2 and self.item_start is not None:
+                    self._emit_item(buf[self.item_start:i + 1], events)
+                    self.item_start = None
+                elif depth == 1 and self.value_start is not None:
+                    self._emit_value(buf[self.value_start:i + 1], events)
+                elif depth == 0:
+                    self._emit_value(buf[self.value_start:i] if self.value_start is not None else "", events)
+            elif depth == 1:
+                if c == ":":
+                    self.expect_key = False
+                elif c == ",":
+                    self._emit_value(buf[self.value_start:i] if self.value_start is not None else "", events)
+                    self.expect_key = True
+                elif not c.isspace() and self.value_start is None and not self.expect_key:
+                    # 数値・true/false/nullの開始
+                    self.value_start = i
+            self.pos += 1
+        return events
+
+    def _streams_instructions(self) -> bool:
+        return len(self.stack) == 1 and self.key == "instructions" and self.value_start is not None
+
+    def _consume_instruction_char(self, buf: str, i: int, events: List) -> bool:
+        """調理手順の文字列を1文字ずつデコードし、改行ごとに手順を確定する"""
+        c = buf[i]
+        if self.escape == "\\":
+            if c == "u":
+                # \uXXXX は4桁揃うまで待つ
+                if i + 5 > len(buf):
+                    return False
+                self.line += chr(int(buf[i + 1:i + 5], 16))
+                self.pos += 4
+                self.escape = ""
+                return True
+            decoded = _ESCAPES.get(c, c)
+            self.escape = ""
+            if decoded == "\n":
+                self._emit_step(events)
+            else:
+                self.line += decoded
+        elif c == "\\":
+            self.escape = c
+        elif c == '"':
+            self.in_string = False
+            self._emit_step(events)
+            self.value_start = None
+        else:
+            self.line += c
+        return True
+
+    def _emit_step(self, events: List):
+        step = self.line.strip()
+        self.line = ""
+        if step:
+            events.append(("instruction", {"step": step}))
+
+    def _end_string(self, buf: str, i: int, events: List):
+        depth = len(self.stack)
+        if depth == 1 and self.expect_key:
+            self.key = json.loads(buf[self.string_start:i + 1])
+        elif depth == 1 and self.value_start is not None:
+            # 文字列の値は閉じた時点で確定させる
+            self._emit_value(buf[self.value_start:i + 1], events)
+        elif depth == 2 and self.key == "instructions" and self.stack[-1] == "[":
+            # 調理手順が文字列の配列で返された場合
+            self._emit_item(buf[self.string_start:i + 1], events)
+
+    def _emit_item(self, raw: str, events: List):
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        if self.key == "ingredients":
+            events.append(("ingredient", item))
+        elif isinstance(item, str):
+            self.line = item
+            self._emit_step(events)
+
+    def _emit_value(self, raw: str, events: List):
+        self.value_start = None
+        raw = raw.strip()
+        if not raw or self.key in ("ingredients", "instructions"):
+            return
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        events.append(("field", {"name": self.key, "value": value}))
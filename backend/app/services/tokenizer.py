@@ -0,0 +1,40 @@
+from functools import lru_cache
+from typing import Dict, List
+
+# メッセージごとの区切りのトークン数（role等のオーバーヘッド）
+MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """モデルのエンコーディング（tiktokenがなければNoneを返し、文字数から概算させる）
+
+    tiktokenは読み込みに時間がかかるため、起動時ではなく最初にトークン数を数える時点で読み込む。
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """テキストのトークン数
+
+    tiktokenがない場合、ASCII文字は約4文字で1トークン、日本語などは1文字で約1トークンとして数える。
+    """
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+def count_message_tokens(messages: List[Dict], model: str = "gpt-3.5-turbo") -> int:
+    """Chat Completions APIに送るメッセージ全体のトークン数"""
+    return sum(MESSAGE_OVERHEAD + count_tokens(message.get("content") or "", model) for message in messages)
@@ -0,0 +1,30 @@
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class VariationCache:
+    """レシピIDごとに生成済みバリエーションを保持するLRUキャッシュ"""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, List[Dict]]" = OrderedDict()
+
+    def get(self, recipe_id: int) -> Optional[List[Dict]]:
+        variations = self._entries.get(recipe_id)
+        if variations is not None:
+            self._entries.move_to_end(recipe_id)
+        return variations
+
+    def set(self, recipe_id: int, variations: List[Dict]):
+        self._entries[recipe_id] = variations
+        self._entries.move_to_end(recipe_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, recipe_id: int):
+        """レシピの更新・削除時に呼び出す"""
+        self._entries.pop(recipe_id, None)
+
+
+variation_cache = VariationCache(int(os.getenv("VARIATION_CACHE_SIZE", "1024")))
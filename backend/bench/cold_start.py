@@ -0,0 +1,169 @@
+"""起動時間の計測
+
+新しいプロセスでアプリを読み込み、起動処理（インデックスの読み込み）と最初のリクエストまでの時間を計測する。
+読み込み・起動・最初のリクエストの合計（中央値）が --budget-ms を超えた場合は終了コード1で終了する。
+
+    python -m bench.cold_start --runs 5 --budget-ms 1500
+    python -m bench.cold_start --database-url sqlite:///./recipe.db  # 既存のデータで計測
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from statistics import median
+from typing import Dict, List
+
+DEFAULT_BUDGET_MS = 1500
+FIRST_REQUEST_PATH = "/api/v1/recipes/"
+METRICS = ("import_ms", "startup_ms", "first_request_ms", "cold_start_ms", "openai_init_ms", "process_ms")
+
+
+async def _request(app, path: str) -> int:
+    """ASGIアプリを直接呼び出してGETリクエストを1件処理する（HTTPクライアントの読み込みを計測に含めない）"""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": [(b"host", b"localhost")], "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def _measure_child(path: str) -> Dict:
+    started = time.perf_counter()
+    from app.main import app
+    imported = time.perf_counter()
+    await app.router.startup()
+    ready = time.perf_counter()
+    status = await _request(app, path)
+    responded = time.perf_counter()
+
+    # 最初のAI生成で発生する分（openaiの読み込みとクライアントの作成）
+    from app.services.openai_service import get_async_openai_service
+    get_async_openai_service()
+    openai_ready = time.perf_counter()
+    await app.router.shutdown()
+    return {
+        "import_ms": (imported - started) * 1000,
+        "startup_ms": (ready - imported) * 1000,
+        "first_request_ms": (responded - ready) * 1000,
+        "cold_start_ms": (responded - started) * 1000,
+        "openai_init_ms": (openai_ready - responded) * 1000,
+        "status": status,
+    }
+
+
+def _create_tables():
+    from app.database import Base, engine
+    from app.models import recipe  # noqa: F401  テーブル定義の登録
+    Base.metadata.create_all(bind=engine)
+
+
+def _run_once(path: str, env: Dict[str, str]) -> Dict:
+    """子プロセスで1回計測（process_msはインタープリターの起動を含むプロセス全体の時間）"""
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "bench.cold_start", "--child", "--path", path],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def _summarize(runs: List[Dict]) -> Dict:
+    return {
+        metric: {
+            "median": round(median(run[metric] for run in runs), 1),
+            "max": round(max(run[metric] for run in runs), 1),
+        }
+        for metric in METRICS
+    }
+
+
+def run(args) -> Dict:
+    from .run import _git_commit
+    env = dict(os.environ)
+    # APIは呼ばないため、キーが未設定ならダミーの値でクライアントを作成する
+    env.setdefault("OPENAI_API_KEY", "cold-start")
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database_url:
+            env["DATABASE_URL"] = args.database_url
+        else:
+            env["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'cold-start.db')}"
+            subprocess.run([sys.executable, "-m", "bench.cold_start", "--create-tables"], env=env, check=True)
+        runs = [_run_once(args.path, env) for _ in range(args.runs)]
+    failed = [run["status"] for run in runs if run["status"] != 200]
+    if failed:
+        raise RuntimeError(f"最初のリクエストが失敗しました: {failed}")
+    summary = _summarize(runs)
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "config": {
+            "runs": args.runs, "path": args.path, "budget_ms": args.budget_ms,
+            "database_url": args.database_url or "sqlite (一時ファイル)",
+        },
+        "results": summary,
+        "within_budget": summary["cold_start_ms"]["median"] <= args.budget_ms,
+        "runs": runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時間の計測")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default=FIRST_REQUEST_PATH, help="最初に送るリクエストのパス")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="読み込み・起動・最初のリクエストの合計（中央値）の上限")
+    parser.add_argument("--database-url", help="省略時は空の一時SQLiteデータベースを使う")
+    parser.add_argument("--output", help="結果の保存先（省略時は bench/results/cold-start-<日時>-<コミット>.json）")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--create-tables", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.create_tables:
+        _create_tables()
+        return
+    if args.child:
+        print(json.dumps(asyncio.run(_measure_child(args.path))))
+        return
+
+    # bench.runはhttpxを読み込むため、子プロセスの計測に含めないよう親プロセスでだけ読み込む
+    from .run import RESULTS_DIR
+    result = run(args)
+    print(json.dumps(result["results"], ensure_ascii=False, indent=2))
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"cold-start-{datetime.now():%Y%m%d-%H%M%S}-{result['commit']}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}")
+
+    cold_start = result["results"]["cold_start_ms"]["median"]
+    if not result["within_budget"]:
+        print(f"起動時間 {cold_start:.0f}ms が上限 {args.budget_ms:.0f}ms を超えています")
+        sys.exit(1)
+    print(f"起動時間 {cold_start:.0f}ms（上限 {args.budget_ms:.0f}ms）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""ベンチマーク用のChat Completions APIの代替サーバー
+
+OpenAI APIを呼ばずにバックエンド自体のオーバーヘッドを計測するために使う。
+応答までの遅延（対数正規分布）、トークン単位のストリーミング、
+壊れたJSONや429エラーの混入を再現できる。
+
+    python -m bench.fake_openai --port 8001 --latency-ms 800 --malformed-rate 0.05
+    OPENAI_BASE_URL=http://localhost:8001/v1 uvicorn app.main:app
+
+テストなどではサーバーを起動せず、app を httpx.ASGITransport(app=app) に渡してプロセス内で使える。
+"""
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+
+# 起動時の引数で上書きする
+config = {
+    "latency_ms": 800.0,
+    "latency_sigma": 0.5,
+    "token_delay_ms": 5.0,
+    "malformed_rate": 0.0,
+    "rate_limit_rate": 0.0,
+}
+
+
+def _make_recipe(servings: int) -> dict:
+    return {
+        "title": f"ベンチマーク用レシピ{random.randint(1, 100000)}",
+        "description": "たまねぎ1個と豚肉200gを炒めた簡単なレシピです。",
+        "instructions": "1. たまねぎを切る\n2. 豚肉を炒める\n3. たまねぎを加えて炒める\n4. 醤油で味付けする",
+        "difficulty": "easy",
+        "cooking_time": 15,
+        "servings": servings,
+        "ingredients": [
+            {"name": "たまねぎ", "amount": "1", "unit": "個", "calories": 70},
+            {"name": "豚肉", "amount": "200", "unit": "g", "calories": 480},
+            {"name": "醤油", "amount": "1/2", "unit": "大さじ", "calories": 5},
+        ],
+    }
+
+
+def _make_content(messages: list) -> str:
+    """プロンプトの種類に応じたレシピ（またはバリエーションの配列）のJSONを作成"""
+    prompt = messages[-1]["content"] if messages else ""
+    match = re.search(r"(\d+)人前", prompt)
+    servings = int(match.group(1)) if match else 2
+    if "バリエーション" in prompt:
+        content = json.dumps([_make_recipe(servings) for _ in range(3)], ensure_ascii=False)
+    else:
+        content = json.dumps(_make_recipe(servings), ensure_ascii=False, indent=2)
+
+    if random.random() < config["malformed_rate"]:
+        # LLMでよく見られる壊れ方をランダムに混ぜる
+        kind = random.choice(("fence", "truncate", "fraction", "prose"))
+        if kind == "fence":
+            content = f"```json\n{content}\n```"
+        elif kind == "truncate":
+            content = content[:random.randint(len(content) // 2, len(content) - 1)]
+        elif kind == "fraction":
+            content = content.replace('"1/2"', "1/2")
+        else:
+            content = f"以下がレシピです。\n{content}\nいかがでしょうか。"
+    return content
+
+
+def _tokens(text: str) -> list:
+    # 実際のトークナイザーの代わりに数文字ずつに区切る
+    return [text[i:i + 3] for i in range(0, len(text), 3)]
+
+
+def _usage(messages: list, content: str) -> dict:
+    prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 2
+    completion_tokens = len(_tokens(content))
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "gpt-3.5-turbo")
+
+    if random.random() < config["rate_limit_rate"]:
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={"retry-after-ms": "500"}
+        )
+
+    # 最初のトークンまでの遅延（対数正規分布）
+    latency = random.lognormvariate(0, config["latency_sigma"]) * config["latency_ms"] / 1000
+    await asyncio.sleep(latency)
+    content = _make_content(messages)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(len(_tokens(content)) * config["token_delay_ms"] / 1000)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": _usage(messages, content),
+        }
+
+    async def event_stream():
+        def chunk(delta: dict, finish_reason=None) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+        for token in _tokens(content):
+            await asyncio.sleep(config["token_delay_ms"] / 1000)
+            yield chunk({"content": token})
+        yield chunk({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            # 実際のAPIと同じく、choicesが空でusageだけを持つチャンクを最後に送る
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": _usage(messages, content),
+            }
+            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク用のChat Completions APIの代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=config["latency_ms"], help="最初のトークンまでの遅延の中央値")
+    parser.add_argument("--latency-sigma", type=float, default=config["latency_sigma"], help="遅延の対数正規分布のσ")
+    parser.add_argument("--token-delay-ms", type=float, default=config["token_delay_ms"], help="トークンごとの遅延")
+    parser.add_argument("--malformed-rate", type=float, default=config["malformed_rate"], help="壊れたJSONを返す割合")
+    parser.add_argument("--rate-limit-rate", type=float, default=config["rate_limit_rate"], help="429を返す割合")
+    args = parser.parse_args()
+    config.update(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        token_delay_ms=args.token_delay_ms,
+        malformed_rate=args.malformed_rate,
+        rate_limit_rate=args.rate_limit_rate,
+    )
+    # アプリはhttpx.ASGITransportなどでプロセス内から使うこともあるため、サーバーとして起動する時だけ読み込む
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""プロンプトのA/B比較
+
+同じ食材の組み合わせに対してプロンプトの種類（compact / legacy）ごとにレシピと
+バリエーションを生成し、プロンプト・出力のトークン数、レイテンシ、パースの成功率を比較する。
+出力の長さがレイテンシと料金の大半を占めるため、主に completion_tokens と latency を見る。
+
+    python -m bench.prompt_ab --samples 20 --concurrency 4
+    OPENAI_BASE_URL=http://localhost:8001/v1 python -m bench.prompt_ab  # 代替サーバーで動作確認
+"""
+import io
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+from datetime import datetime
+from statistics import mean
+from typing import Dict, List
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+from app.services.prompts import (
+    PROMPT_VARIANTS, MAX_MAX_TOKENS, build_recipe_messages, build_variation_messages,
+    recipe_max_tokens, variation_max_tokens
+)
+from app.services.tokenizer import count_message_tokens
+from app.services.openai_service import DEFAULT_MODEL, parse_recipe_response, parse_variations_response
+from .run import INGREDIENTS, RESULTS_DIR, _git_commit, _percentile
+
+
+async def _call(client: AsyncOpenAI, model: str, messages: List[Dict], max_tokens: int, parse) -> Dict:
+    started = time.perf_counter()
+    response = await client.chat.completions.create(
+        model=model, messages=messages, temperature=0.7, max_tokens=max_tokens
+    )
+    latency = time.perf_counter() - started
+    content = response.choices[0].message.content
+    try:
+        # パース時のログ出力は比較結果の表示の邪魔になるため捨てる
+        with contextlib.redirect_stdout(io.StringIO()):
+            parsed = parse(content)
+        ok = True
+    except (ValueError, KeyError, TypeError):
+        parsed, ok = None, False
+    return {
+        "latency": latency,
+        "prompt_tokens": response.usage.prompt_tokens if response.usage else count_message_tokens(messages, model),
+        "completion_tokens": response.usage.completion_tokens if response.usage else 0,
+        "max_tokens": max_tokens,
+        "truncated": response.choices[0].finish_reason == "length",
+        "parsed": ok,
+        "result": parsed,
+    }
+
+
+def _summarize(calls: List[Dict]) -> Dict:
+    if not calls:
+        return {}
+    latencies = sorted(call["latency"] for call in calls)
+    completions = sorted(call["completion_tokens"] for call in calls)
+    return {
+        "calls": len(calls),
+        "prompt_tokens_mean": round(mean(call["prompt_tokens"] for call in calls), 1),
+        "completion_tokens_mean": round(mean(completions), 1),
+        "completion_tokens_p95": _percentile(completions, 0.95),
+        "max_tokens_mean": round(mean(call["max_tokens"] for call in calls), 1),
+        "latency_p50_ms": round(_percentile(latencies, 0.50) * 1000, 1),
+        "latency_p95_ms": round(_percentile(latencies, 0.95) * 1000, 1),
+        "parse_rate": round(sum(call["parsed"] for call in calls) / len(calls), 3),
+        "truncated": sum(call["truncated"] for call in calls),
+    }
+
+
+async def run(args) -> Dict:
+    client = AsyncOpenAI(base_url=os.getenv("OPENAI_BASE_URL") or None)
+    rng = random.Random(args.seed)
+    samples = [
+        (rng.sample(INGREDIENTS, rng.randint(3, 8)), rng.randint(1, 4))
+        for _ in range(args.samples)
+    ]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    results: Dict[str, Dict[str, List[Dict]]] = {
+        variant: {"recipe": [], "variations": []} for variant in args.variants
+    }
+
+    async def run_sample(variant: str, ingredients: List[str], servings: int):
+        async with semaphore:
+            # legacyは以前と同じく固定のmax_tokensで比較する
+            max_tokens = MAX_MAX_TOKENS if variant == "legacy" else recipe_max_tokens(len(ingredients))
+            recipe_call = await _call(
+                client, args.model, build_recipe_messages(ingredients, servings, variant=variant),
+                max_tokens, parse_recipe_response
+            )
+            results[variant]["recipe"].append(recipe_call)
+            recipe = recipe_call.pop("result")
+            if not args.variations or recipe is None:
+                return
+            max_tokens = MAX_MAX_TOKENS if variant == "legacy" else variation_max_tokens(len(recipe["ingredients"]))
+            variation_call = await _call(
+                client, args.model, build_variation_messages(recipe, variant=variant),
+                max_tokens, parse_variations_response
+            )
+            variation_call.pop("result")
+            results[variant]["variations"].append(variation_call)
+
+    await asyncio.gather(*(
+        run_sample(variant, ingredients, servings)
+        for ingredients, servings in samples
+        for variant in args.variants
+    ))
+    await client.close()
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "params": {"model": args.model, "samples": args.samples, "seed": args.seed, "variations": args.variations},
+        "results": {
+            variant: {kind: _summarize(calls) for kind, calls in kinds.items() if calls}
+            for variant, kinds in results.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="プロンプトのA/B比較")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--variants", nargs="+", choices=PROMPT_VARIANTS, default=list(PROMPT_VARIANTS))
+    parser.add_argument("--samples", type=int, default=10, help="食材の組み合わせの数")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-variations", dest="variations", action="store_false", help="バリエーションは比較しない")
+    parser.add_argument("--output", help="結果の保存先（省略時は bench/results/prompt-ab-<日時>-<コミット>.json）")
+    args = parser.parse_args()
+
+    load_dotenv()
+    result = asyncio.run(run(args))
+    print(json.dumps(result["results"], ensure_ascii=False, indent=2))
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"prompt-ab-{datetime.now():%Y%m%d-%H%M%S}-{result['commit']}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""バックエンドの負荷試験・ベンチマーク
+
+起動中のバックエンドに対してシナリオごとに指定した並列数でリクエストを送り、
+スループットとレイテンシのパーセンタイル（p50/p95/p99）をJSONに保存する。
+OpenAI APIの代わりに bench.fake_openai を使うとバックエンド自体の処理時間を計測できる。
+
+    python -m bench.run --base-url http://localhost:8000/api/v1 --concurrency 32 --requests 500
+    python -m bench.run --compare bench/results/前回の結果.json
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime
+from typing import Callable, Dict, List
+import httpx
+
+SCENARIOS = ("generate", "list", "get")
+INGREDIENTS = ("たまねぎ", "にんじん", "じゃがいも", "豚肉", "鶏肉", "キャベツ", "卵", "豆腐", "ねぎ", "トマト", "しめじ", "大根")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def _run_scenario(client: httpx.AsyncClient, make_request: Callable, concurrency: int, total: int) -> Dict:
+    """total件のリクエストをconcurrency並列で送り、結果を集計"""
+    latencies = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await make_request(client)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+            if not status.startswith("2"):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": statuses,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def run(args) -> Dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        recipe_ids: List[int] = []
+
+        async def generate(client):
+            response = await client.post("/recipes/generate/ai", json={
+                "ingredients": random.sample(INGREDIENTS, 3),
+                "servings": random.randint(1, 4),
+                "include_variations": args.include_variations,
+                "bypass_cache": args.bypass_cache,
+            })
+            if response.status_code == 200:
+                recipe_ids.append(response.json()["recipe"]["id"])
+            return response
+
+        async def list_recipes(client):
+            return await client.get("/recipes/", params={"limit": args.page_size})
+
+        async def get_recipe(client):
+            return await client.get(f"/recipes/{random.choice(recipe_ids)}")
+
+        requests = {"generate": generate, "list": list_recipes, "get": get_recipe}
+        results = {}
+        for scenario in args.scenarios:
+            if scenario == "get" and not recipe_ids:
+                # generateを実行していない場合は既存のレシピを対象にする
+                response = await client.get("/recipes/", params={"limit": 1000})
+                recipe_ids.extend(recipe["id"] for recipe in response.json())
+                if not recipe_ids:
+                    print("get: レシピが1件もないためスキップします")
+                    continue
+            print(f"{scenario}: {args.requests}件 / 並列数{args.concurrency}")
+            results[scenario] = await _run_scenario(client, requests[scenario], args.concurrency, args.requests)
+            print(json.dumps(results[scenario], ensure_ascii=False))
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "params": {
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "include_variations": args.include_variations,
+            "bypass_cache": args.bypass_cache,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, previous: Dict):
+    """前回の結果との差分を表示（レイテンシは増加、スループットは減少が悪化）"""
+    print(f"比較: {previous.get('commit')} → {current.get('commit')}")
+    for scenario, result in current["results"].items():
+        before = previous.get("results", {}).get(scenario)
+        if before is None:
+            continue
+        for metric in ("throughput", "p50_ms", "p95_ms", "p99_ms"):
+            old, new = before[metric], result[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"  {scenario:8} {metric:10} {old:>10} → {new:>10} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="バックエンドの負荷試験")
+    parser.add_argument("--base-url", default="http://localhost:8000/api/v1")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="シナリオごとのリクエスト数")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--include-variations", action="store_true")
+    parser.add_argument("--bypass-cache", action="store_true", help="生成キャッシュを使わずに毎回生成する")
+    parser.add_argument("--output", help="結果の保存先（省略時は bench/results/<日時>-<コミット>.json）")
+    parser.add_argument("--compare", help="比較する前回の結果のJSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{result['commit']}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
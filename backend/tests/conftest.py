@@ -0,0 +1,99 @@
+import os
+import asyncio
+import tempfile
+from collections import OrderedDict
+
+# アプリのモジュールは読み込み時に環境変数を参照するため、読み込む前に一時ディレクトリを使うよう設定する
+_TMP_DIR = tempfile.mkdtemp(prefix="recipe-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP_DIR}/recipe.db"
+os.environ["GENERATION_CACHE_PATH"] = os.path.join(_TMP_DIR, "generation_cache.db")
+os.environ["IMAGE_DIR"] = os.path.join(_TMP_DIR, "images")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import httpx
+import pytest
+from sqlalchemy import text
+from app.database import Base, engine, SessionLocal, dispose_async_engine
+from app.crud.search import SEARCH_TABLE, ensure_search_index
+from app.main import create_app
+from app.schemas.recipe import RecipeCreate
+from app.services import generation_cache, openai_service
+from app.services.pantry_index import pantry_index
+from app.services.minhash_index import near_duplicate_index
+from app.services.variation_cache import variation_cache
+
+
+def make_recipe(title: str = "レシピ", ingredients=(), **overrides) -> RecipeCreate:
+    """テスト用のレシピ
+
+    ingredientsは食材名（1個として扱う）または食材のdictのリスト。その他の項目はoverridesで上書きする。
+    """
+    data = dict(
+        title=title,
+        instructions="1. 作る",
+        difficulty="easy",
+        cooking_time=10,
+        servings=2,
+        ingredients=[
+            {"name": item, "amount": "1", "unit": "個"} if isinstance(item, str) else item for item in ingredients
+        ],
+    )
+    data.update(overrides)
+    return RecipeCreate(**data)
+
+
+@pytest.fixture
+def db():
+    """空のデータベースのセッション（テストごとにテーブルを作り直し、メモリ上のインデックスも空にする）"""
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    ensure_search_index(session)
+    pantry_index.load(session)
+    near_duplicate_index.load(session)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def api(db):
+    """アプリにリクエストを送ってレスポンスを返す関数（起動処理は行わないため、ジョブのワーカーは動かない）"""
+    app = create_app()
+
+    def send(method: str, url: str, **kwargs) -> httpx.Response:
+        async def run():
+            try:
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                    return await client.request(method, url, **kwargs)
+            finally:
+                # aiosqliteの接続はイベントループごとに閉じる（残すと接続のスレッドが終了せずテストが終わらない）
+                await dispose_async_engine()
+        return asyncio.run(run())
+
+    return send
+
+
+@pytest.fixture
+def fake_openai(monkeypatch, tmp_path):
+    """OpenAI APIの代わりにbench.fake_openaiをプロセス内で使う（遅延なし）
+
+    生成キャッシュ・バリエーションのキャッシュも空にする。戻り値のconfigで壊れたJSONや429の割合を変えられる。
+    """
+    from bench import fake_openai as fake
+    monkeypatch.setattr(fake, "config", dict(
+        fake.config, latency_ms=0.0, token_delay_ms=0.0, malformed_rate=0.0, rate_limit_rate=0.0
+    ))
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://fake-openai/v1")
+    service = openai_service.AsyncOpenAIService(
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app))
+    )
+    monkeypatch.setattr(openai_service, "_async_service", service)
+    monkeypatch.setattr(
+        generation_cache, "_generation_cache", generation_cache.GenerationCache(str(tmp_path / "generation_cache.db"))
+    )
+    monkeypatch.setattr(variation_cache, "_entries", OrderedDict())
+    return fake.config
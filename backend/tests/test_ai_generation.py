@@ -0,0 +1,80 @@
+import asyncio
+import time
+import httpx
+import pytest
+from app.api.recipes import _to_recipe_create
+from app.main import create_app
+from app.services import openai_service
+from app.services.openai_service import _to_int, parse_recipe_response
+
+
+@pytest.mark.parametrize("value, expected", [(15, 15), (2.0, 2), ("15分", 15), ("約2人分", 2), ("30〜40分", 30)])
+def test_to_int_reads_leading_number(value, expected):
+    assert _to_int(value) == expected
+
+
+def test_to_int_rejects_text_without_number():
+    with pytest.raises(ValueError):
+        _to_int("すぐ")
+
+
+def test_missing_required_field_is_rejected():
+    with pytest.raises(ValueError, match="title"):
+        parse_recipe_response('{"description": "説明"}')
+
+
+def test_generated_recipe_converts_to_create_schema():
+    recipe = parse_recipe_response(
+        '{"title": "卵焼き", "description": "甘い卵焼き", "instructions": "1. 焼く", "difficulty": "easy",'
+        ' "cooking_time": "10分", "servings": 2, "ingredients": [{"name": "卵", "amount": "3", "unit": "個"}]}'
+    )
+    created = _to_recipe_create(recipe)
+    assert created.cooking_time == 10
+    assert created.ingredients[0].name == "卵"
+    assert created.ingredients[0].calories == 0
+
+
+def test_generate_endpoint_saves_the_generated_recipe(api, fake_openai):
+    response = api("POST", "/api/v1/recipes/generate/ai", json={
+        "ingredients": ["たまねぎ", "豚肉"], "servings": 3, "include_variations": False
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["variations"] is None and body["reused"] is None
+    assert body["recipe"]["servings"] == 3
+    assert [i["name"] for i in body["recipe"]["ingredients"]] == ["たまねぎ", "豚肉", "醤油"]
+    saved = api("GET", f"/api/v1/recipes/{body['recipe']['id']}").json()
+    assert saved["title"] == body["recipe"]["title"]
+
+
+def test_generate_endpoint_reports_generation_errors(api, fake_openai, monkeypatch):
+    async def fail(*args, **kwargs):
+        raise Exception("レシピの生成中にエラーが発生しました: テスト")
+
+    monkeypatch.setattr(openai_service.get_async_openai_service(), "generate_recipe", fail)
+    response = api("POST", "/api/v1/recipes/generate/ai", json={"ingredients": ["卵"], "servings": 1})
+    assert response.status_code == 500
+    assert "テスト" in response.json()["detail"]
+
+
+def test_concurrent_generations_do_not_block_each_other(db, fake_openai):
+    # 1回の生成に約0.3秒かかる場合、イベントループを塞がなければ4件を並行して処理できる
+    fake_openai.update(latency_ms=300.0, latency_sigma=0.0)
+    app = create_app()
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(
+                client.post("/api/v1/recipes/generate/ai", json={
+                    "ingredients": [f"食材{i}"], "servings": 2, "include_variations": False
+                })
+                for i in range(4)
+            ))
+            return time.perf_counter() - started, responses
+
+    elapsed, responses = asyncio.run(main())
+    assert [r.status_code for r in responses] == [200] * 4
+    assert len({r.json()["recipe"]["id"] for r in responses}) == 4
+    assert elapsed < 0.9
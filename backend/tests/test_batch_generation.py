@@ -0,0 +1,98 @@
+import json
+import asyncio
+import pytest
+from app.api import recipes as recipes_api
+from app.models.recipe import Recipe
+from app.services import openai_service
+
+
+def _sse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def calls(fake_openai, monkeypatch):
+    """生成の呼び出しを記録し、同時に実行している数の最大値を数える（「失敗」を含む食材はエラーにする）"""
+    service = openai_service._async_service
+    generate_recipe = service.generate_recipe
+    calls = {"ingredients": [], "running": 0, "max_running": 0}
+
+    async def recording(ingredients, servings, **kwargs):
+        calls["ingredients"].append(list(ingredients))
+        calls["running"] += 1
+        calls["max_running"] = max(calls["max_running"], calls["running"])
+        try:
+            await asyncio.sleep(0.02)
+            if any("失敗" in name for name in ingredients):
+                raise ValueError("生成に失敗しました")
+            return await generate_recipe(ingredients, servings, **kwargs)
+        finally:
+            calls["running"] -= 1
+
+    monkeypatch.setattr(service, "generate_recipe", recording)
+    return calls
+
+
+def test_identical_requests_are_generated_once_and_saved_together(api, db, calls):
+    response = api("POST", "/api/v1/recipes/generate/batch", json={"requests": [
+        {"ingredients": ["卵", "ねぎ"], "servings": 2},
+        {"ingredients": ["豚肉"], "servings": 2},
+        {"ingredients": ["ねぎ", "卵"], "servings": 2},
+    ]})
+    assert response.status_code == 200
+    events = _sse_events(response.text)
+
+    assert len(calls["ingredients"]) == 2
+    items = [data for event, data in events if event == "item"]
+    assert sorted(item["indexes"] for item in items) == [[0, 2], [1]]
+    assert events[-1][0] == "done"
+    done = events[-1][1]
+    assert [r["index"] for r in done["recipes"]] == [0, 1, 2]
+    # まとめたリクエストには同じ保存済みレシピを返す
+    assert done["recipes"][0]["id"] == done["recipes"][2]["id"] != done["recipes"][1]["id"]
+    assert done["failed"] == 0
+    assert db.query(Recipe).count() == 2
+
+
+def test_failed_items_are_reported_and_the_rest_are_saved(api, db, calls):
+    events = _sse_events(api("POST", "/api/v1/recipes/generate/batch", json={"requests": [
+        {"ingredients": ["卵"], "servings": 2},
+        {"ingredients": ["失敗する食材"], "servings": 2},
+        {"ingredients": ["失敗する食材"], "servings": 2},
+    ]}).text)
+
+    errors = [data for event, data in events if event == "error"]
+    assert errors == [{"indexes": [1, 2], "detail": "生成に失敗しました"}]
+    done = events[-1][1]
+    assert [r["index"] for r in done["recipes"]] == [0]
+    assert done["failed"] == 2
+    assert db.query(Recipe).count() == 1
+
+
+def test_concurrency_is_capped(api, calls, monkeypatch):
+    monkeypatch.setattr(recipes_api, "BATCH_CONCURRENCY", 3)
+    requests = [{"ingredients": [f"食材{i}"], "servings": 2} for i in range(6)]
+
+    api("POST", "/api/v1/recipes/generate/batch", json={"requests": requests, "concurrency": 2})
+    assert len(calls["ingredients"]) == 6
+    assert calls["max_running"] == 2
+
+    calls["max_running"] = 0
+    requests = [{"ingredients": [f"別の食材{i}"], "servings": 2} for i in range(6)]
+    # BATCH_CONCURRENCYより大きい指定は上限に切り詰める
+    api("POST", "/api/v1/recipes/generate/batch", json={"requests": requests, "concurrency": 10})
+    assert calls["max_running"] == 3
+
+
+def test_empty_or_oversized_batches_are_rejected(api, calls, monkeypatch):
+    monkeypatch.setattr(recipes_api, "BATCH_MAX_ITEMS", 2)
+
+    assert api("POST", "/api/v1/recipes/generate/batch", json={"requests": []}).status_code == 400
+    requests = [{"ingredients": ["卵"], "servings": 2}] * 3
+    response = api("POST", "/api/v1/recipes/generate/batch", json={"requests": requests})
+    assert response.status_code == 400
+    assert calls["ingredients"] == []
@@ -0,0 +1,37 @@
+import os
+import sys
+import json
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 起動時に読み込まないモジュール（最初に使う時点で読み込む）
+DEFERRED_MODULES = ("openai", "httpx", "tiktoken", "numpy", "PIL")
+
+
+def test_importing_app_does_no_deferred_work(tmp_path):
+    script = (
+        "import sys, json\n"
+        "import app.main\n"
+        f"print(json.dumps([name for name in {DEFERRED_MODULES!r} if name in sys.modules]))\n"
+    )
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, DATABASE_URL=f"sqlite:///{tmp_path}/recipe.db")
+    env.pop("GENERATION_CACHE_PATH", None)
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    ).stdout
+
+    assert json.loads(output.splitlines()[-1]) == []
+    # 生成キャッシュのSQLiteファイルやデータベースは読み込みだけでは作られない
+    assert os.listdir(tmp_path) == []
+
+
+def test_generation_cache_is_created_on_first_use(tmp_path, monkeypatch):
+    from app.services import generation_cache
+
+    monkeypatch.setattr(generation_cache, "_generation_cache", None)
+    monkeypatch.setenv("GENERATION_CACHE_PATH", str(tmp_path / "cache.db"))
+    cache = generation_cache.get_generation_cache()
+
+    assert generation_cache.get_generation_cache() is cache
+    assert (tmp_path / "cache.db").exists()
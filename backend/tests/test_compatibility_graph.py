@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from sqlalchemy import delete, insert
+from app.main import migrate_database
+from app.models.recipe import Ingredient, ingredient_compatibility
+from app.services import compatibility_graph as graph_module
+from app.services.compatibility_graph import CompatibilityGraph
+from app.services.recipe_generator import RecipeGenerator
+
+NAMES = ["卵", "ねぎ", "豚肉", "しょうが", "もやし", "にんにく"]
+# (食材1, 食材2, スコア)
+PAIRS = [
+    ("卵", "ねぎ", 0.9),
+    ("卵", "豚肉", 0.5),
+    ("卵", "もやし", 0.0),
+    ("豚肉", "ねぎ", 0.8),
+    ("豚肉", "しょうが", 1.0),
+    ("豚肉", "にんにく", None),
+    ("ねぎ", "しょうが", 0.4),
+]
+
+
+@pytest.fixture
+def ids(db):
+    ingredients = [Ingredient(name=name) for name in NAMES]
+    db.add_all(ingredients)
+    db.flush()
+    ids = {ingredient.name: ingredient.id for ingredient in ingredients}
+    db.execute(insert(ingredient_compatibility), [
+        {"ingredient1_id": ids[a], "ingredient2_id": ids[b], "compatibility_score": score} for a, b, score in PAIRS
+    ])
+    db.commit()
+    return ids
+
+
+@pytest.fixture
+def graph(db, ids):
+    graph = CompatibilityGraph()
+    graph.load(db)
+    return graph
+
+
+def test_csr_arrays_hold_each_adjacency_list(graph, ids):
+    neighbors, scores = graph.neighbors_of(ids["豚肉"])
+    assert dict(zip(neighbors.tolist(), scores.tolist())) == pytest.approx({
+        ids["ねぎ"]: 0.8, ids["しょうが"]: 1.0, ids["にんにく"]: graph_module.DEFAULT_SCORE
+    })
+    assert graph.indptr[0] == 0 and graph.indptr[-1] == len(PAIRS)
+    assert len(graph.neighbors_of(ids["にんにく"])[0]) == 0
+    assert len(graph.neighbors_of(10_000)[0]) == 0
+
+
+def test_candidates_prefer_more_inputs_then_higher_scores(graph, ids):
+    candidates, counts, totals = graph.score_candidates([ids["卵"], ids["豚肉"]])
+
+    # 入力食材（卵・豚肉）自身は除き、相性の良い入力の数→スコアの合計の順に並べる
+    names = {ingredient_id: name for name, ingredient_id in ids.items()}
+    assert [names[c] for c in candidates.tolist()] == ["ねぎ", "しょうが", "にんにく", "もやし"]
+    assert counts.tolist() == [2, 1, 1, 1]
+    assert totals.tolist() == pytest.approx([1.7, 1.0, 1.0, 0.0])
+    assert [len(a) for a in graph.score_candidates([])] == [0, 0, 0]
+
+
+def test_sample_is_weighted_without_duplicates_and_skips_zero_scores(graph, ids):
+    for _ in range(20):
+        chosen = graph.sample([ids["卵"]], 3)
+        # スコアが0のもやしは選ばれず、正の重みを持つ候補の数までしか返さない
+        assert sorted(chosen) == sorted([ids["ねぎ"], ids["豚肉"]])
+    assert graph.sample([ids["卵"]], 0) == []
+    assert graph.sample([ids["にんにく"]], 3) == []
+
+
+def test_sample_follows_the_score_weights(graph, ids):
+    graph._rng = np.random.default_rng(0)
+    picks = [graph.sample([ids["卵"]], 1)[0] for _ in range(400)]
+    # ねぎ 0.9 : 豚肉 0.5
+    assert 0.55 < picks.count(ids["ねぎ"]) / len(picks) < 0.75
+
+
+def test_changes_are_picked_up_after_invalidate_or_the_refresh_interval(db, ids, monkeypatch):
+    graph = CompatibilityGraph(refresh_interval=3600)
+    graph.ensure_loaded(db)
+    db.execute(insert(ingredient_compatibility), [
+        {"ingredient1_id": ids["しょうが"], "ingredient2_id": ids["にんにく"], "compatibility_score": 0.7}
+    ])
+    db.commit()
+    graph.ensure_loaded(db)
+    assert graph.neighbors_of(ids["しょうが"])[0].tolist() == []
+
+    graph.invalidate()
+    graph.ensure_loaded(db)
+    assert graph.neighbors_of(ids["しょうが"])[0].tolist() == [ids["にんにく"]]
+
+    db.execute(delete(ingredient_compatibility).where(ingredient_compatibility.c.ingredient1_id == ids["しょうが"]))
+    db.commit()
+    monkeypatch.setattr(graph, "refresh_interval", 0)
+    graph.ensure_loaded(db)
+    assert graph.neighbors_of(ids["しょうが"])[0].tolist() == []
+
+
+def test_startup_migration_invalidates_the_graph(db, ids, monkeypatch):
+    graph = CompatibilityGraph(refresh_interval=3600)
+    graph.load(db)
+    monkeypatch.setattr(graph_module, "compatibility_graph", graph)
+    migrate_database(db)
+    assert graph._dirty
+
+
+def test_recipe_generator_orders_compatible_ingredients(db, ids, monkeypatch):
+    graph = CompatibilityGraph()
+    monkeypatch.setattr("app.services.recipe_generator.compatibility_graph", graph)
+    generator = RecipeGenerator(db)
+
+    compatible = generator.get_compatible_ingredients([db.get(Ingredient, ids["卵"]), db.get(Ingredient, ids["ねぎ"])])
+    assert [ingredient.name for ingredient in compatible] == ["豚肉", "しょうが", "もやし"]
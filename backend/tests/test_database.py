@@ -0,0 +1,83 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from sqlalchemy import func, select, text
+from app import database
+from app.crud.recipe import create_recipe
+from app.database import SessionLocal, _engine_options, _normalize_url, engine
+from app.models.recipe import Recipe
+from conftest import make_recipe
+
+
+@pytest.mark.parametrize("url, asynchronous, expected", [
+    ("postgresql://user:p%40ss@db/recipe", False, "postgresql+psycopg://user:p%40ss@db/recipe"),
+    ("postgres://user@db/recipe", True, "postgresql+psycopg://user@db/recipe"),
+    ("postgresql+psycopg2://user@db/recipe", False, "postgresql+psycopg://user@db/recipe"),
+    ("sqlite:///./recipe.db", False, "sqlite:///./recipe.db"),
+    ("sqlite:///./recipe.db", True, "sqlite+aiosqlite:///./recipe.db"),
+    ("mysql+pymysql://user@db/recipe", True, "mysql+pymysql://user@db/recipe"),
+])
+def test_urls_are_mapped_to_the_installed_drivers(url, asynchronous, expected):
+    assert _normalize_url(url, asynchronous=asynchronous) == expected
+
+
+def test_engine_options_per_backend():
+    assert _engine_options("sqlite://") == {"connect_args": {"check_same_thread": False}}
+    assert _engine_options("sqlite:///:memory:") == {"connect_args": {"check_same_thread": False}}
+
+    file_options = _engine_options("sqlite:///./recipe.db")
+    assert file_options["connect_args"] == {"check_same_thread": False}
+    assert file_options["pool_size"] == database.DB_POOL_SIZE
+    assert "pool_pre_ping" not in file_options
+
+    postgres_options = _engine_options("postgresql+psycopg://user@db/recipe")
+    assert "connect_args" not in postgres_options
+    assert postgres_options["pool_pre_ping"] is True
+    assert postgres_options["pool_recycle"] == database.DB_POOL_RECYCLE
+    assert postgres_options["max_overflow"] == database.DB_MAX_OVERFLOW
+
+
+def test_sqlite_connections_use_wal(db):
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        # 1 = NORMAL
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == database.SQLITE_BUSY_TIMEOUT_MS
+
+
+def test_concurrent_commits_wait_for_the_write_lock(db):
+    def save(i: int):
+        session = SessionLocal()
+        try:
+            return create_recipe(session, make_recipe(f"レシピ{i}", [f"食材{i}"]))["id"]
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        ids = list(executor.map(save, range(16)))
+    assert len(set(ids)) == 16
+    assert db.execute(select(func.count()).select_from(Recipe)).scalar() == 16
+
+
+def test_get_db_closes_the_session():
+    generator = database.get_db()
+    session = next(generator)
+    session.execute(text("SELECT 1"))
+    assert session.in_transaction()
+    generator.close()
+    assert not session.in_transaction()
+
+
+def test_async_sessions_read_the_same_database(db):
+    db.add(Recipe(title="非同期で読む", instructions="1. 作る", difficulty="easy", cooking_time=5, servings=1))
+    db.commit()
+
+    async def run():
+        try:
+            async for session in database.get_async_db():
+                return (await session.execute(select(Recipe.title))).scalars().all()
+        finally:
+            await database.dispose_async_engine()
+
+    assert asyncio.run(run()) == ["非同期で読む"]
+    assert database._async_engine.url.drivername == "sqlite+aiosqlite"
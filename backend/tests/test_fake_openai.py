@@ -0,0 +1,112 @@
+import json
+import asyncio
+import httpx
+import pytest
+from bench import fake_openai as fake
+from bench import run as bench_run
+
+
+def _post(body: dict) -> httpx.Response:
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app), base_url="http://fake") as client:
+            return await client.post("/v1/chat/completions", json=body)
+    return asyncio.run(run())
+
+
+def _messages(prompt: str):
+    return [{"role": "system", "content": "あなたは料理人です"}, {"role": "user", "content": prompt}]
+
+
+def test_completion_reports_usage_and_follows_the_prompt(fake_openai):
+    response = _post({"model": "gpt-test", "messages": _messages("卵で3人前のレシピを作ってください")})
+    body = response.json()
+
+    content = body["choices"][0]["message"]["content"]
+    assert json.loads(content)["servings"] == 3
+    assert body["model"] == "gpt-test"
+    usage = body["usage"]
+    assert usage["completion_tokens"] == len(fake._tokens(content))
+    assert usage["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"]
+
+    variations = _post({"messages": _messages("このレシピのバリエーションを作ってください")}).json()
+    assert len(json.loads(variations["choices"][0]["message"]["content"])) == 3
+
+
+def _stream_chunks(response: httpx.Response):
+    return [line[len("data: "):] for line in response.text.split("\n\n") if line]
+
+
+def test_stream_sends_tokens_then_usage_when_requested(fake_openai):
+    chunks = _stream_chunks(_post({
+        "messages": _messages("2人前"), "stream": True, "stream_options": {"include_usage": True}
+    }))
+
+    assert chunks[-1] == "[DONE]"
+    data = [json.loads(chunk) for chunk in chunks[:-1]]
+    content = "".join(d["choices"][0]["delta"].get("content", "") for d in data if d["choices"])
+    assert json.loads(content)["servings"] == 2
+    assert data[-2]["choices"][0]["finish_reason"] == "stop"
+    # 最後のチャンクはchoicesが空でusageだけを持つ
+    assert data[-1]["choices"] == []
+    assert data[-1]["usage"]["completion_tokens"] == len(fake._tokens(content))
+
+    chunks = _stream_chunks(_post({"messages": _messages("2人前"), "stream": True}))
+    assert all("usage" not in json.loads(chunk) for chunk in chunks[:-1])
+
+
+def test_rate_limit_responses_carry_retry_after_ms(fake_openai):
+    fake_openai.update(rate_limit_rate=1.0)
+    response = _post({"messages": _messages("卵")})
+
+    assert response.status_code == 429
+    assert response.headers["retry-after-ms"] == "500"
+    assert response.json()["error"]["code"] == "rate_limit_exceeded"
+
+
+@pytest.mark.parametrize("kind", ["fence", "truncate", "fraction", "prose"])
+def test_malformed_output_is_injected(fake_openai, monkeypatch, kind):
+    fake_openai.update(malformed_rate=1.0)
+    monkeypatch.setattr(fake.random, "choice", lambda kinds: kind)
+
+    content = _post({"messages": _messages("卵")}).json()["choices"][0]["message"]["content"]
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(content)
+
+
+def test_percentile_uses_the_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert bench_run._percentile(values, 0.50) == 51.0
+    assert bench_run._percentile(values, 0.99) == 100.0
+    assert bench_run._percentile([], 0.95) == 0.0
+
+
+def test_scenario_counts_statuses_and_errors():
+    statuses = iter([200, 200, 500, 200, 503, 200])
+
+    async def run():
+        transport = httpx.MockTransport(lambda request: httpx.Response(next(statuses)))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await bench_run._run_scenario(client, lambda client: client.get("/recipes/"), 3, 6)
+
+    result = asyncio.run(run())
+    assert result["requests"] == 6
+    assert result["statuses"] == {"200": 4, "500": 1, "503": 1}
+    assert result["errors"] == 2
+    assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"] <= result["max_ms"]
+    assert result["throughput"] > 0
+
+
+def test_compare_prints_the_change_per_metric(capsys):
+    previous = {"commit": "aaa", "results": {"list": {"throughput": 100.0, "p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 0}}}
+    current = {"commit": "bbb", "results": {
+        "list": {"throughput": 80.0, "p50_ms": 15.0, "p95_ms": 20.0, "p99_ms": 30.0},
+        "get": {"throughput": 1.0, "p50_ms": 1.0, "p95_ms": 1.0, "p99_ms": 1.0},
+    }}
+
+    bench_run.compare(current, previous)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "比較: aaa → bbb"
+    assert len(lines) == 5
+    assert lines[1].split()[-1] == "(-20.0%)"
+    assert lines[2].split()[-1] == "(+50.0%)"
+    assert lines[4].split()[-1] == "(+0.0%)"
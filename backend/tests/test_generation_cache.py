@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+import pytest
+from app.services import generation_cache
+from app.services.generation_cache import GenerationCache, make_generation_key, make_variation_key, normalize_ingredients
+
+RECIPE = {"title": "親子丼", "description": "鶏肉と卵の丼", "servings": 2}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(generation_cache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+def test_normalize_ingredients_ignores_order_width_whitespace_and_duplicates():
+    assert normalize_ingredients([" 卵", "ﾀﾏﾈｷﾞ", "卵", "", "ＡＢＣ"]) == sorted(["卵", "タマネギ", "ABC"])
+
+
+def test_generation_key_depends_on_normalized_input_servings_and_model():
+    key = make_generation_key(["鶏肉", "卵"], 2, "gpt-3.5-turbo/compact")
+    assert make_generation_key(["卵 ", "鶏肉", "鶏肉"], 2, "gpt-3.5-turbo/compact") == key
+    assert make_generation_key(["鶏肉", "卵"], 3, "gpt-3.5-turbo/compact") != key
+    assert make_generation_key(["鶏肉", "卵"], 2, "gpt-4/compact") != key
+    assert make_generation_key(["鶏肉"], 2, "gpt-3.5-turbo/compact") != key
+
+
+def test_variation_key_uses_title_and_description():
+    key = make_variation_key(RECIPE, "gpt-3.5-turbo")
+    assert make_variation_key(dict(RECIPE, servings=4), "gpt-3.5-turbo") == key
+    assert make_variation_key(dict(RECIPE, title="他人丼"), "gpt-3.5-turbo") != key
+
+
+def test_persistent_tier_survives_a_new_instance(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    GenerationCache(path).set("k", RECIPE)
+
+    cache = GenerationCache(path)
+    assert cache.get("k") == RECIPE
+    assert cache.get("k") == RECIPE
+    assert cache.get("missing") is None
+    assert cache.stats() == {
+        "memory_hits": 1, "persistent_hits": 1, "misses": 1, "hit_rate": 2 / 3, "memory_entries": 1
+    }
+
+
+def test_memory_tier_is_lru_bounded(tmp_path, clock):
+    cache = GenerationCache(str(tmp_path / "cache.db"), max_size=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, {"key": key})
+
+    assert cache.stats()["memory_entries"] == 2
+    # メモリから溢れたエントリもSQLiteから読める
+    assert cache.get("a") == {"key": "a"}
+    assert cache.stats()["persistent_hits"] == 1
+
+
+def test_entries_expire_per_tier(tmp_path, clock):
+    cache = GenerationCache(str(tmp_path / "cache.db"), memory_ttl=60, persistent_ttl=3600)
+    cache.set("k", RECIPE)
+
+    clock.now += 61
+    assert cache.get("k") == RECIPE
+    assert cache.stats()["persistent_hits"] == 1
+    clock.now += 3600
+    assert cache.get("k") is None
+
+
+def test_same_request_is_served_from_cache_unless_bypassed(api, fake_openai):
+    def generate(body):
+        return api("POST", "/api/v1/recipes/generate/ai", json=dict(body, include_variations=False)).json()
+
+    first = generate({"ingredients": ["鶏肉", "卵"], "servings": 2})
+    # 食材の順序・前後の空白が違っても同じ生成結果を使う
+    second = generate({"ingredients": ["卵", "鶏肉 "], "servings": 2})
+    bypassed = generate({"ingredients": ["鶏肉", "卵"], "servings": 2, "bypass_cache": True})
+
+    assert second["recipe"]["title"] == first["recipe"]["title"]
+    assert bypassed["recipe"]["title"] != first["recipe"]["title"]
+    stats = api("GET", "/api/v1/generation-cache/stats").json()
+    assert stats["memory_hits"] == 1
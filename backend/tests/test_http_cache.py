@@ -0,0 +1,135 @@
+import gzip
+from datetime import datetime, timedelta, timezone
+from fastapi import Request
+from app.crud.recipe import create_recipe
+from app.services import http_cache
+from app.services.http_cache import (
+    RenderedCache, compress_body, format_http_date, is_not_modified, make_etag, rendered_cache
+)
+from conftest import make_recipe
+
+MODIFIED = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+# 圧縮の対象になる大きさの説明文
+DESCRIPTION = "具だくさんの豚汁。" * 40
+
+
+def _request(headers=None) -> Request:
+    return Request({
+        "type": "http",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    })
+
+
+def test_make_etag_is_weak_and_depends_on_every_part(monkeypatch):
+    etag = make_etag(1, MODIFIED)
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert make_etag(1, MODIFIED) == etag
+    assert make_etag(2, MODIFIED) != etag
+    assert make_etag(1, MODIFIED + timedelta(seconds=1)) != etag
+    monkeypatch.setattr(http_cache, "CONTENT_VERSION", "2")
+    assert make_etag(1, MODIFIED) != etag
+
+
+def test_if_none_match_uses_weak_comparison():
+    etag = make_etag(1, MODIFIED)
+    strong = etag.removeprefix("W/")
+    assert is_not_modified(_request({"If-None-Match": etag}), etag, None)
+    assert is_not_modified(_request({"If-None-Match": strong}), etag, None)
+    assert is_not_modified(_request({"If-None-Match": f'"other", {etag}'}), etag, None)
+    assert is_not_modified(_request({"If-None-Match": "*"}), etag, None)
+    assert not is_not_modified(_request({"If-None-Match": '"other"'}), etag, None)
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    request = _request({"If-None-Match": '"other"', "If-Modified-Since": format_http_date(MODIFIED)})
+    assert not is_not_modified(request, make_etag(1), MODIFIED)
+
+
+def test_if_modified_since_compares_whole_seconds():
+    etag = make_etag(1)
+    assert is_not_modified(_request({"If-Modified-Since": format_http_date(MODIFIED)}), etag, MODIFIED)
+    older = format_http_date(MODIFIED - timedelta(seconds=1))
+    assert not is_not_modified(_request({"If-Modified-Since": older}), etag, MODIFIED)
+    assert not is_not_modified(_request({"If-Modified-Since": "昨日"}), etag, MODIFIED)
+    assert not is_not_modified(_request({"If-Modified-Since": format_http_date(MODIFIED)}), etag, None)
+    assert not is_not_modified(_request(), etag, MODIFIED)
+
+
+def test_compress_body_follows_accept_encoding(monkeypatch):
+    monkeypatch.setattr(http_cache, "brotli", None)
+    body = b"{}" * 1000
+
+    compressed, encoding = compress_body(_request({"Accept-Encoding": "br, gzip;q=0.5"}), body)
+    assert encoding == "gzip"
+    assert gzip.decompress(compressed) == body
+    assert compress_body(_request({"Accept-Encoding": "gzip;q=0"}), body) == (body, None)
+    assert compress_body(_request(), body) == (body, None)
+    # 小さいレスポンスは圧縮しない
+    assert compress_body(_request({"Accept-Encoding": "gzip"}), b"{}") == (b"{}", None)
+
+
+def test_compress_body_prefers_brotli_when_available(monkeypatch):
+    class FakeBrotli:
+        @staticmethod
+        def compress(body, quality):
+            return b"br:" + body[:10]
+
+    monkeypatch.setattr(http_cache, "brotli", FakeBrotli)
+    body = b"{}" * 1000
+    assert compress_body(_request({"Accept-Encoding": "gzip, br"}), body) == (b"br:" + body[:10], "br")
+    assert compress_body(_request({"Accept-Encoding": "gzip, br;q=0"}), body)[1] == "gzip"
+
+
+def test_rendered_cache_requires_matching_etag_and_evicts_lru():
+    cache = RenderedCache(max_size=2)
+    cache.set(1, "a", b"one")
+    cache.set(2, "b", b"two")
+    assert cache.get(1, "a") == b"one"
+    assert cache.get(1, "stale") is None
+    cache.set(3, "c", b"three")
+    assert cache.get(2, "b") is None
+    assert cache.get(1, "a") == b"one"
+    cache.invalidate(1)
+    assert cache.get(1, "a") is None
+    assert cache.stats() == {"size": 1, "hits": 2, "misses": 3}
+
+
+def test_recipe_endpoint_returns_304_until_the_recipe_changes(api, db):
+    recipe = create_recipe(db, make_recipe("豚汁", ["豚肉"], description=DESCRIPTION))
+    url = f"/api/v1/recipes/{recipe['id']}"
+
+    first = api("GET", url)
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == http_cache.RECIPE_CACHE_CONTROL
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+    not_modified = api("GET", url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+    assert api("GET", url, headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    hits = rendered_cache.stats()["hits"]
+    assert api("GET", url).json() == first.json()
+    assert rendered_cache.stats()["hits"] == hits + 1
+
+    api("PUT", url, json=make_recipe("豚汁（改）", ["豚肉"], description=DESCRIPTION).dict())
+    changed = api("GET", url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["title"] == "豚汁（改）"
+
+
+def test_recipe_list_is_compressed_and_supports_etag(api, db):
+    for i in range(3):
+        create_recipe(db, make_recipe(f"豚汁{i}", ["豚肉"], description=DESCRIPTION))
+
+    page = api("GET", "/api/v1/recipes/", params={"limit": 2}, headers={"Accept-Encoding": "gzip"})
+    assert page.headers["content-encoding"] == "gzip"
+    assert page.headers["vary"] == "Accept-Encoding"
+    assert [r["title"] for r in page.json()] == ["豚汁0", "豚汁1"]
+    assert page.headers["x-next-cursor"] == str(page.json()[-1]["id"])
+
+    headers = {"If-None-Match": page.headers["etag"]}
+    assert api("GET", "/api/v1/recipes/", params={"limit": 2}, headers=headers).status_code == 304
+    api("DELETE", f"/api/v1/recipes/{page.json()[0]['id']}")
+    assert api("GET", "/api/v1/recipes/", params={"limit": 2}, headers=headers).status_code == 200
@@ -0,0 +1,143 @@
+import io
+import os
+import pytest
+from PIL import Image
+from app.crud.recipe import create_recipe
+from app.services import image_store as image_store_module
+from app.services.image_store import IMAGE_CACHE_CONTROL, ImageStore, image_hash, render_thumbnails
+from conftest import make_recipe
+
+
+def _image(size, mode: str = "RGB", color=(200, 80, 40), fmt: str = "PNG") -> bytes:
+    buf = io.BytesIO()
+    Image.new(mode, size, color).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def _open(data: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def test_thumbnails_are_resized_per_size_and_format():
+    thumbnails = render_thumbnails(_image((2000, 1000)))
+
+    assert set(thumbnails) == {(size, fmt) for size in ("sm", "md", "lg") for fmt in ("webp", "jpeg")}
+    assert _open(thumbnails[("lg", "webp")]).size == (1280, 640)
+    assert _open(thumbnails[("md", "jpeg")]).size == (640, 320)
+    assert _open(thumbnails[("sm", "jpeg")]).format == "JPEG"
+    assert _open(thumbnails[("sm", "webp")]).format == "WEBP"
+
+
+def test_small_and_transparent_images_are_not_enlarged_and_get_a_white_background():
+    thumbnails = render_thumbnails(_image((400, 300), mode="RGBA", color=(0, 0, 0, 0)))
+
+    assert _open(thumbnails[("lg", "jpeg")]).size == (400, 300)
+    assert _open(thumbnails[("sm", "jpeg")]).size == (320, 240)
+    assert _open(thumbnails[("lg", "webp")]).convert("RGB").getpixel((10, 10)) == (255, 255, 255)
+
+
+def test_unreadable_images_raise_value_error():
+    with pytest.raises(ValueError):
+        render_thumbnails(b"not an image")
+
+
+def _thumbnails(content: bytes):
+    return {(size, "jpeg"): content for size in ("sm", "md")}
+
+
+def test_least_recently_used_thumbnails_are_evicted(tmp_path):
+    store = ImageStore(str(tmp_path), max_bytes=40)
+    store.put_thumbnails("a" * 32, _thumbnails(b"x" * 10))
+    store.put_thumbnails("b" * 32, _thumbnails(b"x" * 10))
+    assert store.get_thumbnail("a" * 32, "sm", "jpeg") is not None
+
+    store.put_thumbnails("c" * 32, _thumbnails(b"x" * 10))
+    # 最近使ったaのsmは残り、aのmd・bのsmから削除する
+    assert store.get_thumbnail("a" * 32, "sm", "jpeg") is not None
+    assert store.get_thumbnail("a" * 32, "md", "jpeg") is None
+    assert store.get_thumbnail("b" * 32, "sm", "jpeg") is None
+    assert not os.path.exists(store.thumbnail_path("b" * 32, "sm", "jpeg"))
+    stats = store.stats()
+    assert (stats["thumbnails"], stats["bytes"], stats["evictions"]) == (4, 40, 2)
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+
+
+def test_saved_thumbnails_are_picked_up_after_a_restart(tmp_path):
+    store = ImageStore(str(tmp_path))
+    store.put_thumbnails("a" * 32, _thumbnails(b"x" * 10))
+    store.save_original("a" * 32, b"original")
+    store.save_original("a" * 32, b"ignored")
+
+    reloaded = ImageStore(str(tmp_path))
+    assert reloaded.stats()["thumbnails"] == 2
+    assert reloaded.stats()["bytes"] == 20
+    assert reloaded.has_original("a" * 32)
+    assert reloaded.read_original("a" * 32) == b"original"
+    assert not reloaded.has_original("b" * 32)
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    """テスト用の保存先を使い、サムネイルはプロセスプールの代わりにスレッドプールで作る"""
+    store = ImageStore(str(tmp_path / "images"))
+    monkeypatch.setattr(image_store_module, "image_store", store)
+    monkeypatch.setattr("app.api.recipes.image_store", store)
+    monkeypatch.setattr(image_store_module, "get_image_executor", lambda: None)
+    return store
+
+
+def _create_recipe(db) -> int:
+    return create_recipe(db, make_recipe("オムライス", ["卵"]))["id"]
+
+
+def test_uploaded_images_are_served_with_long_lived_cache_headers(api, db, images):
+    recipe_id = _create_recipe(db)
+    data = _image((1600, 1200), fmt="JPEG")
+    key = image_hash(data)
+
+    response = api("POST", f"/api/v1/recipes/{recipe_id}/image", files={"file": ("dish.jpg", data, "image/jpeg")})
+    body = response.json()
+    assert body["image_url"] == f"/api/v1/images/{key}"
+    assert body["thumbnails"]["sm"]["webp"] == f"/api/v1/images/{key}?size=sm&format=webp"
+    assert api("GET", f"/api/v1/recipes/{recipe_id}").json()["image_url"] == body["image_url"]
+
+    response = api("GET", body["image_url"], headers={"Accept": "image/webp,*/*"})
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["cache-control"] == IMAGE_CACHE_CONTROL
+    assert response.headers["vary"] == "Accept"
+    assert _open(response.content).size == (1280, 960)
+
+    response = api("GET", body["thumbnails"]["sm"]["jpeg"])
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "vary" not in response.headers
+    assert _open(response.content).size == (320, 240)
+    assert len(response.content) < len(data)
+
+    not_modified = api("GET", body["thumbnails"]["sm"]["jpeg"], headers={"If-None-Match": response.headers["etag"]})
+    assert not_modified.status_code == 304
+
+
+def test_evicted_thumbnails_are_rendered_again_from_the_original(api, db, images):
+    recipe_id = _create_recipe(db)
+    data = _image((800, 600))
+    key = api("POST", f"/api/v1/recipes/{recipe_id}/image", files={"file": ("dish.png", data)}).json()["image_url"]
+    os.remove(images.thumbnail_path(key.rsplit("/", 1)[1], "md", "webp"))
+
+    response = api("GET", key, params={"size": "md", "format": "webp"})
+    assert response.status_code == 200
+    assert _open(response.content).size == (640, 480)
+
+
+def test_invalid_uploads_and_unknown_images(api, db, images):
+    recipe_id = _create_recipe(db)
+
+    assert api("POST", f"/api/v1/recipes/{recipe_id}/image", files={"file": ("a.jpg", b"broken")}).status_code == 400
+    assert api("POST", "/api/v1/recipes/9999/image", files={"file": ("a.png", _image((10, 10)))}).status_code == 404
+    assert api("GET", f"/api/v1/images/{'0' * 32}").status_code == 404
+    assert api("GET", "/api/v1/images/not-a-hash").status_code == 422
+    assert api("GET", f"/api/v1/images/{'0' * 32}", params={"size": "xl"}).status_code == 422
+    # 読み込めなかった画像は元画像として保存しない
+    assert images.stats()["thumbnails"] == 0
+    assert not os.path.exists(os.path.join(images.root, "originals"))
@@ -0,0 +1,143 @@
+import sqlite3
+import pytest
+from sqlalchemy import create_engine, select, func, text
+from sqlalchemy.orm import Session
+from app.crud.recipe import create_recipe, create_recipes, get_recipe, update_recipe
+from app.main import migrate_database
+from app.migrations import ingredient_catalog
+from app.models.recipe import Ingredient, recipe_ingredient
+from conftest import make_recipe
+
+
+def _catalog(db):
+    return {row.name: row for row in db.execute(select(Ingredient)).scalars()}
+
+
+def test_ingredients_are_shared_by_normalized_name(db):
+    first = create_recipe(db, make_recipe("味噌汁", [
+        {"name": "とうふ", "amount": "1/2", "unit": "丁"},
+        {"name": "ﾈｷﾞ", "amount": "1", "unit": "本"},
+    ]))
+    second = create_recipe(db, make_recipe("湯豆腐", [
+        {"name": " とうふ ", "amount": "1", "unit": "丁", "calories": 150.0},
+        {"name": "ネギ", "amount": "少々", "unit": None},
+    ]))
+
+    assert set(_catalog(db)) == {"とうふ", "ネギ"}
+    assert [i["id"] for i in first["ingredients"]] == [i["id"] for i in second["ingredients"]]
+    # 分量・単位・栄養価はレシピごとに保持する
+    assert [i["amount"] for i in first["ingredients"]] == ["1/2", "1"]
+    assert [i["amount"] for i in second["ingredients"]] == ["1", "少々"]
+    assert second["ingredients"][0]["calories"] == 150.0
+    assert first["ingredients"][0]["calories"] is None
+
+
+def test_missing_catalog_attributes_are_filled_but_never_overwritten(db):
+    create_recipe(db, make_recipe("a", [{"name": "かぼちゃ", "amount": "1/4", "unit": "個"}]))
+    create_recipe(db, make_recipe("b", [{"name": "かぼちゃ", "amount": "1/4", "unit": "個", "season": "autumn"}]))
+    create_recipe(db, make_recipe("c", [
+        {"name": "かぼちゃ", "amount": "1/4", "unit": "個", "season": "summer", "category": "vegetable"}
+    ]))
+
+    pumpkin = _catalog(db)["かぼちゃ"]
+    assert (pumpkin.season, pumpkin.category) == ("autumn", "vegetable")
+
+
+def test_bulk_insert_and_update_reuse_catalog_rows(db):
+    created = create_recipes(db, [
+        make_recipe("a", [{"name": "卵", "amount": "2", "unit": "個"}, {"name": "牛乳", "amount": "100", "unit": "ml"}]),
+        make_recipe("b", [{"name": "卵", "amount": "1", "unit": "個"}]),
+    ])
+    update_recipe(db, created[1]["id"], make_recipe("b", [
+        {"name": "牛乳", "amount": "200", "unit": "ml"}, {"name": "砂糖", "amount": "10", "unit": "g"}
+    ]))
+
+    assert set(_catalog(db)) == {"卵", "牛乳", "砂糖"}
+    assert [i["name"] for i in get_recipe(db, created[1]["id"])["ingredients"]] == ["牛乳", "砂糖"]
+    assert db.execute(select(func.count()).select_from(recipe_ingredient)).scalar() == 4
+
+
+def _legacy_database(path: str):
+    """食材がレシピごとの行だった移行前のスキーマ"""
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE recipes (id INTEGER PRIMARY KEY, title VARCHAR);
+        CREATE TABLE ingredients (
+            id INTEGER PRIMARY KEY, name VARCHAR, unit VARCHAR, calories FLOAT, protein FLOAT, fat FLOAT,
+            carbs FLOAT, season VARCHAR, category VARCHAR, is_vegetarian BOOLEAN, is_vegan BOOLEAN, amount TEXT
+        );
+        CREATE TABLE recipe_ingredient (recipe_id INTEGER, ingredient_id INTEGER);
+        CREATE TABLE ingredient_compatibility (
+            id INTEGER PRIMARY KEY, ingredient1_id INTEGER, ingredient2_id INTEGER,
+            compatibility_score FLOAT, notes VARCHAR
+        );
+        INSERT INTO recipes VALUES (1, '味噌汁'), (2, '湯豆腐');
+        INSERT INTO ingredients VALUES
+            (1, 'とうふ', '丁', 80, NULL, NULL, NULL, NULL, NULL, 1, 1, '1/2'),
+            (2, 'ねぎ', '本', 10, NULL, NULL, NULL, 'winter', NULL, 1, 1, '1'),
+            (3, ' とうふ', '丁', 160, NULL, NULL, NULL, NULL, 'soy', 1, 1, '1'),
+            (4, 'ねぎ', '本', 5, NULL, NULL, NULL, NULL, 'vegetable', 1, 1, '1/2'),
+            (5, '', NULL, NULL, NULL, NULL, NULL, NULL, NULL, 1, 1, NULL);
+        INSERT INTO recipe_ingredient VALUES (1, 1), (1, 2), (1, 5), (2, 4), (2, 3);
+        INSERT INTO ingredient_compatibility (ingredient1_id, ingredient2_id, compatibility_score, notes) VALUES
+            (1, 2, 0.5, 'a'), (3, 4, 0.9, 'b'), (1, 3, 1.0, 'same');
+    """)
+    conn.commit()
+    conn.close()
+
+
+def test_migration_merges_duplicate_rows_into_the_catalog(tmp_path):
+    path = str(tmp_path / "recipe.db")
+    _legacy_database(path)
+
+    ingredient_catalog.migrate(path)
+    # 移行済みのデータベースに再度実行しても変更しない
+    ingredient_catalog.migrate(path)
+
+    conn = sqlite3.connect(path)
+    catalog = conn.execute("SELECT id, name, season, category FROM ingredients ORDER BY id").fetchall()
+    lines = conn.execute(
+        "SELECT recipe_id, ingredient_id, position, amount, unit, calories FROM recipe_ingredient"
+        " ORDER BY recipe_id, position"
+    ).fetchall()
+    pairs = conn.execute(
+        "SELECT ingredient1_id, ingredient2_id, compatibility_score, notes FROM ingredient_compatibility"
+    ).fetchall()
+    conn.close()
+
+    assert catalog == [(1, "とうふ", None, "soy"), (2, "ねぎ", "winter", "vegetable")]
+    assert lines == [
+        (1, 1, 0, "1/2", "丁", 80.0),
+        (1, 2, 1, "1", "本", 10.0),
+        (2, 2, 0, "1/2", "本", 5.0),
+        (2, 1, 1, "1", "丁", 160.0),
+    ]
+    assert pairs == [(1, 2, 0.9, "b")]
+
+
+def test_legacy_databases_are_migrated_at_startup(tmp_path):
+    path = str(tmp_path / "recipe.db")
+    _legacy_database(path)
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        with Session(engine) as session:
+            migrate_database(session)
+            migrate_database(session)
+    finally:
+        engine.dispose()
+
+    conn = sqlite3.connect(path)
+    lines = conn.execute("SELECT amount, amount_value FROM recipe_ingredient ORDER BY recipe_id, position").fetchall()
+    conn.close()
+    assert lines == [("1/2", 0.5), ("1", 1.0), ("1/2", 0.5), ("1", 1.0)]
+
+
+def test_startup_refuses_a_legacy_schema_it_cannot_migrate():
+    engine = create_engine("sqlite://")
+    try:
+        with Session(engine) as session:
+            session.execute(text("CREATE TABLE recipe_ingredient (recipe_id INTEGER, ingredient_id INTEGER)"))
+            with pytest.raises(RuntimeError, match="旧スキーマ"):
+                migrate_database(session)
+    finally:
+        engine.dispose()
@@ -0,0 +1,196 @@
+import asyncio
+from datetime import datetime, timedelta
+import httpx
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app.api import recipes as recipes_api
+from app.crud.job import (
+    create_job, get_job, claim_job, finish_job, release_job, renew_lease, count_jobs, ensure_job_table,
+    IdempotencyKeyConflict
+)
+from app.crud.recipe import create_recipe, get_recipes
+from app.main import create_app
+from app.models.job import GenerationJob, QUEUED, RUNNING, SUCCEEDED, FAILED
+from app.services.job_queue import JobWorkerPool
+from conftest import make_recipe
+
+REQUEST = {"ingredients": ["卵", "ねぎ"], "servings": 2, "include_variations": False}
+
+
+def _add_running_job(db, job_id: str, attempts: int, lease_seconds: float) -> str:
+    now = datetime.now()
+    db.add(GenerationJob(
+        id=job_id,
+        request_hash="x",
+        request='{"ingredients": ["卵"], "servings": 1}',
+        status=RUNNING,
+        attempts=attempts,
+        lease_until=now + timedelta(seconds=lease_seconds),
+        lease_token=f"{job_id}-token",
+        created_at=now,
+    ))
+    db.commit()
+    return job_id
+
+
+def test_same_idempotency_key_returns_same_job(db):
+    job, created = create_job(db, REQUEST, "key-1")
+    again, created_again = create_job(db, dict(REQUEST), "key-1")
+
+    assert created and not created_again
+    assert again["id"] == job["id"]
+    assert count_jobs(db)[QUEUED] == 1
+
+
+def test_same_idempotency_key_with_different_body_conflicts(db):
+    create_job(db, REQUEST, "key-1")
+    with pytest.raises(IdempotencyKeyConflict):
+        create_job(db, dict(REQUEST, servings=3), "key-1")
+
+
+def test_generate_endpoint_rejects_reused_key_with_different_body(db):
+    async def post_twice():
+        transport = httpx.ASGITransport(app=create_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            headers = {"Idempotency-Key": "key-1"}
+            first = await client.post("/api/v1/recipes/generate/ai", json=dict(REQUEST, background=True), headers=headers)
+            retry = await client.post("/api/v1/recipes/generate/ai", json=dict(REQUEST, background=True), headers=headers)
+            changed = await client.post("/api/v1/recipes/generate/ai", json=dict(REQUEST, servings=3), headers=headers)
+            return first, retry, changed
+
+    first, retry, changed = asyncio.run(post_twice())
+    assert first.status_code == 202
+    assert first.headers["location"] == f"/api/v1/jobs/{first.json()['id']}"
+    assert retry.status_code == 202 and retry.json()["id"] == first.json()["id"]
+    assert changed.status_code == 422
+
+
+def test_claim_takes_queued_jobs_oldest_first(db):
+    first, _ = create_job(db, REQUEST)
+    create_job(db, dict(REQUEST, servings=3))
+
+    claimed = claim_job(db, lease_seconds=60, max_attempts=3)
+    assert claimed["id"] == first["id"]
+    assert claimed["status"] == RUNNING and claimed["attempts"] == 1
+    assert claimed["lease_token"]
+
+
+def test_job_with_expired_lease_is_claimed_again(db):
+    _add_running_job(db, "alive", attempts=1, lease_seconds=60)
+    _add_running_job(db, "crashed", attempts=1, lease_seconds=-5)
+
+    claimed = claim_job(db, lease_seconds=60, max_attempts=3)
+    assert claimed["id"] == "crashed"
+    assert claimed["attempts"] == 2
+    # リースが残っているジョブは実行中のまま取り出さない
+    assert claim_job(db, lease_seconds=60, max_attempts=3) is None
+    assert get_job(db, "alive")["status"] == RUNNING
+
+
+def test_job_at_max_attempts_is_failed_instead_of_claimed(db):
+    _add_running_job(db, "dead", attempts=3, lease_seconds=-5)
+
+    assert claim_job(db, lease_seconds=60, max_attempts=3) is None
+    job = get_job(db, "dead")
+    assert job["status"] == FAILED
+    assert job["error"]
+    assert job["finished_at"] is not None
+
+
+def test_release_returns_job_to_queue_without_using_an_attempt(db):
+    job, _ = create_job(db, REQUEST)
+    claimed = claim_job(db, lease_seconds=60, max_attempts=3)
+    release_job(db, job["id"], claimed["lease_token"])
+
+    released = get_job(db, job["id"])
+    assert released["status"] == QUEUED and released["attempts"] == 0
+
+
+def test_finish_job_stores_result_and_recipe(db):
+    job, _ = create_job(db, REQUEST)
+    claimed = claim_job(db, lease_seconds=60, max_attempts=3)
+    result = {"recipe": {"id": 7}, "variations": None, "reused": None}
+    assert finish_job(db, job["id"], claimed["lease_token"], result=result)
+
+    finished = get_job(db, job["id"])
+    assert finished["status"] == SUCCEEDED
+    assert finished["recipe_id"] == 7
+    assert finished["result"]["recipe"]["id"] == 7
+
+
+def test_worker_that_lost_its_lease_cannot_overwrite_the_job(db):
+    _add_running_job(db, "slow", attempts=1, lease_seconds=-5)
+    stale_token = "slow-token"
+    claimed = claim_job(db, lease_seconds=60, max_attempts=3)
+    assert claimed["lease_token"] != stale_token
+
+    # リースが切れた後に終わった元のワーカーの結果は保存しない
+    assert not renew_lease(db, "slow", stale_token, 60)
+    assert not finish_job(db, "slow", stale_token, error="遅れて失敗")
+    release_job(db, "slow", stale_token)
+    assert get_job(db, "slow")["status"] == RUNNING
+
+    result = {"recipe": {"id": 3}, "variations": None, "reused": None}
+    assert finish_job(db, "slow", claimed["lease_token"], result=result)
+    assert get_job(db, "slow")["status"] == SUCCEEDED
+    # 終わったジョブを同じトークンで再度終わらせることもできない
+    assert not finish_job(db, "slow", claimed["lease_token"], error="二重")
+    assert get_job(db, "slow")["error"] is None
+
+
+def test_saving_recipe_records_it_on_the_job(db):
+    job, _ = create_job(db, REQUEST)
+    recipe = create_recipe(db, make_recipe("卵とねぎの炒め物", ["卵"]), job_id=job["id"])
+
+    assert get_job(db, job["id"])["recipe_id"] == recipe["id"]
+
+
+def test_rerun_after_save_returns_saved_recipe_without_generating(db, monkeypatch):
+    def no_openai():
+        raise AssertionError("保存済みのジョブでOpenAIを呼び出した")
+
+    monkeypatch.setattr(recipes_api, "get_async_openai_service", no_openai)
+    job, _ = create_job(db, REQUEST)
+    saved = create_recipe(db, make_recipe("卵とねぎの炒め物", ["卵"]), job_id=job["id"])
+
+    # 保存後・完了前に停止して再実行された状態
+    result = asyncio.run(recipes_api.run_generation_job(get_job(db, job["id"])))
+
+    assert result["recipe"]["id"] == saved["id"]
+    assert len(get_recipes(db)) == 1
+
+
+def test_worker_pool_runs_jobs_and_records_failures(db):
+    async def handler(job):
+        if job["request"]["servings"] == 0:
+            raise ValueError("人数が不正です")
+        return {"recipe": {"id": job["request"]["servings"]}, "variations": None, "reused": None}
+
+    async def run():
+        pool = JobWorkerPool(workers=2, lease_seconds=60, poll_seconds=0.05, max_attempts=3)
+        pool.start(handler)
+        try:
+            ok, _ = create_job(db, REQUEST)
+            bad, _ = create_job(db, dict(REQUEST, servings=0))
+            pool.notify()
+            return await asyncio.wait_for(asyncio.gather(pool.wait(ok["id"]), pool.wait(bad["id"])), 5)
+        finally:
+            await pool.stop()
+
+    ok, bad = asyncio.run(run())
+    assert ok["status"] == SUCCEEDED and ok["result"]["recipe"]["id"] == 2
+    assert bad["status"] == FAILED and bad["error"] == "人数が不正です"
+
+
+def test_job_tables_created_before_lease_tokens_get_the_column():
+    engine = create_engine("sqlite://")
+    try:
+        with Session(engine) as session:
+            session.execute(text("CREATE TABLE generation_jobs (id VARCHAR PRIMARY KEY, status VARCHAR)"))
+            ensure_job_table(session)
+            ensure_job_table(session)
+            columns = [row[1] for row in session.execute(text("PRAGMA table_info(generation_jobs)"))]
+    finally:
+        engine.dispose()
+    assert columns == ["id", "status", "lease_token"]
@@ -0,0 +1,135 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from app.services import openai_service
+from app.services.json_salvage import salvage_json
+from app.services.openai_service import AsyncOpenAIService, parse_recipe_response, parse_variations_response
+from app.services.prompts import recipe_max_tokens
+
+RECIPE = {
+    "title": "豚肉の生姜焼き",
+    "description": "定番の生姜焼き",
+    "instructions": "1. 豚肉を焼く\n2. タレを絡める",
+    "difficulty": "easy",
+    "cooking_time": 15,
+    "servings": 2,
+    "ingredients": [
+        {"name": "豚肉", "amount": "200", "unit": "g", "calories": 480},
+        {"name": "しょうが", "amount": "1", "unit": "かけ", "calories": 5},
+    ],
+}
+RECIPE_JSON = json.dumps(RECIPE, ensure_ascii=False, indent=2)
+
+
+def test_valid_json_is_returned_unchanged():
+    assert salvage_json(RECIPE_JSON) == (RECIPE, False)
+    assert salvage_json("[1, 2]", "array") == ([1, 2], False)
+
+
+def test_code_fence_and_surrounding_prose_are_removed():
+    fenced = f"以下がレシピです。\n```json\n{RECIPE_JSON}\n```\nいかがでしょうか。"
+    assert salvage_json(fenced) == (RECIPE, True)
+    assert salvage_json(f"以下がレシピです。\n{RECIPE_JSON}\nいかがでしょうか。") == (RECIPE, True)
+
+
+def test_bare_fractions_are_quoted():
+    value, salvaged = salvage_json('{"amount": 1/2, "other": 1 1/2, "list": [3/4]}')
+    assert salvaged
+    assert value == {"amount": "1/2", "other": "1 1/2", "list": ["3/4"]}
+
+
+def test_fractions_inside_strings_are_left_alone():
+    value, _ = salvage_json('{"memo": "1/2を使う", "amount": 1/2,}')
+    assert value == {"memo": "1/2を使う", "amount": "1/2"}
+
+
+def test_trailing_commas_and_raw_newlines_are_fixed():
+    value, salvaged = salvage_json('{"instructions": "1. 切る\n2. 焼く", "tags": ["a", "b",],}')
+    assert salvaged
+    assert value == {"instructions": "1. 切る\n2. 焼く", "tags": ["a", "b"]}
+
+
+@pytest.mark.parametrize("cut", [len(RECIPE_JSON) * n // 10 for n in range(3, 10)])
+def test_truncated_output_keeps_the_completed_part(cut):
+    value, salvaged = salvage_json(RECIPE_JSON[:cut])
+    assert salvaged
+    assert value["title"] == RECIPE["title"]
+    for key, item in value.items():
+        # 書きかけの値は捨てるか閉じるだけで、別の値に変わることはない
+        if key != "ingredients" and not isinstance(RECIPE[key], str):
+            assert item == RECIPE[key]
+
+
+def test_truncated_inside_keyword_drops_the_dangling_value():
+    assert salvage_json('{"a": 1, "b": tru')[0] == {"a": 1}
+    assert salvage_json('[{"a": 1}, {"a": 2}, {"a":', "array")[0] == [{"a": 1}, {"a": 2}]
+
+
+def test_truncated_inside_a_string_drops_the_unfinished_element():
+    text = json.dumps({"ingredients": [{"name": "豚肉", "amount": "200"}, {"name": "砂糖"}]}, ensure_ascii=False)
+    value, salvaged = salvage_json(text[:text.index("砂糖") + 1])
+    assert salvaged
+    assert value == {"ingredients": [{"name": "豚肉", "amount": "200"}]}
+    # 切り詰められる位置がなければ文字列を閉じて返す
+    assert salvage_json('{"title": "豚肉の')[0] == {"title": "豚肉の"}
+
+
+def test_expect_array_skips_leading_object_text():
+    value, _ = salvage_json('説明 {"x"} の後に [{"a": 1}]', "array")
+    assert value == [{"a": 1}]
+
+
+def test_unrecoverable_output_raises_value_error():
+    with pytest.raises(ValueError):
+        salvage_json("レシピを生成できませんでした。")
+    with pytest.raises(ValueError):
+        salvage_json('{"a": }}}')
+
+
+def test_parse_recipe_response_normalizes_salvaged_output():
+    text = RECIPE_JSON.replace('"cooking_time": 15', '"cooking_time": "約15分"')
+    recipe = parse_recipe_response(f"```json\n{text}\n```")
+    assert recipe["cooking_time"] == 15
+    assert [i["name"] for i in recipe["ingredients"]] == ["豚肉", "しょうが"]
+    assert recipe["ingredients"][0]["is_vegan"] is True
+
+
+def test_parse_variations_response_drops_incomplete_trailing_variation():
+    variations = json.dumps({"variations": [RECIPE, RECIPE]}, ensure_ascii=False)
+    cut = variations.rindex('"servings"')
+    assert len(parse_variations_response(variations[:cut])) == 1
+
+
+def _service_with_fake_create(monkeypatch, content: str):
+    """_createの呼び出しを記録し、指定した出力を返すサービス"""
+    service = AsyncOpenAIService()
+    calls = []
+
+    async def fake_create(operation, messages, priority, max_tokens=openai_service.MAX_TOKENS, **kwargs):
+        calls.append({"operation": operation, "max_tokens": max_tokens})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(service, "_create", fake_create)
+    return service, calls
+
+
+def test_locally_salvaged_output_does_not_ask_for_repair(monkeypatch):
+    service, calls = _service_with_fake_create(monkeypatch, RECIPE_JSON)
+    recipe = asyncio.run(service.parse_recipe_output(f"```json\n{RECIPE_JSON[:-40]}", 2))
+    assert recipe["title"] == RECIPE["title"]
+    assert calls == []
+
+
+def test_repair_is_requested_once_with_the_generation_token_limit(monkeypatch):
+    service, calls = _service_with_fake_create(monkeypatch, RECIPE_JSON)
+    recipe = asyncio.run(service.parse_recipe_output("申し訳ありません。", 2))
+    assert recipe["title"] == RECIPE["title"]
+    assert calls == [{"operation": "recipe_repair", "max_tokens": recipe_max_tokens(2)}]
+
+
+def test_failed_repair_raises(monkeypatch):
+    service, calls = _service_with_fake_create(monkeypatch, "まだ壊れています")
+    with pytest.raises(ValueError):
+        asyncio.run(service.parse_recipe_output("申し訳ありません。", 2))
+    assert len(calls) == 1
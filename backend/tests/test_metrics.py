@@ -0,0 +1,185 @@
+import time
+import asyncio
+from types import SimpleNamespace
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from app.services import metrics, openai_service
+from app.services.metrics import Counter, Histogram, MetricsMiddleware, Trace
+
+
+def test_counter_renders_labels_in_prometheus_text():
+    counter = Counter("jobs_total", "ジョブ数", ("outcome",))
+    counter.inc("succeeded")
+    counter.inc("succeeded", amount=2)
+    counter.inc('fa"il\ned')
+
+    assert counter.render() == [
+        "# HELP jobs_total ジョブ数",
+        "# TYPE jobs_total counter",
+        'jobs_total{outcome="fa\\"il\\ned"} 1.0',
+        'jobs_total{outcome="succeeded"} 3.0',
+    ]
+    assert Counter("plain_total", "ラベルなし").render()[2:] == []
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "処理時間", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "parse")
+
+    assert histogram.render()[2:] == [
+        'latency_seconds_bucket{stage="parse",le="0.1"} 2',
+        'latency_seconds_bucket{stage="parse",le="1.0"} 3',
+        'latency_seconds_bucket{stage="parse",le="+Inf"} 4',
+        'latency_seconds_sum{stage="parse"} 3.65',
+        'latency_seconds_count{stage="parse"} 4',
+    ]
+
+
+def test_stages_are_added_to_the_current_trace_only(monkeypatch):
+    monkeypatch.setattr(metrics, "STAGE_SECONDS", Histogram("stage_seconds", "段階", ("stage",)))
+    with metrics.stage("outside"):
+        pass
+    assert metrics.current_trace_id() is None
+
+    trace = Trace("abc")
+    token = metrics._current_trace.set(trace)
+    try:
+        metrics.record_stage("prompt", 0.0123)
+        with metrics.stage("parse"):
+            pass
+        assert metrics.current_trace_id() == "abc"
+    finally:
+        metrics._current_trace.reset(token)
+
+    assert [name for name, _ in trace.stages] == ["prompt", "parse"]
+    assert trace.server_timing().startswith("prompt;dur=12.3, parse;dur=")
+    # トレースの外の段階もヒストグラムには記録する
+    assert 'stage_seconds_count{stage="outside"} 1' in metrics.STAGE_SECONDS.render()
+
+
+def test_usage_is_counted_by_kind(monkeypatch):
+    monkeypatch.setattr(metrics, "LLM_TOKENS", Counter("tokens_total", "トークン数", ("operation", "kind")))
+    metrics.record_usage("recipe", SimpleNamespace(prompt_tokens=120, completion_tokens=380))
+    metrics.record_usage("recipe", SimpleNamespace(prompt_tokens=100, completion_tokens=20))
+    metrics.record_usage("recipe", None)
+
+    assert metrics.LLM_TOKENS.render()[2:] == [
+        'tokens_total{operation="recipe",kind="completion"} 400.0',
+        'tokens_total{operation="recipe",kind="prompt"} 220.0',
+    ]
+
+
+def _middleware_app():
+    async def hello(request):
+        metrics.record_stage("work", 0.002)
+        return PlainTextResponse(metrics.current_trace_id())
+
+    return MetricsMiddleware(Starlette(routes=[Route("/hello", hello)]))
+
+
+def _get(app, url: str, headers=None) -> httpx.Response:
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(url, headers=headers)
+    return asyncio.run(run())
+
+
+def test_middleware_assigns_trace_ids_and_server_timing(monkeypatch):
+    histogram = Histogram("requests_seconds", "処理時間", ("method", "handler", "status"))
+    monkeypatch.setattr(metrics, "REQUEST_SECONDS", histogram)
+    app = _middleware_app()
+
+    response = _get(app, "/hello", {"X-Request-ID": "client-id_1"})
+    assert response.headers["x-request-id"] == response.text == "client-id_1"
+    assert response.headers["server-timing"] == "work;dur=2.0"
+
+    # ファイル名に使えない値は使わずに新しく割り当てる
+    response = _get(app, "/hello", {"X-Request-ID": "../etc/passwd"})
+    assert response.headers["x-request-id"] == response.text
+    assert len(response.text) == 32
+
+    assert _get(app, "/missing").status_code == 404
+    rendered = metrics.REQUEST_SECONDS.render()
+    assert 'requests_seconds_count{method="GET",handler="hello",status="200"} 2' in rendered
+    assert 'requests_seconds_count{method="GET",handler="unmatched",status="404"} 1' in rendered
+
+
+def test_profile_is_saved_only_when_enabled_and_requested(monkeypatch, tmp_path):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILE_INTERVAL", "0.001")
+    _get(_middleware_app(), "/hello", {"X-Request-ID": "off", "X-Profile": "1"})
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.setenv("PROFILING_ENABLED", "1")
+    app = _middleware_app()
+    _get(app, "/hello", {"X-Request-ID": "plain"})
+    _get(app, "/hello", {"X-Request-ID": "profiled", "X-Profile": "1"})
+    assert [path.name for path in tmp_path.iterdir()] == ["profiled.folded"]
+
+
+def test_saving_a_profile_does_not_block_other_requests(monkeypatch, tmp_path):
+    class SlowProfiler(metrics.SamplingProfiler):
+        def stop(self):
+            time.sleep(0.3)
+            super().stop()
+
+    monkeypatch.setattr(metrics, "SamplingProfiler", SlowProfiler)
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILING_ENABLED", "1")
+    app = _middleware_app()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            started = time.perf_counter()
+
+            async def plain():
+                await asyncio.sleep(0.05)
+                await client.get("/hello")
+                return time.perf_counter() - started
+
+            _, elapsed = await asyncio.gather(client.get("/hello", headers={"X-Profile": "1"}), plain())
+            return elapsed
+
+    assert asyncio.run(run()) < 0.2
+    assert len(list(tmp_path.iterdir())) == 1
+
+def test_metrics_endpoint_serves_prometheus_text(api):
+    assert api("GET", "/api/v1/recipes/").headers["server-timing"].startswith("serialize;dur=")
+
+    response = api("GET", "/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert 'recipe_stage_duration_seconds_count{stage="serialize"}' in response.text
+
+
+def test_llm_latency_excludes_scheduler_wait(fake_openai, monkeypatch):
+    seconds = Histogram("llm_seconds", "応答時間", ("operation",))
+    first_token = Histogram("llm_first_token_seconds", "最初のトークン", ("operation",))
+    monkeypatch.setattr(openai_service, "LLM_SECONDS", seconds)
+    monkeypatch.setattr(openai_service, "LLM_FIRST_TOKEN_SECONDS", first_token)
+    scheduler = openai_service.rate_limit_scheduler
+
+    async def queued(fn, cost, priority=0):
+        # トークンバケットの待ちと再試行までの待機の代わり
+        await asyncio.sleep(0.3)
+        return await fn()
+
+    monkeypatch.setattr(scheduler, "run", queued)
+    service = openai_service.get_async_openai_service()
+
+    async def main():
+        await service.generate_recipe(["卵"], 2, use_cache=False)
+        return [chunk async for chunk in service.stream_recipe(["卵"], 2, use_cache=False)]
+
+    assert asyncio.run(main())
+
+    def total(histogram, operation):
+        prefix = f'{histogram.name}_sum{{operation="{operation}"}} '
+        return next(float(line[len(prefix):]) for line in histogram.render() if line.startswith(prefix))
+
+    assert total(seconds, "recipe") < 0.2
+    assert total(seconds, "recipe_stream") < 0.2
+    assert total(first_token, "recipe_stream") <= total(seconds, "recipe_stream")
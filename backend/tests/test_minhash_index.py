@@ -0,0 +1,100 @@
+from sqlalchemy import delete, func, select
+from app.crud.recipe import create_recipe
+from app.models.recipe import recipe_minhash
+from app.services import metrics, minhash_index, openai_service
+from app.services.minhash_index import NUM_PERM, NearDuplicateIndex, _signature, minhash_row
+from app.services.pantry_index import pantry_index
+from conftest import make_recipe
+
+PANTRY = ["豚肉", "キャベツ", "たまねぎ", "にんじん", "しょうが", "醤油", "みりん", "酒"]
+
+
+def test_signature_depends_only_on_the_normalized_set():
+    row = minhash_row(1, ["キャベツ", " 豚肉", "ｷｬﾍﾞﾂ"])
+    assert row["ingredients"] == "キャベツ\n豚肉"
+    assert row["signature"] == _signature(["豚肉", "キャベツ"])
+    assert len(row["signature"]) == NUM_PERM * 4
+    assert _signature(["卵"]) != _signature(["ねぎ"])
+    assert minhash_row(1, ["", " "]) is None
+
+
+def test_near_duplicate_pantries_are_found():
+    index = NearDuplicateIndex(threshold=0.75)
+    index.set_recipe(1, minhash_row(1, PANTRY))
+    index.set_recipe(2, minhash_row(2, ["じゃがいも", "にんじん", "牛肉", "たまねぎ"]))
+
+    # 1品多い・1品少ない程度の違いなら同じレシピを使う
+    recipe_id, similarity = index.find(PANTRY + ["塩"])
+    assert (recipe_id, similarity) == (1, 8 / 9)
+    assert index.find(PANTRY[:-1])[0] == 1
+    assert index.find(["豚肉", "キャベツ", "卵"]) is None
+    assert index.find(["", "  "]) is None
+    assert index.find(PANTRY[:6] + ["卵", "ねぎ"], threshold=0.5)[0] == 1
+
+    stats = index.stats()
+    assert (stats["recipes"], stats["lookups"], stats["matches"]) == (2, 4, 3)
+    assert stats["buckets"] <= 2 * minhash_index.BANDS
+
+
+def test_equal_similarity_prefers_newer_recipes_and_updates_replace_entries():
+    index = NearDuplicateIndex()
+    index.set_recipe(3, minhash_row(3, PANTRY))
+    index.set_recipe(7, minhash_row(7, PANTRY))
+    assert index.find(PANTRY) == (7, 1.0)
+
+    index.set_recipe(7, minhash_row(7, ["卵", "ねぎ"]))
+    assert index.find(PANTRY) == (3, 1.0)
+    index.remove_recipe(3)
+    index.set_recipe(7, None)
+    assert index.find(PANTRY) is None
+    assert index.stats()["recipes"] == index.stats()["buckets"] == 0
+
+
+def test_signatures_are_saved_with_recipes_and_backfilled_on_load(db):
+    generated = create_recipe(db, make_recipe("生姜焼き", ["豚肉", "しょうが"]), source_ingredients=PANTRY)
+    plain = create_recipe(db, make_recipe("ゆで卵", ["卵"]))
+    stored = dict(db.execute(select(recipe_minhash.c.recipe_id, recipe_minhash.c.ingredients)).all())
+    # 生成したレシピは手持ちの食材、それ以外はレシピの食材で比べる
+    assert stored == {generated["id"]: "\n".join(sorted(PANTRY)), plain["id"]: "卵"}
+
+    db.execute(delete(recipe_minhash).where(recipe_minhash.c.recipe_id == plain["id"]))
+    db.commit()
+    index = NearDuplicateIndex()
+    index.load(db)
+    assert db.execute(select(func.count()).select_from(recipe_minhash)).scalar() == 2
+    assert index.find(["卵"]) == (plain["id"], 1.0)
+    assert index.find(PANTRY)[0] == generated["id"]
+
+
+def test_generation_reuses_a_near_duplicate_recipe(api, db, fake_openai, monkeypatch):
+    saved = create_recipe(db, make_recipe("生姜焼き", ["豚肉", "キャベツ"]), source_ingredients=PANTRY)
+    pantry_index.load(db)
+    minhash_index.near_duplicate_index.load(db)
+    calls = []
+    service = openai_service._async_service
+    generate_recipe = service.generate_recipe
+
+    async def recording(*args, **kwargs):
+        calls.append(args)
+        return await generate_recipe(*args, **kwargs)
+
+    monkeypatch.setattr(service, "generate_recipe", recording)
+    avoided = metrics.Counter("avoided_total", "省略数", ("reason",))
+    monkeypatch.setattr("app.api.recipes.LLM_CALLS_AVOIDED", avoided)
+
+    body = api("POST", "/api/v1/recipes/generate/ai", json={
+        "ingredients": PANTRY + ["塩"], "servings": 4, "include_variations": False, "reuse_similar": True
+    }).json()
+    assert calls == []
+    assert body["reused"] == {"recipe_id": saved["id"], "similarity": 8 / 9}
+    # 人数に合わせて分量を換算する
+    assert body["recipe"]["servings"] == 4
+    assert [i["amount"] for i in body["recipe"]["ingredients"]] == ["2", "2"]
+    assert avoided.render()[2:] == ['avoided_total{reason="near_duplicate"} 1.0']
+
+    # reuse_similarを指定しなければ生成する
+    api("POST", "/api/v1/recipes/generate/ai", json={
+        "ingredients": PANTRY + ["塩"], "servings": 4, "include_variations": False
+    })
+    assert len(calls) == 1
+    assert api("GET", "/api/v1/near-duplicate/stats").json()["matches"] >= 1
@@ -0,0 +1,127 @@
+import sqlite3
+import pytest
+from app.crud.recipe import create_recipe, get_recipe
+from app.migrations import amount_value
+from app.services.nutrition import compute_nutrition, format_amount, parse_amount, scale_recipe
+from conftest import make_recipe
+
+
+@pytest.mark.parametrize("amount, expected", [
+    ("2", 2.0),
+    ("0.5", 0.5),
+    ("1/2", 0.5),
+    ("1 / 4", 0.25),
+    ("1と1/2", 1.5),
+    ("1 1/2", 1.5),
+    ("２", 2.0),
+    ("½", 0.5),
+    ("約200", 200.0),
+    ("200程度", 200.0),
+    ("2〜3", 2.5),
+    ("2-3", 2.5),
+    ("1/2~1", 0.75),
+    (3, 3.0),
+    (0.25, 0.25),
+])
+def test_parse_amount(amount, expected):
+    assert parse_amount(amount) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("amount", [None, "", "適量", "少々", "ひとつまみ", "1/0", "ひとかけ〜2"])
+def test_parse_amount_returns_none_for_non_numeric(amount):
+    assert parse_amount(amount) is None
+
+
+def test_long_vowel_mark_is_not_a_range_separator():
+    assert parse_amount("2ー3") is None
+    assert parse_amount("カップー1") is None
+
+
+@pytest.mark.parametrize("value, expected", [
+    (2, "2"),
+    (0.5, "1/2"),
+    (1.5, "1と1/2"),
+    (1 / 3, "1/3"),
+    (0.75, "3/4"),
+    (0.2, "0.2"),
+    (1.125, "1.12"),
+])
+def test_format_amount(value, expected):
+    assert format_amount(value) == expected
+
+
+def test_compute_nutrition_totals_and_per_serving(db):
+    curry = create_recipe(db, make_recipe("カレー", servings=4, ingredients=[
+        {"name": "にんじん", "amount": "1", "unit": "本", "calories": 30.0, "protein": 0.6, "fat": 0.1, "carbs": 7.0},
+        {"name": "豚肉", "amount": "300", "unit": "g", "calories": 720.0, "protein": 60.0, "fat": 50.0, "carbs": 0.0},
+        {"name": "塩", "amount": "少々", "unit": None},
+    ]))
+    empty = create_recipe(db, make_recipe("白湯", servings=0))
+
+    result = compute_nutrition(db, [curry["id"], empty["id"], 999])
+
+    assert set(result) == {curry["id"], empty["id"]}
+    assert result[curry["id"]]["total"] == {"calories": 750.0, "protein": 60.6, "fat": 50.1, "carbs": 7.0}
+    assert result[curry["id"]]["per_serving"]["calories"] == 187.5
+    assert result[curry["id"]]["missing"] == 1
+    assert result[empty["id"]] == {
+        "total": dict.fromkeys(("calories", "protein", "fat", "carbs"), 0.0),
+        "per_serving": dict.fromkeys(("calories", "protein", "fat", "carbs"), 0.0),
+        "missing": 0,
+    }
+    assert compute_nutrition(db, []) == {}
+
+
+def test_scale_recipe_rescales_numeric_amounts_and_nutrients(db):
+    recipe = create_recipe(db, make_recipe("肉じゃが", [
+        {"name": "じゃがいも", "amount": "3", "unit": "個", "calories": 228.0},
+        {"name": "砂糖", "amount": "大さじ1/2", "unit": "", "calories": 18.0},
+        {"name": "醤油", "amount": "1/2", "unit": "大さじ"},
+        {"name": "塩", "amount": "適量", "unit": None},
+    ]))
+
+    scaled = scale_recipe(get_recipe(db, recipe["id"]), 3)
+    ingredients = {i["name"]: i for i in scaled["ingredients"]}
+
+    assert scaled["servings"] == 3
+    assert ingredients["じゃがいも"]["amount"] == "4と1/2"
+    assert ingredients["じゃがいも"]["calories"] == 342.0
+    assert ingredients["醤油"]["amount"] == "3/4"
+    # 数値にできない分量はそのまま残し、栄養価だけを換算する
+    assert ingredients["砂糖"]["amount"] == "大さじ1/2"
+    assert ingredients["砂糖"]["calories"] == 27.0
+    assert ingredients["塩"]["amount"] == "適量"
+    assert ingredients["塩"]["calories"] is None
+    # 元のレシピは変更しない
+    assert get_recipe(db, recipe["id"])["servings"] == 2
+
+
+def test_scaled_and_nutrition_endpoints(api, db):
+    recipe = create_recipe(db, make_recipe("卵焼き", servings=1, ingredients=[
+        {"name": "卵", "amount": "2", "unit": "個", "calories": 160.0},
+    ]))
+
+    scaled = api("GET", f"/api/v1/recipes/{recipe['id']}/scaled", params={"servings": 2}).json()
+    assert scaled["ingredients"][0]["amount"] == "4"
+    assert api("GET", f"/api/v1/recipes/{recipe['id']}/scaled", params={"servings": 0}).status_code == 400
+    assert api("GET", f"/api/v1/recipes/{recipe['id']}/nutrition").json()["total"]["calories"] == 160.0
+    assert api("GET", "/api/v1/recipes/999/nutrition").status_code == 404
+    batch = api("GET", "/api/v1/recipes/nutrition", params={"ids": [recipe["id"], 999]}).json()
+    assert [entry["recipe_id"] for entry in batch] == [recipe["id"]]
+
+
+def test_amount_value_migration_backfills_existing_rows(tmp_path):
+    path = str(tmp_path / "recipe.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE recipe_ingredient (recipe_id INTEGER, ingredient_id INTEGER, amount VARCHAR)")
+    conn.executemany("INSERT INTO recipe_ingredient VALUES (1, ?, ?)", [(1, "1/2"), (2, "適量"), (3, "2〜3")])
+    conn.commit()
+    conn.close()
+
+    amount_value.migrate(path)
+    amount_value.migrate(path)
+
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT amount_value FROM recipe_ingredient ORDER BY ingredient_id").fetchall()
+    conn.close()
+    assert rows == [(0.5,), (None,), (2.5,)]
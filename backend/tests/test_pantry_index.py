@@ -0,0 +1,73 @@
+import pytest
+from app.crud.recipe import create_recipe, delete_recipe
+from app.services.pantry_index import PantryIndex
+from conftest import make_recipe
+
+
+@pytest.fixture
+def index():
+    index = PantryIndex()
+    index.set_recipe(1, ["卵", "ねぎ"])
+    index.set_recipe(2, ["卵", "ねぎ", "豚肉", "もやし"])
+    index.set_recipe(3, ["じゃがいも", "にんじん", "たまねぎ"])
+    return index
+
+
+def test_coverage_ranks_recipes_covered_by_the_pantry(index):
+    results = index.search(["卵", "ねぎ", "豚肉"])
+
+    assert [(r["id"], r["score"]) for r in results] == [(1, 1.0), (2, 0.75)]
+    assert results[1]["matched"] == sorted(["卵", "ねぎ", "豚肉"])
+    assert results[1]["missing"] == ["もやし"]
+
+
+def test_jaccard_penalizes_unused_pantry_items(index):
+    results = index.search(["卵", "ねぎ", "豚肉", "もやし", "にんじん"], metric="jaccard")
+    assert [r["id"] for r in results] == [2, 1, 3]
+    assert [r["score"] for r in results] == pytest.approx([0.8, 0.4, 1 / 7])
+
+
+def test_max_missing_and_limit(index):
+    assert [r["id"] for r in index.search(["卵", "たまねぎ"], max_missing=1)] == [1]
+    assert [r["id"] for r in index.search(["卵", "たまねぎ"], limit=1)] == [1]
+    assert index.search(["鮭"]) == []
+
+
+def test_ties_prefer_fewer_missing_then_newer_recipes():
+    index = PantryIndex()
+    index.set_recipe(1, ["卵", "砂糖"])
+    index.set_recipe(2, ["卵", "砂糖"])
+    index.set_recipe(3, ["卵", "砂糖", "牛乳", "バター"])
+    # どれも手持ちで半分をまかなえるが、不足の少ないもの・新しいものを先にする
+    assert [r["id"] for r in index.search(["卵", "牛乳"])] == [2, 1, 3]
+
+
+def test_names_are_normalized_and_updates_replace_postings(index):
+    index.set_recipe(1, [" ﾈｷﾞ", "ネギ", ""])
+    assert index.ingredients(1) == ("ネギ",)
+    assert [r["id"] for r in index.search(["ネギ "])] == [1]
+    assert [r["id"] for r in index.search(["ねぎ"])] == [2]
+
+    index.remove_recipe(2)
+    index.set_recipe(3, [])
+    assert index.search(["ねぎ", "じゃがいも"]) == []
+    assert sorted(index.recipe_ids()) == [1]
+    assert len(index) == 1
+
+
+def test_index_is_loaded_from_and_kept_in_sync_with_the_database(api, db):
+    omelette = create_recipe(db, make_recipe("オムレツ", ["卵", "牛乳"]))
+    fried_rice = create_recipe(db, make_recipe("チャーハン", ["卵", "ご飯", "ねぎ"]))
+
+    loaded = PantryIndex()
+    loaded.load(db)
+    assert sorted(loaded.recipe_ids()) == [omelette["id"], fried_rice["id"]]
+    assert loaded.ingredients(fried_rice["id"]) == tuple(sorted(["卵", "ご飯", "ねぎ"]))
+
+    results = api("POST", "/api/v1/recipes/what-can-i-cook", json={"ingredients": ["卵", "牛乳"]}).json()
+    assert [(r["id"], r["title"]) for r in results] == [(omelette["id"], "オムレツ"), (fried_rice["id"], "チャーハン")]
+    delete_recipe(db, omelette["id"])
+    results = api("POST", "/api/v1/recipes/what-can-i-cook", json={"ingredients": ["卵", "牛乳"], "max_missing": 2})
+    assert [r["id"] for r in results.json()] == [fried_rice["id"]]
+    bad_metric = api("POST", "/api/v1/recipes/what-can-i-cook", json={"ingredients": ["卵"], "metric": "cosine"})
+    assert bad_metric.status_code == 400
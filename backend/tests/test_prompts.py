@@ -0,0 +1,109 @@
+import sys
+import asyncio
+from argparse import Namespace
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from bench import fake_openai as fake
+from bench import prompt_ab
+from app.services import prompts, tokenizer
+from app.services.prompts import (
+    MAX_MAX_TOKENS, MIN_MAX_TOKENS, build_recipe_messages, build_repair_messages, build_variation_messages,
+    recipe_max_tokens, variation_max_tokens
+)
+
+RECIPE = {"title": "豚肉の生姜焼き", "description": "甘辛いたれで焼く"}
+
+
+def test_max_tokens_grow_with_the_input_within_bounds():
+    assert recipe_max_tokens(5) == prompts.RECIPE_BASE_TOKENS + 5 * prompts.RECIPE_TOKENS_PER_INGREDIENT
+    assert recipe_max_tokens(6) > recipe_max_tokens(5)
+    assert recipe_max_tokens(0) == MIN_MAX_TOKENS
+    assert recipe_max_tokens(500) == MAX_MAX_TOKENS
+
+    assert variation_max_tokens(4, count=1) < variation_max_tokens(4, count=2)
+    assert variation_max_tokens(4, count=2) == 2 * (
+        prompts.VARIATION_BASE_TOKENS + 4 * prompts.VARIATION_TOKENS_PER_INGREDIENT
+    )
+    assert variation_max_tokens(100) == MAX_MAX_TOKENS
+
+
+def test_compact_recipe_prompt_omits_default_fields():
+    messages = build_recipe_messages(["卵", "ねぎ"], 3)
+
+    assert messages[0] == {"role": "system", "content": prompts.RECIPE_SYSTEM_PROMPT}
+    prompt = messages[1]["content"]
+    assert "3人前" in prompt and "食材: 卵、ねぎ" in prompt
+    for field in ("protein", "fat", "carbs", "season", "category", "is_vegetarian"):
+        assert field not in prompt
+    assert '"ingredients":[{"name":"","amount":1,"unit":"","calories":kcal}]' in prompt
+
+    legacy = build_recipe_messages(["卵", "ねぎ"], 3, variant="legacy")[1]["content"]
+    assert "3人前" in legacy and '"protein": null' in legacy
+    assert tokenizer.count_tokens(prompt) < tokenizer.count_tokens(legacy)
+
+
+def test_variation_prompt_follows_the_output_format_and_count():
+    prompt = build_variation_messages(RECIPE, count=2)[1]["content"]
+    assert prompt.startswith("次のレシピのバリエーションを2つ、JSON配列のみで")
+    assert "レシピ: 豚肉の生姜焼き\n甘辛いたれで焼く" in prompt
+    # バリエーションの分量は求めない
+    assert '"amount"' not in prompt
+
+    json_mode = build_variation_messages(RECIPE, json_mode=True)[1]["content"]
+    assert '{"variations": [...]} の形式のJSONオブジェクト' in json_mode
+    legacy = build_variation_messages(RECIPE, json_mode=True, variant="legacy")[1]["content"]
+    assert '{"variations": [...]} の形式のJSONオブジェクト' in legacy
+
+
+def test_default_variant_comes_from_the_setting(monkeypatch):
+    monkeypatch.setattr(prompts, "PROMPT_VARIANT", "legacy")
+    assert build_recipe_messages(["卵"], 2) == build_recipe_messages(["卵"], 2, variant="legacy")
+    assert build_recipe_messages(["卵"], 2, variant="compact") != build_recipe_messages(["卵"], 2)
+
+
+def test_repair_messages_include_the_error_and_text():
+    messages = build_repair_messages('{"title": ', "Expecting value")
+    assert messages[0]["content"] == prompts.REPAIR_SYSTEM_PROMPT
+    assert messages[1]["content"] == 'エラー: Expecting value\n\n{"title": '
+
+
+@pytest.fixture
+def without_tiktoken(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    tokenizer._encoding.cache_clear()
+    yield
+    tokenizer._encoding.cache_clear()
+
+
+def test_tokens_are_estimated_without_tiktoken(without_tiktoken):
+    assert tokenizer._encoding("gpt-3.5-turbo") is None
+    # ASCIIは4文字で1トークン、それ以外は1文字で1トークン
+    assert tokenizer.count_tokens("abcdefgh") == 2
+    assert tokenizer.count_tokens("卵とねぎ") == 4
+    assert tokenizer.count_tokens("") == 0
+
+    messages = [{"role": "system", "content": "abcd"}, {"role": "user", "content": None}]
+    assert tokenizer.count_message_tokens(messages) == 1 + 2 * tokenizer.MESSAGE_OVERHEAD
+
+
+def test_ab_harness_compares_variants_against_the_fake_server(fake_openai, monkeypatch):
+    def client(base_url=None):
+        return AsyncOpenAI(
+            api_key="test",
+            base_url="http://fake-openai/v1",
+            http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app))
+        )
+
+    monkeypatch.setattr(prompt_ab, "AsyncOpenAI", client)
+    args = Namespace(model="gpt-test", variants=["compact", "legacy"], samples=3, concurrency=2, seed=1, variations=True)
+
+    results = asyncio.run(prompt_ab.run(args))["results"]
+    assert set(results) == {"compact", "legacy"}
+    for kinds in results.values():
+        assert kinds["recipe"]["calls"] == kinds["variations"]["calls"] == 3
+        assert kinds["recipe"]["parse_rate"] == 1.0
+    # legacyは固定のmax_tokensのまま比べる
+    assert results["legacy"]["recipe"]["max_tokens_mean"] == MAX_MAX_TOKENS
+    assert results["compact"]["recipe"]["max_tokens_mean"] < MAX_MAX_TOKENS
+    assert results["compact"]["recipe"]["prompt_tokens_mean"] < results["legacy"]["recipe"]["prompt_tokens_mean"]
@@ -0,0 +1,209 @@
+import asyncio
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import httpx
+import openai
+import pytest
+from app.services import rate_limiter
+from app.services.rate_limiter import (
+    BATCH, INTERACTIVE, RateLimitScheduler, TokenBucket, _is_retryable, _retry_after
+)
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=clock.monotonic, time=time.time))
+    return clock
+
+
+def _rate_limit_error(headers=None, code=None) -> openai.RateLimitError:
+    response = httpx.Response(429, request=REQUEST, headers=headers or {})
+    return openai.RateLimitError("Rate limit reached", response=response, body={"code": code} if code else None)
+
+
+def _server_error() -> openai.InternalServerError:
+    return openai.InternalServerError("Server error", response=httpx.Response(500, request=REQUEST), body=None)
+
+
+def test_token_bucket_refills_continuously(clock):
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.time_until(60) == 0.0
+
+    bucket.consume(60)
+    assert bucket.time_until(1) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.time_until(1) == pytest.approx(0.5)
+    clock.now += 120
+    assert bucket.tokens == 0.5
+    assert bucket.time_until(1) == 0.0
+    # 補充は上限（1分間の量）までに留める
+    assert bucket.tokens == 60
+
+
+def test_token_bucket_caps_requests_larger_than_capacity(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.consume(1000)
+    assert bucket.tokens == 0
+    clock.now += 60
+    assert bucket.time_until(1000) == 0.0
+
+
+def test_token_bucket_refund_and_drain(clock):
+    bucket = TokenBucket(per_minute=100)
+    bucket.consume(80)
+    bucket.refund(30)
+    assert bucket.tokens == 50
+    bucket.refund(1000)
+    assert bucket.tokens == 100
+    bucket.drain()
+    assert bucket.tokens == 0
+    assert bucket.time_until(10) == pytest.approx(6.0)
+
+
+def test_retry_after_headers():
+    def error(headers):
+        return SimpleNamespace(response=SimpleNamespace(headers=headers))
+
+    assert _retry_after(error({"retry-after-ms": "500"})) == 0.5
+    assert _retry_after(error({"retry-after-ms": "x", "retry-after": "3"})) == 3.0
+    date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < _retry_after(error({"retry-after": date})) <= 30
+    assert _retry_after(error({"retry-after": "いつか"})) is None
+    assert _retry_after(error({})) is None
+    assert _retry_after(ValueError("no response")) is None
+
+
+def test_retryable_errors():
+    assert _is_retryable(_rate_limit_error())
+    assert _is_retryable(_server_error())
+    assert _is_retryable(openai.APIConnectionError(request=REQUEST))
+    # クォータ切れ・不正なリクエストは再試行しない
+    assert not _is_retryable(_rate_limit_error(code="insufficient_quota"))
+    bad_request = openai.BadRequestError("bad", response=httpx.Response(400, request=REQUEST), body=None)
+    assert not _is_retryable(bad_request)
+
+
+def test_backoff_uses_retry_after_and_caps_it():
+    scheduler = RateLimitScheduler(rpm=60, tpm=1000, backoff_base=1.0, backoff_max=10.0)
+    assert scheduler._backoff(0, _rate_limit_error({"retry-after-ms": "250"})) == 0.25
+    assert scheduler._backoff(0, _rate_limit_error({"retry-after": "100"})) == 10.0
+    for attempt in range(6):
+        assert 0 <= scheduler._backoff(attempt, _server_error()) <= min(10.0, 2 ** attempt)
+
+
+def test_dispatch_order_follows_priority_then_arrival():
+    scheduler = RateLimitScheduler(rpm=1200, tpm=100000)
+    order = []
+
+    async def main():
+        scheduler.requests.drain()
+
+        async def call(name, priority):
+            await scheduler.acquire(1, priority)
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(call("batch-1", BATCH))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(call("batch-2", BATCH)))
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(call("interactive", INTERACTIVE)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["interactive", "batch-1", "batch-2"]
+    assert scheduler.stats()["max_queue_depth"] == 3
+
+
+def test_token_budget_delays_large_calls():
+    scheduler = RateLimitScheduler(rpm=1000, tpm=6000)
+
+    async def main():
+        await scheduler.acquire(6000)
+        started = time.monotonic()
+        # 100トークン/秒で補充されるため、20トークン分は約0.2秒待つ
+        await scheduler.acquire(20)
+        return time.monotonic() - started
+
+    assert 0.15 < asyncio.run(main()) < 1.0
+
+
+def test_run_retries_transient_errors_then_succeeds():
+    scheduler = RateLimitScheduler(rpm=1000, tpm=100000, backoff_base=0.001)
+    errors = [_server_error(), openai.APIConnectionError(request=REQUEST)]
+
+    async def fn():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert asyncio.run(scheduler.run(fn, 10)) == "ok"
+    assert scheduler.retries == 2
+    assert scheduler.rate_limited == 0
+    assert scheduler.dispatched == 3
+
+
+def test_run_pauses_everything_after_rate_limit():
+    scheduler = RateLimitScheduler(rpm=1000, tpm=100000)
+    errors = [_rate_limit_error({"retry-after-ms": "200"})]
+
+    async def fn():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    started = time.monotonic()
+    assert asyncio.run(scheduler.run(fn, 10)) == "ok"
+    assert time.monotonic() - started >= 0.2
+    assert scheduler.rate_limited == 1
+
+
+def test_run_gives_up_on_non_retryable_and_after_max_retries():
+    scheduler = RateLimitScheduler(rpm=1000, tpm=100000, max_retries=2, backoff_base=0.001)
+    calls = []
+
+    async def quota():
+        calls.append("quota")
+        raise _rate_limit_error(code="insufficient_quota")
+
+    async def down():
+        calls.append("down")
+        raise _server_error()
+
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(scheduler.run(quota, 10))
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(scheduler.run(down, 10))
+    assert calls == ["quota", "down", "down", "down"]
+    assert scheduler.failures == 2
+
+
+def test_run_settles_estimate_with_reported_usage(clock):
+    scheduler = RateLimitScheduler(rpm=1000, tpm=10000)
+
+    async def fn():
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=300))
+
+    asyncio.run(scheduler.run(fn, 1000))
+    assert scheduler.tokens.tokens == 9700
+
+
+def test_settle_consumes_when_usage_exceeds_estimate(clock):
+    scheduler = RateLimitScheduler(rpm=1000, tpm=10000)
+    scheduler.tokens.consume(100)
+    scheduler.settle(100, 250)
+    assert scheduler.tokens.tokens == 9750
+    scheduler.settle(250, 50)
+    assert scheduler.tokens.tokens == 9950
@@ -0,0 +1,85 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from app.crud.recipe import create_recipe, get_recipe, get_recipes, get_recipes_versions
+from app.database import engine
+from app.schemas.recipe import Recipe
+from conftest import make_recipe
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _create_recipes(db, count: int):
+    return [
+        create_recipe(db, make_recipe(f"レシピ{i}", [f"食材{i}", "塩", "こしょう"] if i % 3 else []))
+        for i in range(count)
+    ]
+
+
+def test_listing_uses_two_queries_regardless_of_page_size(db):
+    _create_recipes(db, 12)
+    db.expire_all()
+
+    with count_queries() as statements:
+        recipes = get_recipes(db, limit=10)
+
+    assert len(recipes) == 10
+    assert len(statements) == 2
+
+
+def test_ingredients_keep_their_order_and_empty_recipes_get_an_empty_list(db):
+    created = _create_recipes(db, 4)
+    recipes = get_recipes(db)
+
+    assert [r["title"] for r in recipes] == [r["title"] for r in created]
+    assert recipes[0]["ingredients"] == []
+    assert [i["name"] for i in recipes[1]["ingredients"]] == ["食材1", "塩", "こしょう"]
+    # 同じ食材はカタログの1行を共有する
+    assert recipes[1]["ingredients"][1]["id"] == recipes[2]["ingredients"][1]["id"]
+    for recipe in recipes:
+        Recipe.parse_obj(recipe)
+
+
+def test_keyset_paging_matches_offset_paging(db):
+    _create_recipes(db, 7)
+    by_offset = [get_recipes(db, skip=skip, limit=3) for skip in (0, 3, 6)]
+
+    by_cursor, after_id = [], None
+    while True:
+        page = get_recipes(db, limit=3, after_id=after_id)
+        if not page:
+            break
+        by_cursor.append(page)
+        after_id = page[-1]["id"]
+
+    assert by_cursor == by_offset
+    assert [v.id for v in get_recipes_versions(db, limit=3, after_id=by_offset[0][-1]["id"])] == [
+        r["id"] for r in by_offset[1]
+    ]
+
+
+def test_get_recipe_returns_none_for_missing_id(db):
+    created = _create_recipes(db, 2)
+    assert get_recipe(db, created[1]["id"]) == get_recipes(db)[1]
+    assert get_recipe(db, 999) is None
+
+
+def test_list_endpoint_pages_with_cursor_header(api, db):
+    _create_recipes(db, 5)
+
+    first = api("GET", "/api/v1/recipes/", params={"limit": 3})
+    second = api("GET", "/api/v1/recipes/", params={"limit": 3, "after_id": first.headers["x-next-cursor"]})
+
+    assert [r["title"] for r in first.json() + second.json()] == [f"レシピ{i}" for i in range(5)]
+    assert "x-next-cursor" not in second.headers
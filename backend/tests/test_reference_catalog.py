@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import select
+from app.crud.recipe import create_recipe
+from app.models.recipe import CookingMethod, Ingredient, Seasoning, recipe_cooking_method, recipe_seasoning
+from app.services import recipe_generator as generator_module
+from app.services.compatibility_graph import CompatibilityGraph
+from app.services.reference_catalog import ReferenceCatalog, reference_catalog
+from app.services.recipe_generator import RecipeGenerator
+from conftest import make_recipe
+
+
+@pytest.fixture
+def catalog_db(db, monkeypatch):
+    db.add_all([
+        CookingMethod(name="stir-frying", description="強火で炒める", time_required=10),
+        CookingMethod(name="steaming", description="蒸す", time_required=15),
+        CookingMethod(name="grilling", description="焼く", time_required=None),
+        Seasoning(name="醤油", category="soy_sauce", usage_notes="回しかけます"),
+        Seasoning(name="みりん", category="mirin", usage_notes="加えます"),
+        Seasoning(name="オリーブオイル", category="olive_oil", usage_notes="かけます"),
+        Ingredient(name="キャベツ", season="spring", category="vegetable", is_vegetarian=True, is_vegan=True),
+        Ingredient(name="豚肉", category="meat"),
+    ])
+    db.commit()
+    # 料理の種類と旬の食材の選択を固定する
+    monkeypatch.setattr(generator_module.random, "choice", lambda items: items[0])
+    monkeypatch.setattr(RecipeGenerator, "get_season", lambda self: "spring")
+    monkeypatch.setattr(generator_module, "compatibility_graph", CompatibilityGraph())
+    return db
+
+
+def test_catalog_groups_detached_objects(catalog_db):
+    catalog = ReferenceCatalog()
+    catalog.ensure_loaded(catalog_db)
+    catalog_db.close()
+
+    # 読み込んだセッションとは独立して属性を参照できる
+    assert [m.name for m in catalog.get_cooking_methods(["steaming", "stir-frying", "unknown"])] == [
+        "steaming", "stir-frying"
+    ]
+    assert [s.name for s in catalog.get_seasonings(["mirin", "soy_sauce"])] == ["みりん", "醤油"]
+    assert [i.name for i in catalog.ingredients_by_season["spring"]] == ["キャベツ"]
+    assert len(catalog.cooking_methods) == 3
+
+
+def test_catalog_reloads_after_orm_writes(catalog_db):
+    reference_catalog.ensure_loaded(catalog_db)
+    version = reference_catalog.version
+
+    catalog_db.add(CookingMethod(name="steaming", description="せいろで蒸す", time_required=20))
+    catalog_db.commit()
+    assert reference_catalog.version > version
+    reference_catalog.ensure_loaded(catalog_db)
+    assert len(reference_catalog.get_cooking_methods(["steaming"])) == 2
+
+
+def test_seasonal_ingredients_saved_with_recipes_reload_the_catalog(catalog_db):
+    reference_catalog.ensure_loaded(catalog_db)
+    create_recipe(catalog_db, make_recipe("筍ご飯", [{"name": "たけのこ", "amount": "1", "unit": "本", "season": "spring"}]))
+    reference_catalog.ensure_loaded(catalog_db)
+    assert sorted(i.name for i in reference_catalog.ingredients_by_season["spring"]) == ["たけのこ", "キャベツ"]
+
+
+def test_generated_recipe_does_not_attach_shared_catalog_objects(catalog_db):
+    generator = RecipeGenerator(catalog_db)
+    generated = generator.generate_recipe([{"name": "豚肉", "amount": "200", "unit": "g"}])
+
+    recipe = generated["recipe"]
+    assert recipe.cuisine_type == "japanese"
+    assert [(i.name, i.amount, i.unit) for i in recipe.ingredients] == [("豚肉", "200", "g"), ("キャベツ", "適量", "")]
+    assert not catalog_db.new
+    # 肉（grilling）と野菜（stir-frying / steaming）の調理方法、和食の調味料を提案する
+    methods = {method_id for method_id, _ in generated["cooking_methods"]}
+    assert len(methods) == 3
+    assert recipe.cooking_time == 25
+    assert len(generated["seasoning_ids"]) == 2
+
+    saved = generator.save_recipe(generated)
+    links = catalog_db.execute(
+        select(recipe_cooking_method.c.cooking_method_id, recipe_cooking_method.c.duration)
+        .where(recipe_cooking_method.c.recipe_id == saved["id"])
+    ).all()
+    assert {method_id for method_id, _ in links} == methods
+    seasonings = catalog_db.execute(
+        select(recipe_seasoning.c.seasoning_id).where(recipe_seasoning.c.recipe_id == saved["id"])
+    ).scalars().all()
+    assert sorted(seasonings) == sorted(generated["seasoning_ids"])
+    # 共有しているカタログのオブジェクトはどのセッションにも属さない
+    assert all(m not in catalog_db for m in reference_catalog.cooking_methods)
+
+    # 別のセッションからもそのまま生成・保存できる
+    other = RecipeGenerator(catalog_db)
+    assert other.save_recipe(other.generate_recipe([{"name": "豚肉"}]))["id"] != saved["id"]
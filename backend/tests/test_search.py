@@ -0,0 +1,83 @@
+from sqlalchemy import text
+from app.crud.recipe import create_recipe, delete_recipe, update_recipe
+from app.crud.search import SEARCH_TABLE, SNIPPET_CLOSE, SNIPPET_OPEN, rebuild_search_index, search_recipes
+from conftest import make_recipe
+
+
+def _ids(results):
+    return [r["id"] for r in results]
+
+
+def test_match_ranks_title_hits_above_instruction_hits(db):
+    in_steps = create_recipe(db, make_recipe("野菜炒め", instructions="1. キャベツと豚肉を炒める"))
+    in_title = create_recipe(db, make_recipe("豚肉の生姜焼き", ingredients=["豚肉", "しょうが"]))
+    create_recipe(db, make_recipe("かぼちゃの煮物", ingredients=["かぼちゃ"]))
+
+    results = search_recipes(db, "豚肉の")
+    assert _ids(results) == [in_title["id"]]
+
+    results = search_recipes(db, "豚肉を炒")
+    assert _ids(results) == [in_steps["id"]]
+    assert f"{SNIPPET_OPEN}豚肉を炒{SNIPPET_CLOSE}" in results[0]["snippet"]
+    assert results[0]["score"] > 0
+
+
+def test_short_terms_fall_back_to_like(db):
+    egg = create_recipe(db, make_recipe("卵焼き", ingredients=["卵", "砂糖"]))
+    soup = create_recipe(db, make_recipe("かきたま汁", description="卵でとじた汁物", ingredients=["卵", "ねぎ"]))
+    create_recipe(db, make_recipe("冷奴", ingredients=["豆腐"]))
+
+    # trigramで扱えない2文字以下の語は部分一致で探し、新しい順に返す
+    results = search_recipes(db, "卵")
+    assert _ids(results) == [soup["id"], egg["id"]]
+    assert results[0]["snippet"] == f"{SNIPPET_OPEN}卵{SNIPPET_CLOSE}でとじた汁物"
+    assert results[0]["score"] == 0.0
+
+    # 長い語と短い語はどちらも満たすものだけを返す
+    assert _ids(search_recipes(db, "卵 かきたま")) == [soup["id"]]
+    assert _ids(search_recipes(db, "ねぎ 砂糖")) == []
+
+
+def test_like_wildcards_in_short_terms_are_escaped(db):
+    create_recipe(db, make_recipe("塩むすび", description="塩だけのおむすび"))
+    create_recipe(db, make_recipe("100%ジュース", description="果汁100%"))
+
+    assert [r["title"] for r in search_recipes(db, "%")] == ["100%ジュース"]
+    assert search_recipes(db, "_") == []
+
+
+def test_terms_are_normalized_and_quotes_cannot_break_the_query(db):
+    recipe = create_recipe(db, make_recipe("ABCスープ", ingredients=["トマト"]))
+
+    assert _ids(search_recipes(db, "ＡＢＣ")) == [recipe["id"]]
+    assert search_recipes(db, '"スープ OR') == []
+    assert search_recipes(db, "   ") == []
+
+
+def test_index_follows_updates_and_deletes(db):
+    recipe = create_recipe(db, make_recipe("鮭のムニエル", ingredients=["鮭"]))
+    update_recipe(db, recipe["id"], make_recipe("鯖の味噌煮", ingredients=["鯖"]))
+
+    assert search_recipes(db, "ムニエル") == []
+    assert _ids(search_recipes(db, "味噌煮")) == [recipe["id"]]
+    delete_recipe(db, recipe["id"])
+    assert search_recipes(db, "味噌煮") == []
+
+
+def test_rebuild_restores_a_cleared_index(db):
+    recipe = create_recipe(db, make_recipe("筑前煮", ingredients=["鶏肉", "ごぼう"]))
+    db.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    db.commit()
+    assert search_recipes(db, "筑前煮") == []
+
+    assert rebuild_search_index(db) == 1
+    assert _ids(search_recipes(db, "ごぼう")) == [recipe["id"]]
+
+
+def test_search_endpoint_limits_results(api, db):
+    for i in range(3):
+        create_recipe(db, make_recipe(f"カレーライス{i}"))
+
+    results = api("GET", "/api/v1/recipes/search", params={"q": "カレー", "limit": 2}).json()
+    assert len(results) == 2
+    assert all(r["title"].startswith("カレーライス") for r in results)
@@ -0,0 +1,230 @@
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import pytest
+from bench import fake_openai as fake
+from app.services import openai_service
+from app.services.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_with_the_same_key_share_one_execution():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return {"key": key, "items": []}
+
+    async def main():
+        return await asyncio.gather(
+            flight.do("a", lambda: fetch("a")),
+            flight.do("a", lambda: fetch("a")),
+            flight.do("b", lambda: fetch("b")),
+        )
+
+    first, second, other = asyncio.run(main())
+    assert calls == ["a", "b"]
+    assert first == second == {"key": "a", "items": []}
+    # 呼び出し元ごとに別のコピーを受け取る
+    first["items"].append(1)
+    assert second["items"] == []
+    assert other["key"] == "b"
+    assert flight.coalesced == 1
+
+
+def test_finished_key_runs_again():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        return [await flight.do("a", fetch), await flight.do("a", fetch)]
+
+    assert asyncio.run(main()) == [1, 2]
+
+
+def test_error_is_raised_to_every_waiter():
+    flight = AsyncSingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("失敗")
+
+    async def main():
+        return await asyncio.gather(flight.do("a", fail), flight.do("a", fail), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [type(r) for r in results] == [ValueError, ValueError]
+    assert flight._calls == {}
+
+
+def test_cancelling_one_waiter_does_not_cancel_the_shared_call():
+    flight = AsyncSingleFlight()
+    finished = []
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+        return "ok"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("a", fetch))
+        second = asyncio.ensure_future(flight.do("a", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "ok"
+    assert finished == [1]
+
+
+def test_cancelling_every_waiter_cancels_the_shared_call():
+    flight = AsyncSingleFlight()
+    finished = []
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+        return "ok"
+
+    async def main():
+        waiters = [asyncio.ensure_future(flight.do("a", fetch)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert flight._calls == {}
+        # キャンセル後の呼び出しは新しく実行する
+        result = await flight.do("a", fetch)
+        await asyncio.sleep(0.06)
+        return result
+
+    assert asyncio.run(main()) == "ok"
+    assert finished == [1]
+
+
+def test_identical_generation_requests_call_openai_once(fake_openai, monkeypatch):
+    service = openai_service.get_async_openai_service()
+    calls = []
+    generate = service._generate_recipe
+
+    async def counting(ingredients, servings, priority=0):
+        calls.append(ingredients)
+        return await generate(ingredients, servings, priority)
+
+    monkeypatch.setattr(service, "_generate_recipe", counting)
+    fake_openai.update(latency_ms=100.0, latency_sigma=0.0)
+
+    async def main():
+        # キャッシュに入る前に届いた同じ食材（順序違い）の生成は1回の呼び出しにまとめる
+        return await asyncio.gather(
+            service.generate_recipe(["鮭", "きのこ"], 2),
+            service.generate_recipe(["きのこ", "鮭"], 2),
+        )
+
+    first, second = asyncio.run(main())
+    assert len(calls) == 1
+    assert first == second
+    assert first is not second
+
+
+def test_threads_with_the_same_key_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return {"items": []}
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        leader = executor.submit(flight.do, "a", fetch)
+        started.wait()
+        followers = [executor.submit(flight.do, "a", fetch) for _ in range(2)]
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert calls == [1]
+    assert results[0] == results[1] == results[2]
+    # 後続の呼び出し元は別のコピーを受け取る
+    assert results[1] is not results[0] and results[1] is not results[2]
+    assert flight.coalesced == 2
+    assert flight.do("a", lambda: "again") == "again"
+
+
+def test_thread_errors_are_raised_to_every_waiter():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.05)
+        raise ValueError("失敗")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, "a", fail)
+        started.wait()
+        follower = executor.submit(flight.do, "a", fail)
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+    assert flight._calls == {}
+
+
+def _sync_service(calls):
+    """同期版のサービスをbench.fake_openaiの応答を返すトランスポートにつなぐ"""
+    def handler(request):
+        body = json.loads(request.content)
+        calls.append(body["messages"][-1]["content"])
+        time.sleep(0.05)
+        content = fake._make_content(body["messages"])
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": fake._usage(body["messages"], content),
+        })
+
+    from openai import OpenAI
+    service = openai_service.OpenAIService()
+    service.client = OpenAI(
+        api_key="test",
+        base_url="http://fake-openai/v1",
+        http_client=httpx.Client(transport=httpx.MockTransport(handler))
+    )
+    return service
+
+
+def test_sync_service_coalesces_identical_generations(fake_openai):
+    calls = []
+    service = _sync_service(calls)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(service.generate_recipe, ingredients, 2) for ingredients in (
+            ["鮭", "きのこ"], ["きのこ", "鮭"], ["鮭", "きのこ"]
+        )]
+        recipes = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert recipes[0] == recipes[1] == recipes[2]
+    assert recipes[0]["servings"] == 2
+    # 生成後はキャッシュから返す
+    assert service.generate_recipe(["鮭", "きのこ"], 2) == recipes[0]
+    assert len(calls) == 1
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        variations = list(executor.map(lambda _: service.get_recipe_variations(recipes[0]), range(2)))
+    assert len(calls) == 2
+    assert len(variations[0]) == 3 and variations[0] == variations[1]
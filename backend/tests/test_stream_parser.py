@@ -0,0 +1,137 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from app.services import openai_service
+from app.services.metrics import LLM_TOKENS
+from app.services.openai_service import StreamUsage, _stream_usage
+from app.services.rate_limiter import rate_limit_scheduler
+from app.services.stream_parser import IncrementalRecipeParser
+
+RECIPE = {
+    "title": "卵とねぎの炒め物",
+    "description": "\"簡単\"な一品。",
+    "instructions": "1. ねぎを切る\n2. 卵を溶く\n3. 炒める",
+    "difficulty": "easy",
+    "cooking_time": 10,
+    "servings": 2,
+    "ingredients": [
+        {"name": "卵", "amount": "2", "unit": "個"},
+        {"name": "ねぎ", "amount": "1/2", "unit": "本"},
+    ],
+}
+# \\uXXXX のエスケープも分割位置によって途中で切れるよう、ASCIIのみでエンコードする
+RECIPE_JSON = "```json\n" + json.dumps(RECIPE, indent=2) + "\n```"
+
+
+def _parse(chunks):
+    parser = IncrementalRecipeParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+def _expected_events():
+    fields = [
+        ("field", {"name": name, "value": value})
+        for name, value in RECIPE.items() if name not in ("ingredients", "instructions")
+    ]
+    steps = [("instruction", {"step": step}) for step in RECIPE["instructions"].split("\n")]
+    ingredients = [("ingredient", ingredient) for ingredient in RECIPE["ingredients"]]
+    return fields[:2] + steps + fields[2:] + ingredients
+
+
+def test_events_are_emitted_in_document_order():
+    assert _parse([RECIPE_JSON]) == _expected_events()
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16])
+def test_events_do_not_depend_on_chunk_boundaries(size):
+    chunks = [RECIPE_JSON[i:i + size] for i in range(0, len(RECIPE_JSON), size)]
+    assert _parse(chunks) == _expected_events()
+
+
+def test_instruction_is_emitted_as_soon_as_its_line_ends():
+    parser = IncrementalRecipeParser()
+    assert parser.feed('{"instructions": "1. 切る\\n2. 焼') == [("instruction", {"step": "1. 切る"})]
+    assert parser.feed('く"') == [("instruction", {"step": "2. 焼く"})]
+
+
+def test_instructions_as_array_of_strings():
+    events = _parse(['{"instructions": ["1. 切る", ', '"2. 焼く"], "servings": 2}'])
+    assert events == [
+        ("instruction", {"step": "1. 切る"}),
+        ("instruction", {"step": "2. 焼く"}),
+        ("field", {"name": "servings", "value": 2}),
+    ]
+
+
+def test_incomplete_values_are_not_emitted():
+    parser = IncrementalRecipeParser()
+    assert parser.feed('{"title": "途中') == []
+    assert IncrementalRecipeParser().feed('{"ingredients": [{"name": "卵"') == []
+
+
+def test_stream_usage_prefers_reported_usage():
+    messages = [{"role": "user", "content": "卵"}]
+    assert _stream_usage({"prompt_tokens": 3, "completion_tokens": 4, "total_tokens": 7}, messages, "x") == (3, 4, 7)
+    usage = SimpleNamespace(prompt_tokens=1, completion_tokens=2, total_tokens=3)
+    assert _stream_usage(usage, messages, "x") == StreamUsage(1, 2, 3)
+
+
+def test_stream_usage_falls_back_to_counting_tokens():
+    usage = _stream_usage(None, [{"role": "user", "content": "卵とねぎ"}], "レシピ")
+    assert usage.prompt_tokens > 0 and usage.completion_tokens > 0
+    assert usage.total_tokens == usage.prompt_tokens + usage.completion_tokens
+
+
+def _sse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_endpoint_sends_parsed_events_and_saves_recipe(api, fake_openai):
+    response = api("POST", "/api/v1/recipes/generate/ai/stream", json={"ingredients": ["たまねぎ", "豚肉"], "servings": 3})
+    assert response.status_code == 200
+    events = _sse_events(response.text)
+    names = [event for event, _ in events]
+
+    assert names[0] == "title"
+    assert names.count("ingredient") == 3
+    assert names.count("instruction") == 4
+    assert names[-1] == "done"
+    done = events[-1][1]
+    assert done["recipe"]["servings"] == 3
+    assert api("GET", f"/api/v1/recipes/{done['id']}").json()["title"] == events[0][1]["title"]
+
+
+def test_stream_records_reported_usage_and_settles_the_estimate(api, fake_openai, monkeypatch):
+    settled = []
+    monkeypatch.setattr(rate_limit_scheduler, "settle", lambda cost, used: settled.append((cost, used)))
+    before = LLM_TOKENS._values.get(("recipe_stream", "completion"), 0.0)
+
+    api("POST", "/api/v1/recipes/generate/ai/stream", json={"ingredients": ["たまねぎ"], "servings": 2})
+
+    # bench.fake_openai は3文字を1トークンとして最後のチャンクでusageを返す
+    assert len(settled) == 1
+    cost, used = settled[0]
+    recorded = LLM_TOKENS._values[("recipe_stream", "completion")] - before
+    assert 0 < recorded < used < cost
+
+
+def test_stream_is_accounted_when_the_reader_stops_early(fake_openai, monkeypatch):
+    settled = []
+    monkeypatch.setattr(rate_limit_scheduler, "settle", lambda cost, used: settled.append((cost, used)))
+
+    async def read_first_chunk():
+        chunks = openai_service.get_async_openai_service().stream_recipe(["たまねぎ"], 2, use_cache=False)
+        async for _ in chunks:
+            break
+        await chunks.aclose()
+
+    asyncio.run(read_first_chunk())
+    assert len(settled) == 1
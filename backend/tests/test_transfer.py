@@ -0,0 +1,115 @@
+import gzip
+import orjson
+from app.crud.recipe import create_recipe, delete_recipe, get_recipes
+from app.crud import transfer
+from app.crud.transfer import iter_export_chunks, gzip_chunks, LineBuffer, RecipeImporter, recipe_fingerprint
+from conftest import make_recipe
+
+INGREDIENTS = [
+    {"name": "にんじん", "amount": "1/2", "unit": "本", "calories": 15.0},
+    # 分量・単位のない食材（適量など）
+    {"name": "塩", "amount": None, "unit": None},
+]
+
+
+def _export(db) -> bytes:
+    return b"".join(iter_export_chunks(db, batch_size=2))
+
+
+def _without_ids(recipes):
+    return [
+        dict(recipe, id=None, ingredients=[dict(i, id=None) for i in recipe["ingredients"]])
+        for recipe in recipes
+    ]
+
+
+def test_export_and_import_round_trip(db):
+    for title in ("カレー", "肉じゃが", "味噌汁"):
+        create_recipe(db, make_recipe(title, INGREDIENTS))
+    original = get_recipes(db)
+    exported = _export(db)
+    assert len(exported.splitlines()) == 3
+
+    for recipe in original:
+        delete_recipe(db, recipe["id"])
+    importer = RecipeImporter(db)
+    importer.import_lines(exported.splitlines())
+
+    assert importer.stats() == {"imported": 3, "duplicates": 0, "failed": 0, "errors": [], "committed_line": 3}
+    assert _without_ids(get_recipes(db)) == _without_ids(original)
+
+
+def test_import_skips_duplicates_in_input_and_database(db):
+    create_recipe(db, make_recipe("カレー", INGREDIENTS))
+    lines = [
+        orjson.dumps(make_recipe("カレー", INGREDIENTS, instructions="1.  作る").dict()),  # 空白の違いだけの重複
+        orjson.dumps(make_recipe("肉じゃが", INGREDIENTS).dict()),
+        orjson.dumps(make_recipe("肉じゃが", INGREDIENTS).dict()),
+    ]
+    importer = RecipeImporter(db)
+    importer.import_lines(lines)
+
+    assert importer.imported == 1
+    assert importer.duplicates == 2
+    assert [recipe["title"] for recipe in get_recipes(db)] == ["カレー", "肉じゃが"]
+
+
+def test_import_reports_invalid_lines(db):
+    importer = RecipeImporter(db)
+    importer.import_lines([
+        b"{not json", b"", orjson.dumps({"title": "材料なし"}), orjson.dumps(make_recipe("カレー", INGREDIENTS).dict())
+    ])
+
+    stats = importer.stats()
+    assert stats["imported"] == 1
+    assert stats["failed"] == 2
+    assert [error["line"] for error in stats["errors"]] == [1, 3]
+
+
+def test_gzip_export_is_split_into_lines_across_chunks(db):
+    create_recipe(db, make_recipe("カレー", INGREDIENTS))
+    create_recipe(db, make_recipe("肉じゃが", INGREDIENTS))
+    compressed = b"".join(gzip_chunks(iter_export_chunks(db)))
+    assert gzip.decompress(compressed) == _export(db)
+
+    buffer = LineBuffer(compressed=True)
+    lines = []
+    for i in range(0, len(compressed), 7):
+        lines.extend(buffer.feed(compressed[i:i + 7]))
+    lines.extend(buffer.close())
+    assert [orjson.loads(line)["title"] for line in lines if line] == ["カレー", "肉じゃが"]
+
+
+def test_recipe_fingerprint_ignores_whitespace():
+    assert recipe_fingerprint("カレー", None, "切る  炒める") == recipe_fingerprint("カレー ", "", "切る\n炒める")
+    assert recipe_fingerprint("カレー", None, "切る") != recipe_fingerprint("カレー", None, "煮る")
+
+
+def test_failed_import_reports_how_far_it_got_and_can_be_resent(api, db, monkeypatch):
+    lines = [orjson.dumps(make_recipe(title, INGREDIENTS).dict()) + b"\n" for title in ("カレー", "肉じゃが", "味噌汁")]
+    insert_recipes = transfer._insert_recipes
+    calls = []
+
+    def failing_third_batch(db, recipes, created_at):
+        calls.append(len(recipes))
+        if len(calls) == 3:
+            raise RuntimeError("書き込みに失敗しました")
+        return insert_recipes(db, recipes, created_at)
+
+    async def body():
+        for line in lines:
+            yield line
+
+    monkeypatch.setattr("app.api.recipes.IMPORT_BATCH_SIZE", 1)
+    monkeypatch.setattr(transfer, "_insert_recipes", failing_third_batch)
+    response = api("POST", "/api/v1/recipes/import", content=body())
+    assert response.status_code == 500
+    detail = response.json()["detail"]
+    assert (detail["imported"], detail["committed_line"]) == (2, 2)
+    assert detail["message"] == "書き込みに失敗しました"
+    assert [recipe["title"] for recipe in get_recipes(db)] == ["カレー", "肉じゃが"]
+
+    # 登録済みの行は重複として飛ばすため、同じ本文を送り直せる
+    monkeypatch.setattr(transfer, "_insert_recipes", insert_recipes)
+    stats = api("POST", "/api/v1/recipes/import", content=b"".join(lines)).json()
+    assert (stats["imported"], stats["duplicates"], stats["committed_line"]) == (1, 2, 4)
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from app.api import recipes as recipes_api
+from app.services import openai_service
+from app.services.variation_cache import VariationCache, variation_cache
+
+REQUEST = {"ingredients": ["たまねぎ", "豚肉"], "servings": 2}
+
+
+def test_variation_cache_evicts_least_recently_used():
+    cache = VariationCache(max_size=2)
+    cache.set(1, [{"title": "a"}])
+    cache.set(2, [{"title": "b"}])
+    assert cache.get(1) == [{"title": "a"}]
+    cache.set(3, [{"title": "c"}])
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+    cache.invalidate(1)
+    cache.invalidate(99)
+    assert cache.get(1) is None
+
+
+def test_generate_returns_variations_with_the_saved_recipe(api, fake_openai):
+    body = api("POST", "/api/v1/recipes/generate/ai", json=REQUEST).json()
+
+    assert len(body["variations"]) == 3
+    assert all("amount" not in i for v in body["variations"] for i in v["ingredients"])
+    assert variation_cache.get(body["recipe"]["id"]) == body["variations"]
+
+
+def test_variation_failure_still_returns_the_saved_recipe(api, fake_openai, monkeypatch, caplog):
+    async def fail(recipe, priority=0):
+        raise Exception("バリエーションの生成中にエラーが発生しました")
+
+    service = openai_service.get_async_openai_service()
+    generate = service.get_recipe_variations
+    monkeypatch.setattr(service, "get_recipe_variations", fail)
+    with caplog.at_level(logging.WARNING, logger="app.api.recipes"):
+        response = api("POST", "/api/v1/recipes/generate/ai", json=REQUEST)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["variations"] is None
+    recipe_id = body["recipe"]["id"]
+    assert api("GET", f"/api/v1/recipes/{recipe_id}").status_code == 200
+    assert variation_cache.get(recipe_id) is None
+    # 失敗は例外の内容とともにログに残す
+    [record] = caplog.records
+    assert f"レシピID {recipe_id}" in record.getMessage()
+    assert "バリエーションの生成中にエラーが発生しました" in str(record.exc_info[1])
+
+    # 類似レシピを再利用する場合の取得でも失敗をログに残す
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="app.api.recipes"):
+        assert asyncio.run(recipes_api._get_variations(recipe_id, body["recipe"])) is None
+    assert len(caplog.records) == 1
+
+    # 後から GET /recipes/{id}/variations で生成できる
+    monkeypatch.setattr(service, "get_recipe_variations", generate)
+    assert len(api("GET", f"/api/v1/recipes/{recipe_id}/variations").json()) == 3
+
+
+def test_deferred_variations_are_generated_once_on_first_read(api, fake_openai, monkeypatch):
+    body = api("POST", "/api/v1/recipes/generate/ai", json=dict(REQUEST, include_variations=False)).json()
+    assert body["variations"] is None
+    recipe_id = body["recipe"]["id"]
+
+    service = openai_service.get_async_openai_service()
+    calls = []
+    generate = service.get_recipe_variations
+
+    async def counting(recipe, priority=0):
+        calls.append(recipe["id"])
+        return await generate(recipe, priority)
+
+    monkeypatch.setattr(service, "get_recipe_variations", counting)
+    first = api("GET", f"/api/v1/recipes/{recipe_id}/variations").json()
+    assert api("GET", f"/api/v1/recipes/{recipe_id}/variations").json() == first
+    assert calls == [recipe_id]
+    assert api("GET", "/api/v1/recipes/999/variations").status_code == 404
+
+
+def test_updating_a_recipe_invalidates_its_variations(api, fake_openai):
+    body = api("POST", "/api/v1/recipes/generate/ai", json=REQUEST).json()
+    recipe = body["recipe"]
+    update = {k: recipe[k] for k in ("title", "description", "instructions", "difficulty", "cooking_time", "servings")}
+    update["ingredients"] = [{"name": "卵", "amount": "2", "unit": "個"}]
+
+    assert api("PUT", f"/api/v1/recipes/{recipe['id']}", json=update).status_code == 200
+    assert variation_cache.get(recipe["id"]) is None
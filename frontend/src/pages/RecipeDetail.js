@@ -11,13 +11,14 @@ import {
   Button,
   Box,
 } from '@mui/material';
-import { getRecipe } from '../utils/api';
+import { getRecipe, getImageUrl, getImageSrcSet, uploadRecipeImage } from '../utils/api';
 import { deleteRecipe } from '../api/recipe';
 
 function RecipeDetail() {
   const { id } = useParams();
   const navigate = useNavigate();
   const [recipe, setRecipe] = useState(null);
+  const [uploading, setUploading] = useState(false);
 
   useEffect(() => {
     const fetchRecipe = async () => {
@@ -42,6 +43,21 @@ function RecipeDetail() {
     }
   };
 
+  const handleImageChange = async (event) => {
+    const file = event.target.files[0];
+    if (!file) return;
+    setUploading(true);
+    try {
+      const result = await uploadRecipeImage(recipe.id, file);
+      setRecipe((prev) => ({ ...prev, image_url: result.image_url }));
+    } catch (e) {
+      alert('画像のアップロードに失敗しました');
+    } finally {
+      setUploading(false);
+      event.target.value = '';
+    }
+  };
+
   if (!recipe) {
     return <Typography>Loading...</Typography>;
   }
@@ -56,7 +72,9 @@ function RecipeDetail() {
         {recipe.image_url && (
           <Box sx={{ mb: 3 }}>
             <img
-              src={recipe.image_url}
+              src={getImageUrl(recipe.image_url, 'lg')}
+              srcSet={getImageSrcSet(recipe.image_url)}
+              sizes="(max-width: 900px) 100vw, 900px"
               alt={recipe.title}
               style={{ width: '100%', maxHeight: '400px', objectFit: 'cover' }}
             />
@@ -114,6 +132,11 @@ function RecipeDetail() {
             一覧に戻る
           </Button>
 
+          <Button variant="outlined" component="label" disabled={uploading}>
+            {uploading ? 'アップロード中...' : '画像を設定'}
+            <input type="file" accept="image/*" hidden onChange={handleImageChange} />
+          </Button>
+
           <Button color="error" variant="contained" onClick={handleDelete}>
             削除
           </Button>
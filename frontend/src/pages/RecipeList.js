@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { Container, Grid, Card, CardContent, CardMedia, Typography, Button, Box, TextField } from '@mui/material';
 import { Link as RouterLink } from 'react-router-dom';
-import { getRecipes } from '../utils/api';
+import { getRecipes, getImageUrl, getImageSrcSet } from '../utils/api';
 
 function RecipeList() {
   const [recipes, setRecipes] = useState([]);
@@ -61,8 +61,12 @@ function RecipeList() {
                 <CardMedia
                   component="img"
                   height="200"
-                  image={recipe.image_url}
+                  image={getImageUrl(recipe.image_url, 'sm')}
+                  srcSet={getImageSrcSet(recipe.image_url)}
+                  sizes="(max-width: 600px) 100vw, (max-width: 900px) 50vw, 400px"
+                  loading="lazy"
                   alt={recipe.title}
+                  sx={{ objectFit: 'cover' }}
                 />
               )}
               <CardContent sx={{ flexGrow: 1, display: 'flex', flexDirection: 'column', justifyContent: 'space-between' }}>
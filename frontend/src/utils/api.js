@@ -1,6 +1,26 @@
 import axios from 'axios';
 
 const API_BASE_URL = 'http://localhost:8000/api/v1';
+const API_ORIGIN = new URL(API_BASE_URL).origin;
+const IMAGE_PATH_PREFIX = '/api/v1/images/';
+const IMAGE_WIDTHS = { sm: 320, md: 640, lg: 1280 };
+
+const isUploadedImage = (imageUrl) => Boolean(imageUrl) && imageUrl.startsWith(IMAGE_PATH_PREFIX);
+
+// アップロードした画像は指定したサイズのサムネイル（WebP/JPEGはサーバーが選ぶ）のURLにする
+// それ以外のURLはそのまま使う
+export const getImageUrl = (imageUrl, size = 'lg') => {
+  if (!isUploadedImage(imageUrl)) return imageUrl;
+  return `${API_ORIGIN}${imageUrl}?size=${size}`;
+};
+
+// 表示幅に合ったサムネイルをブラウザに選ばせるためのsrcset
+export const getImageSrcSet = (imageUrl) => {
+  if (!isUploadedImage(imageUrl)) return undefined;
+  return Object.entries(IMAGE_WIDTHS)
+    .map(([size, width]) => `${getImageUrl(imageUrl, size)} ${width}w`)
+    .join(', ');
+};
 
 // レシピ一覧の取得
 export const getRecipes = async () => {
@@ -55,4 +75,17 @@ export const deleteRecipe = async (id) => {
     console.error('Error deleting recipe:', error);
     throw error;
   }
-}; 
\ No newline at end of file
+}; 
+
+// レシピの画像のアップロード
+export const uploadRecipeImage = async (id, file) => {
+  try {
+    const formData = new FormData();
+    formData.append('file', file);
+    const response = await axios.post(`${API_BASE_URL}/recipes/${id}/image`, formData);
+    return response.data;
+  } catch (error) {
+    console.error('Error uploading recipe image:', error);
+    throw error;
+  }
+};